@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""高德 Web 服务 API 的 HTTP 会话工厂：keep-alive 连接池 + 可选磁盘缓存（需 requests-cache）。
+geo.py 与 geo_search.py 共用，调用方自行决定缓存文件位置并按需（首次请求时）创建会话。"""
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import requests_cache
+except ImportError:
+    requests_cache = None
+
+HTTP_CACHE_TTL_S = 30 * 86400  # 磁盘缓存有效期（秒）
+
+
+def _cacheable(response):
+    """只缓存 status=1 的成功响应，配额超限等错误响应不落盘。"""
+    try:
+        return response.json().get("status") == "1"
+    except Exception:
+        return False
+
+
+class _PacedAdapter(HTTPAdapter):
+    """真正发出网络请求前先经过限速器；命中 requests-cache 的响应不会走到这里，因此不占 QPS。"""
+
+    def __init__(self, limiter=None, **kwargs):
+        self._limiter = limiter
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        if self._limiter is not None:
+            self._limiter()
+        return super().send(request, **kwargs)
+
+
+def make_session(cache_path=None, limiter=None):
+    """创建高德请求会话。cache_path 非空且已安装 requests-cache 时为磁盘持久缓存会话，
+    跨进程/跨次运行复用已解析地址的响应；否则为普通 keep-alive 会话。
+    limiter 为无参可调用对象（如 geo_search._Limiter 实例），每次实际发请求前调用一次。"""
+    if cache_path is not None and requests_cache is not None:
+        session = requests_cache.CachedSession(
+            str(cache_path),
+            expire_after=HTTP_CACHE_TTL_S,
+            allowable_codes=(200,),
+            filter_fn=_cacheable,
+        )
+    else:
+        session = requests.Session()
+    session.headers.update({"Connection": "keep-alive"})
+    session.mount("https://", _PacedAdapter(limiter, pool_connections=16, pool_maxsize=16))
+    return session
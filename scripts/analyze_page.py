@@ -19,105 +19,85 @@ except ImportError:
     print("请先安装: pip install playwright && playwright install chromium")
     raise
 
-import config
-
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
-async def analyze():
+import config
+from crawler import block_resources, launch_options, smart_wait
+
+
+# 页面结构采集脚本：各字段截断长度用于控制序列化回传的 JSON 大小
+_PAGE_STRUCTURE_JS = """() => {
+    const links = Array.from(document.querySelectorAll('a[href]')).map(a => ({
+        text: (a.textContent || '').trim().slice(0, 100),
+        href: a.getAttribute('href'),
+        id: a.id || null,
+        className: a.className || null
+    }));
+    const buttons = Array.from(document.querySelectorAll('button, [onclick], input[type="submit"], [role="button"]')).map(el => ({
+        tag: el.tagName,
+        text: (el.textContent || el.value || '').trim().slice(0, 100),
+        onclick: el.getAttribute('onclick') || null,
+        id: el.id || null,
+        className: el.className || null
+    }));
+    const tables = Array.from(document.querySelectorAll('table')).map((t, i) => {
+        const rows = t.querySelectorAll('tr');
+        const firstRow = rows[0] ? Array.from(rows[0].querySelectorAll('th, td')).map(c => c.textContent.trim().slice(0, 50)) : [];
+        return { index: i, rowCount: rows.length, firstRowCells: firstRow };
+    });
+    const iframes = Array.from(document.querySelectorAll('iframe')).map((f, i) => ({ index: i, src: f.getAttribute('src'), id: f.id || null }));
+    return {
+        links: links,
+        buttons: buttons,
+        tables: tables,
+        iframes: iframes,
+        body_text_sample: (document.body && document.body.innerText || '').slice(0, 500)
+    };
+}"""
+
+ANALYZE_CONCURRENCY = 10  # 多 URL 同时分析的上限
+
+
+async def _analyze_url(browser, url, sem):
+    """在独立 context 中分析单个 URL，返回结构结果 dict；context 用完即关，browser 由调用方共用。
+    单个 URL 的任何异常（含创建 context 失败）都记录在结果的 error 中，不影响其他 URL。"""
     result = {
-        "url": config.BASE_URL,
+        "url": url,
         "links": [],
         "buttons": [],
         "tables": [],
         "iframes": [],
         "raw_html_summary": None,
     }
-    async with async_playwright() as p:
-        launch_opts = {"headless": config.HEADLESS}
-        if getattr(config, "CHROMIUM_EXECUTABLE_PATH", None):
-            launch_opts["executable_path"] = config.CHROMIUM_EXECUTABLE_PATH
-        browser = await p.chromium.launch(**launch_opts)
-        context = await browser.new_context(
-            ignore_https_errors=config.IGNORE_HTTPS_ERRORS,
-            viewport={"width": 1280, "height": 800},
-            user_agent=getattr(config, "USER_AGENT", None) or None,
-            extra_http_headers=getattr(config, "EXTRA_HTTP_HEADERS", None) or {},
-        )
-        page = await context.new_page()
-        page.set_default_timeout(config.TIMEOUT_MS)
-
+    async with sem:
+        context = None
         try:
-            resp = await page.goto(config.BASE_URL, wait_until="domcontentloaded")
+            context = await browser.new_context(
+                ignore_https_errors=config.IGNORE_HTTPS_ERRORS,
+                viewport={"width": 1280, "height": 800},
+                user_agent=getattr(config, "USER_AGENT", None) or None,
+                extra_http_headers=dict(getattr(config, "EXTRA_HTTP_HEADERS", None) or {}),
+            )
+            await block_resources(context)
+            page = await context.new_page()
+            page.set_default_navigation_timeout(config.NAV_TIMEOUT_MS)
+            page.set_default_timeout(config.ACTION_TIMEOUT_MS)
+
+            resp = await page.goto(url, wait_until="domcontentloaded")
             if resp and resp.status >= 400:
-                result["error"] = f"HTTP {resp.status} at {config.BASE_URL}"
+                result["error"] = f"HTTP {resp.status} at {url}"
                 result["http_status"] = resp.status
-            if result.get("error"):
-                out_dir = Path(config.OUTPUT_DIR)
-                out_dir.mkdir(parents=True, exist_ok=True)
-                out_file = out_dir / "page_structure.json"
-                with open(out_file, "w", encoding="utf-8") as f:
-                    json.dump(result, f, ensure_ascii=False, indent=2)
-                print(f"页面加载失败，结果已保存到: {out_file}")
-                print(f"  错误: {result['error']}")
-                await browser.close()
                 return result
-            await asyncio.sleep(config.NAVIGATION_WAIT_MS / 1000.0)
-
-            # 收集所有链接
-            links = await page.evaluate(
-                """() => {
-                const as = Array.from(document.querySelectorAll('a[href]'));
-                return as.map(a => ({
-                    text: (a.textContent || '').trim().slice(0, 100),
-                    href: a.getAttribute('href'),
-                    id: a.id || null,
-                    className: a.className || null
-                }));
-            }"""
-            )
-            result["links"] = links
-
-            # 收集所有按钮及可点击元素
-            buttons = await page.evaluate(
-                """() => {
-                const els = Array.from(document.querySelectorAll('button, [onclick], input[type="submit"], [role="button"]'));
-                return els.map(el => ({
-                    tag: el.tagName,
-                    text: (el.textContent || el.value || '').trim().slice(0, 100),
-                    onclick: el.getAttribute('onclick') || null,
-                    id: el.id || null,
-                    className: el.className || null
-                }));
-            }"""
-            )
-            result["buttons"] = buttons
-
-            # 收集表格数量与表头摘要
-            tables = await page.evaluate(
-                """() => {
-                const tables = Array.from(document.querySelectorAll('table'));
-                return tables.map((t, i) => {
-                    const rows = t.querySelectorAll('tr');
-                    const firstRow = rows[0] ? Array.from(rows[0].querySelectorAll('th, td')).map(c => c.textContent.trim().slice(0, 50)) : [];
-                    return { index: i, rowCount: rows.length, firstRowCells: firstRow };
-                });
-            }"""
-            )
-            result["tables"] = tables
-
-            # iframe
-            iframes = await page.evaluate(
-                """() => {
-                const ifs = Array.from(document.querySelectorAll('iframe'));
-                return ifs.map((f, i) => ({ index: i, src: f.getAttribute('src'), id: f.id || null }));
-            }"""
-            )
-            result["iframes"] = iframes
+            await smart_wait(page, max_ms=config.NAVIGATION_WAIT_MAX_MS)
 
-            # 页面标题与部分 body 文本（便于确认是否为主页）
+            # 链接、按钮、表格、iframe 与 body 文本摘要一次 evaluate 取回（单次 CDP 往返）
+            payload = await page.evaluate(_PAGE_STRUCTURE_JS)
+            result.update(payload)
+            # 页面标题（便于确认是否为主页）
             result["title"] = await page.title()
-            result["body_text_sample"] = await page.evaluate(
-                """() => (document.body && document.body.innerText || '').slice(0, 500)"""
-            )
 
         except Exception as e:
             result["error"] = str(e)
@@ -126,17 +106,40 @@ async def analyze():
                     "ERR_EMPTY_RESPONSE 通常表示当前网络无法访问该地址、或服务器对请求返回空。"
                     "可尝试：在能正常打开该页面的本机/网络下运行；或检查防火墙/代理。"
                 )
+        finally:
+            if context is not None:
+                await context.close()
+    return result
+
+
+async def analyze(urls=None):
+    """分析页面结构并写入 page_structure.json。
+    urls 为空时只分析 config.BASE_URL，结果为 dict；传入 urls 时结果恒为 list（与 urls 顺序一致）。
+    多个 URL 共用一次启动的 Chromium，每个 URL 使用独立的 BrowserContext。"""
+    url_list = list(urls) if urls else [config.BASE_URL]
+    sem = asyncio.Semaphore(ANALYZE_CONCURRENCY)
+    async with async_playwright() as p:
+        browser = await p.chromium.launch(**launch_options())
+        try:
+            results = await asyncio.gather(*[_analyze_url(browser, u, sem) for u in url_list])
         finally:
             await browser.close()
 
-    out_dir = Path(config.OUTPUT_DIR)
+    result = list(results) if urls else results[0]
+    out_dir = config.OUTPUT_DIR
     out_dir.mkdir(parents=True, exist_ok=True)
     out_file = out_dir / "page_structure.json"
-    with open(out_file, "w", encoding="utf-8") as f:
-        json.dump(result, f, ensure_ascii=False, indent=2)
+    if orjson is not None:
+        out_file.write_bytes(orjson.dumps(result, option=orjson.OPT_INDENT_2))
+    else:
+        with open(out_file, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
     print(f"页面结构已保存到: {out_file}")
-    if result.get("hint"):
-        print(f"  说明: {result['hint']}")
+    for r in results:
+        if r.get("http_status"):
+            print(f"  页面加载失败: {r['error']}")
+        if r.get("hint"):
+            print(f"  说明: {r['hint']}")
     return result
 
 
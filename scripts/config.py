@@ -1,36 +1,126 @@
 # -*- coding: utf-8 -*-
 """抓取配置：URL、超时、选择器。站点改版时只需修改此处。"""
-import glob
+import functools
+import logging
 import os
+import random
 from pathlib import Path
+from types import MappingProxyType
 
 # 项目根目录（本文件在 scripts/ 下，parent.parent = 根目录），输出目录固定为根目录/output
 _PROJECT_ROOT = Path(__file__).resolve().parent.parent
-OUTPUT_DIR = str(_PROJECT_ROOT / "output")
+OUTPUT_DIR = _PROJECT_ROOT / "output"  # Path；各写出函数在写文件前自行 mkdir
+OUTPUT_DIR_STR = str(OUTPUT_DIR)  # 需要字符串路径的旧调用方使用
+
+_TRUE_VALUES = frozenset({"1", "true", "yes", "on"})
+
+
+def _env(name, default, cast=str):
+    """读取环境变量并按 cast 转换；未设置或为空时返回 default。转换失败时 import 即报错，指明变量名。"""
+    v = os.environ.get(name)
+    if v is None or v.strip() == "":
+        return default
+    try:
+        return cast(v.strip())
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"环境变量 {name}={v!r} 无法转换为 {getattr(cast, '__name__', cast)}") from e
+
+
+def _env_bool(name, default=False):
+    """布尔环境变量：1/true/yes/on（不区分大小写）为 True，其余为 False；未设置时返回 default。"""
+    v = os.environ.get(name)
+    if v is None or v.strip() == "":
+        return default
+    return v.strip().lower() in _TRUE_VALUES
+
 
 # 目标站点
 BASE_URL = "https://szzdjc.cnemc.cn:8070/GJZ/Business/Publish/Main.html"
 
 
+@functools.lru_cache(maxsize=1)
 def _find_full_chromium():
     """查找 Playwright 缓存的完整 Chromium（chrome-linux64/chrome），
     用于替代 headless shell，避免缺少 libatk 等依赖。
+    存在多个版本时取修改时间最新的一个；结果缓存，进程内只扫描一次缓存目录。
     """
-    cache = os.environ.get("PLAYWRIGHT_BROWSERS_PATH") or str(Path.home() / ".cache" / "ms-playwright")
-    pattern = os.path.join(cache, "chromium-*", "chrome-linux64", "chrome")
-    hits = glob.glob(pattern)
-    return hits[0] if hits else None
+    cache = _env("PLAYWRIGHT_BROWSERS_PATH", str(Path.home() / ".cache" / "ms-playwright"))
+    candidates = []
+    try:
+        with os.scandir(cache) as it:
+            for entry in it:
+                if not entry.name.startswith("chromium-") or not entry.is_dir():
+                    continue
+                exe = os.path.join(entry.path, "chrome-linux64", "chrome")
+                if os.path.isfile(exe) and os.access(exe, os.X_OK):
+                    candidates.append((entry.stat().st_mtime, exe))
+    except (FileNotFoundError, NotADirectoryError, PermissionError):
+        return None
+    if not candidates:
+        return None
+    return max(candidates)[1]
+
+
+@functools.lru_cache(maxsize=None)
+def _checked_executable(path):
+    """path 不存在或不可执行时记一次 WARNING 并返回 None（交给 Playwright 使用自带浏览器），
+    而不是等到 launch 时才失败。"""
+    if os.path.isfile(path) and os.access(path, os.X_OK):
+        return path
+    logging.getLogger(__name__).warning(
+        "WATER_CRAWLER_CHROMIUM_PATH=%s 不存在或不可执行，改用 Playwright 自带的 Chromium", path
+    )
+    return None
+
+
+def __getattr__(name):
+    # CHROMIUM_EXECUTABLE_PATH 延迟到首次访问时才计算（import 本模块不扫描目录）
+    # 使用完整 Chromium 可执行文件（避免 headless shell 的 libatk 依赖）；None 表示使用默认
+    if name == "CHROMIUM_EXECUTABLE_PATH":
+        path = _env("WATER_CRAWLER_CHROMIUM_PATH", None)
+        if path:
+            return _checked_executable(path)
+        return _find_full_chromium()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
-# 使用完整 Chromium 可执行文件（避免 headless shell 的 libatk 依赖）；None 表示使用默认
-CHROMIUM_EXECUTABLE_PATH = os.environ.get("WATER_CRAWLER_CHROMIUM_PATH") or _find_full_chromium()
 BASE_DOMAIN = "https://szzdjc.cnemc.cn:8070"
 
 # 浏览器与超时
 HEADLESS = True  # 设为 False 可看到浏览器窗口，便于调试
-TIMEOUT_MS = 30000  # 页面加载超时（毫秒）
-CLICK_WAIT_MS = 2000  # 点击后等待内容加载（毫秒）
-NAVIGATION_WAIT_MS = 3000  # 导航后额外等待（毫秒）
+# Chromium 启动参数：关闭 GPU、后台网络、扩展等，减少启动时间与辅助进程（保留沙箱；容器内以 root 运行需要时自行追加 --no-sandbox）
+CHROMIUM_LAUNCH_ARGS = (
+    "--disable-gpu",
+    "--disable-dev-shm-usage",
+    "--disable-background-networking",
+    "--disable-extensions",
+    "--disable-features=TranslateUI",
+    "--mute-audio",
+)
+# 在 BrowserContext 上直接 abort 的资源类型（只抓数据，无需下载）；不含 stylesheet：下拉菜单的显隐依赖 CSS，
+# 屏蔽样式会让可见性判断失效。设为空集合可关闭拦截（开启路由拦截时 Playwright 不使用 HTTP 缓存）
+CHROMIUM_BLOCK_RESOURCE_TYPES = frozenset({"image", "font", "media"})
+# URL 命中该正则的请求（统计/埋点脚本）同样直接 abort；设为 None 关闭
+CHROMIUM_BLOCK_URL_PATTERN = r"google-analytics|googletagmanager|baidu\.com/stats|hm\.baidu\.com"
+# 子链接页面（_crawl_links，只取表格与正文）额外 abort 的资源类型：这些页面不操作下拉菜单，样式表可以不下载。
+# 代价是正文兜底（innerText）可能包含原本被样式表隐藏的文字；设为空集合关闭
+LINK_BLOCK_RESOURCE_TYPES = frozenset({"stylesheet"})
+# 持久化 profile 目录：非空时用 launch_persistent_context，HTTP 磁盘缓存跨运行保留（主页脚本、RealDatas.html 等不再重复下载）。
+# 此时所有省份 worker 共用这一个 context（各开一页），且不做路由拦截（路由拦截会关闭 HTTP 缓存），图片改由启动参数关闭；
+# 同一目录同时只能被一个进程使用，分片并行时各进程需用不同目录
+BROWSER_PROFILE_DIR = _env("WATER_CRAWLER_PROFILE", "")
+BROWSER_DISK_CACHE_BYTES = 100 * 1024 * 1024
+# 按操作类型分开的超时预算（毫秒），失败时尽快报错而不是统一空等 30 秒；均可用环境变量覆盖
+NAV_TIMEOUT_MS = _env("WATER_CRAWLER_NAV_TIMEOUT_MS", 15000, int)  # 页面导航（goto/刷新）
+ACTION_TIMEOUT_MS = _env("WATER_CRAWLER_ACTION_TIMEOUT_MS", 5000, int)  # 点击/悬停等操作的默认超时
+SELECTOR_TIMEOUT_MS = _env("WATER_CRAWLER_SELECTOR_TIMEOUT_MS", 2000, int)  # 试探性查找（可能不存在的元素）
+TIMEOUT_MS = NAV_TIMEOUT_MS  # 兼容旧名，后续版本移除
+# 等待策略：event=优先等待事件（元素出现 / 网络空闲），下列 *_MAX_MS 只作为上限；fixed=按 *_MAX_MS 固定 sleep（旧行为）
+WAIT_STRATEGY = _env("WATER_CRAWLER_WAIT", "event", str.lower)  # "event" | "fixed"
+if WAIT_STRATEGY not in ("event", "fixed"):
+    raise ValueError(f"WATER_CRAWLER_WAIT 只能为 event 或 fixed，当前为 {WAIT_STRATEGY!r}")
+CLICK_WAIT_MAX_MS = 2000  # 点击/打开子页面后等待内容加载的上限（毫秒）
+NAVIGATION_WAIT_MAX_MS = 3000  # 导航后等待的上限（毫秒）
 
 # 是否忽略 HTTPS 证书错误（内网或自签名证书时使用）
 IGNORE_HTTPS_ERRORS = True
@@ -40,14 +130,18 @@ USER_AGENT = (
     "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) "
     "Chrome/120.0.0.0 Safari/537.36"
 )
-EXTRA_HTTP_HEADERS = {
+# 只读的一份请求头（含 UA 与压缩协商），浏览器上下文与 context.request 快速通道共用；
+# 传给 Playwright 时需 dict(...) 拷贝
+EXTRA_HTTP_HEADERS = MappingProxyType({
     "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8",
     "Accept-Language": "zh-CN,zh;q=0.9,en;q=0.8",
-}
+    "Accept-Encoding": "br, gzip, deflate",
+    "User-Agent": USER_AGENT,
+})
 
 # 可点击入口：用于优先点击的文本或部分匹配（如菜单名）
 # 脚本会同时自动发现页面上的链接与按钮，此处仅作补充
-PRIORITY_LINK_TEXTS = ["实时数据", "发布说明", "数据", "说明"]
+PRIORITY_LINK_TEXTS = ("实时数据", "发布说明", "数据", "说明")  # 按顺序依次尝试点击
 
 # 表格与列表选择器（若站点使用固定 class/id，可在此指定，否则由脚本自动识别 table）
 TABLE_SELECTOR = "table"
@@ -57,26 +151,82 @@ LIST_CONTAINER_SELECTOR = ""  # 例如 ".list-container"，空则不用
 PAGINATION_SELECTOR = ""  # 例如 ".pagination a"，空则脚本会尝试查找“下一页”等
 
 # 数据 iframe（主数据在 RealDatas.html 内）
-IFRAME_WAIT_MS = 8000  # 主页面加载后等待 iframe 及 AJAX 数据的时间（毫秒）
+IFRAME_WAIT_MAX_MS = 8000  # 主页面加载后等待 iframe 及 AJAX 数据的时间上限（毫秒）
 DATA_IFRAME_ID = "MF"  # 数据 iframe 的 id
 DATA_IFRAME_SRC_CONTAINS = "RealDatas"  # 用于匹配 iframe src，定位数据 frame
+# 上面两种定位方式合成一个 CSS 选择器，crawler 一次查询即可拿到数据 iframe
+FRAME_LOCATOR = f'iframe#{DATA_IFRAME_ID}, iframe[src*="{DATA_IFRAME_SRC_CONTAINS}"]'
 # iframe 内优先点击的 Tab/链接文本（点击后重新提取表格）
-IFRAME_TAB_TEXTS = ["发布说明", "实时数据"]
+IFRAME_TAB_TEXTS = ("发布说明", "实时数据")
 # 区域选择：先选区域再抓取，才能拿到多行数据
-REGION_SELECT_LABELS = ["选择区域", "区域"]  # 用于定位区域下拉/按钮的文本
+REGION_SELECT_LABELS = ("选择区域", "区域")  # 用于定位区域下拉/按钮的文本
 REGION_OPTION = "全国"  # test 模式下默认选择的区域
 # 自定义下拉（与 Main/RealDatas 一致）：区域由 button#ddm_Area 打开，一级为 a.area-item，二级在 li.dropdown-submenu 内
 REGION_TRIGGER_SELECTOR = "button#ddm_Area"  # 区域下拉触发按钮
 REGION_LEVEL1_OPTION_SELECTOR = "ul.dropdown-menu[aria-labelledby='ddm_Area'] > li > a.area-item"  # 一级：全国 + 各省
 REGION_DROPDOWN_OPTION_SELECTOR = "a.area-item"  # 下拉项（兼容旧逻辑，优先用 LEVEL1）
-REGION_WAIT_MS = 6000  # 选择区域后等待表格开始刷新的时间（毫秒）
-TABLE_LOAD_WAIT_MS = 10000  # 等待表格数据加载完成的最长时间（毫秒），再抓取
+REGION_LEVEL2_OPTION_SELECTOR = "ul.dropdown-menu[aria-labelledby='ddm_Area'] li.dropdown-submenu ul.dropdown-menu li a"  # 二级：省下的市
+LOAD_PROMPT_SELECTOR = "#loadPrompt"  # iframe 内数据加载中的提示层
+REGION_WAIT_MAX_MS = 6000  # 选择区域后等待表格开始刷新的时间上限（毫秒）
+TABLE_LOAD_WAIT_MAX_MS = 10000  # 等待表格数据加载完成的最长时间（毫秒），再抓取
 RANDOM_WAIT_MAX_MS = 5000  # 相邻操作间随机等待上限（毫秒），防反爬
+# 是否在相邻操作间加随机等待（防反爬）；目标站点未见反爬时默认关闭，只保留 PROD_INTERVAL_MS 固定间隔
+ANTI_BOT_DELAY_ENABLED = _env_bool("WATER_CRAWLER_ANTI_BOT")
+# 随机等待改为截断指数分布：均值约 WAIT_BASE_MS / WAIT_LAMBDA，重试时按 2**attempt 放大，上限 WAIT_CAP_MS
+WAIT_BASE_MS = 200
+WAIT_CAP_MS = RANDOM_WAIT_MAX_MS
+WAIT_LAMBDA = 0.5
+
+
+def next_wait_ms(attempt=0):
+    """返回下一次随机等待的毫秒数（截断指数退避，attempt 为当前重试次数）。"""
+    base = WAIT_BASE_MS * (2 ** attempt)
+    return min(WAIT_CAP_MS, int(random.expovariate(WAIT_LAMBDA) * base))
+
+
 # 运行模式：test=仅抓「全国」；prod=按省/市逐个选择再抓（注意间隔防反爬）
-RUN_MODE = os.environ.get("WATER_CRAWLER_MODE", "test")  # "test" | "prod"
+RUN_MODE = _env("WATER_CRAWLER_MODE", "test", str.lower)  # "test" | "prod"
+if RUN_MODE not in ("test", "prod"):
+    raise ValueError(f"WATER_CRAWLER_MODE 只能为 test 或 prod，当前为 {RUN_MODE!r}")
 PROD_INTERVAL_MS = 5000  # prod 模式下每个区域之间基础间隔（毫秒），再加随机等待
 # prod 下只抓前 N 个一级地域，便于调试；None 或 0 表示不限制
-PROD_TOP_N = None  # 例如 3 表示只抓前 3 个一级（如 全国、北京、天津）
+PROD_TOP_N = _env("WATER_CRAWLER_TOP_N", None, int)  # 例如 3 表示只抓前 3 个一级（如 全国、北京、天津）
+# prod 分片：多个进程/主机各抓一部分省份（第 i 个分片取 省份列表[i::n]），各省份文件互不重叠，无需合并
+REGION_SHARD_INDEX = _env("WATER_CRAWLER_SHARD_I", 0, int)
+REGION_SHARD_COUNT = _env("WATER_CRAWLER_SHARD_N", 1, int)
+if not 0 <= REGION_SHARD_INDEX < REGION_SHARD_COUNT:
+    raise ValueError(
+        f"分片配置无效：需要 0 <= WATER_CRAWLER_SHARD_I < WATER_CRAWLER_SHARD_N，"
+        f"当前为 {REGION_SHARD_INDEX} / {REGION_SHARD_COUNT}"
+    )
+# prod 下每个省份抓完立即写出 water_info_<省份>.xlsx 并释放其行数据（内存只保留进行中的省份），False 则全部抓完后统一写出
+STREAMING_WRITE = _env_bool("WATER_CRAWLER_STREAMING_WRITE", True)
+# prod 下同时抓取的省份数（每个省份独立 BrowserContext），1 即逐个抓取；调大前注意站点限流
+PROD_CONCURRENCY = _env("WATER_CRAWLER_CONCURRENCY", 1, int)
+# 遍历同源子链接时同时打开的页面数（同一 BrowserContext 内的 worker 数）；1 即逐个访问
+LINK_CONCURRENCY = _env("WATER_CRAWLER_LINK_CONCURRENCY", 3, int)
+# 子链接先直接请求 HTML 解析表格（不开浏览器页面），静态 HTML 中没有有效表格时才用浏览器打开；
+# 表格由 JS 填充的页面静态 HTML 可能只有空模板，默认关闭
+STATIC_FETCH_LINKS = _env_bool("WATER_CRAWLER_STATIC", False)
+# prod 下同一 worker 处理下一个省份时直接在已加载的数据 iframe 里切换区域，不再整页重新加载（切换失败时自动重新打开主页）
+REUSE_FRAME_BETWEEN_PROVINCES = _env_bool("WATER_CRAWLER_REUSE_FRAME", True)
+# 共用一个浏览器进程时同时打开的省份 BrowserContext 上限（PROD_CONCURRENCY 再大也不超过此值，控制内存）
+MAX_BROWSER_CONTEXTS = _env("WATER_CRAWLER_MAX_CONTEXTS", 4, int)
+# prod 下对站点发起省份页面导航的全局速率上限（次/秒，所有并发共享）；0 表示不限
+PROD_PER_HOST_RPS = _env("WATER_CRAWLER_RPS", 0.2, float)
+# 磁盘缓存：prod 下从下拉框获取的省份列表在 TTL 内复用，重复运行时跳过打开下拉枚举（只缓存列表，不缓存实时数据）
+CACHE_DIR = str(_PROJECT_ROOT / ".cache")
+REGION_LIST_TTL_S = _env("WATER_CRAWLER_REGION_TTL_S", 86400, int)  # 0 表示不使用缓存
+# HTTP 快速通道（prod）：已知数据接口时直接请求 JSON，跳过浏览器渲染；请求失败或无数据的省份自动退回浏览器抓取
+USE_HTTP_FAST_PATH = _env_bool("WATER_CRAWLER_FAST")
+# 数据接口 URL 模板，{area} 替换为（URL 编码后的）省份名；可参考预热时记录的 ENDPOINTS_LOG_PATH 填写
+DATA_API_URL_TEMPLATE = _env("WATER_CRAWLER_API", "")
+# 模板含 {page}（从 1 开始的页码）时按页请求：每批并发的页数，以及最多请求的页数（防止接口忽略页码时无限翻页）
+DATA_API_PAGE_CONCURRENCY = _env("WATER_CRAWLER_API_PAGES", 4, int)
+DATA_API_MAX_PAGES = 200
+# 数据接口请求的全局速率上限（次/秒，所有省份与分页共享），与限制页面导航的 PROD_PER_HOST_RPS 分开；0 表示不限
+DATA_API_RPS = _env("WATER_CRAWLER_API_RPS", 5.0, float)
+ENDPOINTS_LOG_PATH = str(_PROJECT_ROOT / ".state" / "endpoints.json")  # 开启快速通道时记录预热观察到的同源 XHR/fetch 请求 URL
 # 单 sheet 汇总：所有 iframe 数据写入一个 sheet 时的名称及区域列名
 SINGLE_SHEET_NAME = "水质实时数据"
 REGION_COLUMN_1 = "一级区域"
@@ -87,4 +237,28 @@ MIN_TABLE_COLS = 2  # 至少列数
 
 # 输出
 OUTPUT_EXCEL = "water_info_data.xlsx"
-# OUTPUT_DIR 已在本文件顶部设为 项目根/output
+OUTPUT_EXCEL_PATH = OUTPUT_DIR / OUTPUT_EXCEL  # 单文件导出的默认路径（OUTPUT_DIR 已在本文件顶部设为 项目根/output）
+# 输出格式：xlsx（默认，便于直接打开）| parquet（列式 + 压缩，写出快、体积小，需 pyarrow）| both
+OUTPUT_FORMAT = _env("WATER_CRAWLER_FMT", "xlsx", str.lower)
+if OUTPUT_FORMAT not in ("xlsx", "parquet", "both"):
+    raise ValueError(f"WATER_CRAWLER_FMT 只能为 xlsx、parquet 或 both，当前为 {OUTPUT_FORMAT!r}")
+OUTPUT_PARQUET = "water_info_data.parquet"
+PARQUET_COMPRESSION = "zstd"
+
+# 抓取用到的全部 CSS 选择器，按用途命名的只读注册表（crawler 统一从这里取，站点改版只改上面的常量）
+SELECTORS = MappingProxyType({
+    "table": TABLE_SELECTOR,
+    "data_iframe": FRAME_LOCATOR,
+    "region_trigger": REGION_TRIGGER_SELECTOR,
+    "region_level1": REGION_LEVEL1_OPTION_SELECTOR,
+    "region_level2": REGION_LEVEL2_OPTION_SELECTOR,
+    "region_option": REGION_DROPDOWN_OPTION_SELECTOR,
+    "load_prompt": LOAD_PROMPT_SELECTOR,
+})
+
+# 兼容旧名（等待时间常量已改为 *_MAX_MS 上限语义），后续版本移除
+CLICK_WAIT_MS = CLICK_WAIT_MAX_MS
+NAVIGATION_WAIT_MS = NAVIGATION_WAIT_MAX_MS
+IFRAME_WAIT_MS = IFRAME_WAIT_MAX_MS
+REGION_WAIT_MS = REGION_WAIT_MAX_MS
+TABLE_LOAD_WAIT_MS = TABLE_LOAD_WAIT_MAX_MS
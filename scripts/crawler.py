@@ -4,16 +4,23 @@
 使用 Playwright 打开页面，遍历可点击入口，提取表格与列表，供 export_excel 写入 Excel。
 """
 import asyncio
-import random
+import json
 import re
+import time
+from html.parser import HTMLParser
 from pathlib import Path
-from urllib.parse import urljoin, urlparse
+from urllib.parse import quote, urljoin, urlparse, urlsplit, urlunsplit
 
 try:
     from playwright.async_api import async_playwright, TimeoutError as PlaywrightTimeout
 except ImportError:
     raise ImportError("请先安装: pip install playwright && playwright install chromium")
 
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:
+    LexborHTMLParser = None
+
 import config
 
 
@@ -23,6 +30,12 @@ def _normalize_href(base_url, href):
     return urljoin(base_url, href)
 
 
+def _canonical_url(url):
+    """去重用的规范形式：scheme/host 小写、去掉 #fragment 与路径末尾的 /（路径大小写保留）。"""
+    parts = urlsplit(url)
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path.rstrip("/"), parts.query, ""))
+
+
 def _same_origin(base_url, url):
     if not url:
         return False
@@ -30,87 +43,299 @@ def _same_origin(base_url, url):
     return (p1.scheme, p1.netloc) == (p2.scheme, p2.netloc)
 
 
-async def _random_wait(max_ms=5000):
-    """相邻操作间随机等待，防反爬。"""
+async def _random_wait(max_ms=5000, attempt=0):
+    """相邻操作间随机等待，防反爬（截断指数分布，见 config.next_wait_ms）；未开启 ANTI_BOT_DELAY_ENABLED 时不等待。"""
+    if not getattr(config, "ANTI_BOT_DELAY_ENABLED", False):
+        return
     ms = getattr(config, "RANDOM_WAIT_MAX_MS", 5000)
     if max_ms is not None:
         ms = min(ms, max_ms)
-    sec = random.uniform(0, ms / 1000.0)
-    await asyncio.sleep(sec)
+    await asyncio.sleep(min(ms, config.next_wait_ms(attempt)) / 1000.0)
+
+
+async def smart_wait(target, selector=None, max_ms=None, state="visible"):
+    """按 config.WAIT_STRATEGY 等待页面/frame 就绪，max_ms 为上限（毫秒）。
+    event：有 selector 时等元素达到 state；target 为 Locator 时等它达到 state；否则等网络空闲。
+    先就绪即返回，超时不报错；fixed：固定 sleep max_ms（旧行为）。"""
+    max_ms = config.CLICK_WAIT_MAX_MS if max_ms is None else max_ms
+    if getattr(config, "WAIT_STRATEGY", "event") != "event":
+        await asyncio.sleep(max_ms / 1000.0)
+        return
+    try:
+        if selector:
+            await target.wait_for_selector(selector, state=state, timeout=max_ms)
+        elif hasattr(target, "wait_for"):
+            await target.wait_for(state=state, timeout=max_ms)
+        else:
+            await target.wait_for_load_state("networkidle", timeout=max_ms)
+    except Exception:
+        pass
+
+
+# 表格内容签名（行数 + 首条/末条数据行文本），用于判断切换区域后表格是否已刷新
+_TABLE_SIG_JS = """() => {
+    const rows = document.querySelectorAll('table tr');
+    const text = (i) => (rows[i] ? rows[i].textContent || '' : '');
+    return rows.length + '|' + text(1) + '|' + text(rows.length - 1);
+}"""
+_TABLE_CHANGED_JS = "(before) => (" + _TABLE_SIG_JS + ")() !== before"
+
+
+async def _table_signature(frame):
+    try:
+        return await frame.evaluate(_TABLE_SIG_JS)
+    except Exception:
+        return None
+
+
+async def _wait_for_table_change(frame, before, max_ms):
+    """event：等表格签名与 before 不同（说明区域切换后的数据已到），最多 max_ms，超时不报错；
+    fixed 或拿不到签名时固定 sleep max_ms。"""
+    if getattr(config, "WAIT_STRATEGY", "event") != "event" or before is None:
+        await asyncio.sleep(max_ms / 1000.0)
+        return
+    try:
+        await frame.wait_for_function(_TABLE_CHANGED_JS, arg=before, timeout=max_ms)
+    except Exception:
+        pass
+
+
+def _submenu_link(level1_link):
+    """一级项（a.area-item）同级子菜单里的第一个二级链接，悬停后它可见即子菜单已展开。"""
+    return level1_link.locator("xpath=following-sibling::ul[contains(@class, 'dropdown-menu')]//a").first
+
+
+class _AsyncRateLimiter:
+    """协程间共享的最小间隔限速器：每次 acquire 按 1/rps 排队，rps<=0 时不限速。"""
+
+    def __init__(self, rps):
+        self.min_dt = 1.0 / rps if rps and rps > 0 else 0.0
+        self._lock = asyncio.Lock()
+        self._next = 0.0
+
+    async def acquire(self):
+        if not self.min_dt:
+            return
+        async with self._lock:
+            now = asyncio.get_running_loop().time()
+            wait = self._next - now
+            self._next = max(now, self._next) + self.min_dt
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+def _shard(regions):
+    """按 REGION_SHARD_INDEX / REGION_SHARD_COUNT 取本分片负责的省份（regions[i::n]）。"""
+    i = getattr(config, "REGION_SHARD_INDEX", 0)
+    n = getattr(config, "REGION_SHARD_COUNT", 1)
+    if n <= 1:
+        return regions
+    part = regions[i::n]
+    print("  [iframe] prod 分片 %d/%d：本进程抓取 %d 个省份" % (i, n, len(part)))
+    return part
+
+
+def _prod_concurrency():
+    """prod 下同时打开的省份 BrowserContext 数：PROD_CONCURRENCY 受 MAX_BROWSER_CONTEXTS 约束，至少 1。"""
+    n = int(getattr(config, "PROD_CONCURRENCY", 1) or 1)
+    cap = int(getattr(config, "MAX_BROWSER_CONTEXTS", 0) or 0)
+    if cap > 0:
+        n = min(n, cap)
+    return max(1, n)
+
+
+def launch_options():
+    """chromium.launch 的参数：headless、可执行文件路径与 CHROMIUM_LAUNCH_ARGS；
+    使用持久化 profile 时追加磁盘缓存大小，并用 blink 设置关闭图片（代替路由拦截）。"""
+    opts = {"headless": config.HEADLESS, "args": list(getattr(config, "CHROMIUM_LAUNCH_ARGS", ()))}
+    if getattr(config, "BROWSER_PROFILE_DIR", ""):
+        opts["args"] += [
+            "--disk-cache-size=%d" % getattr(config, "BROWSER_DISK_CACHE_BYTES", 0),
+            "--blink-settings=imagesEnabled=false",
+        ]
+    if getattr(config, "CHROMIUM_EXECUTABLE_PATH", None):
+        opts["executable_path"] = config.CHROMIUM_EXECUTABLE_PATH
+    return opts
+
+
+async def block_resources(context):
+    """在 context 上 abort CHROMIUM_BLOCK_RESOURCE_TYPES 中的请求（图片/字体/媒体等）以及 URL 命中
+    CHROMIUM_BLOCK_URL_PATTERN 的统计脚本；两者都未配置时不拦截。"""
+    blocked = getattr(config, "CHROMIUM_BLOCK_RESOURCE_TYPES", None) or frozenset()
+    pattern = getattr(config, "CHROMIUM_BLOCK_URL_PATTERN", None)
+    url_re = re.compile(pattern, re.I) if pattern else None
+    if not blocked and url_re is None:
+        return
+
+    async def _handle(route):
+        request = route.request
+        if request.resource_type in blocked or (url_re is not None and url_re.search(request.url)):
+            await route.abort()
+        else:
+            await route.continue_()
+
+    await context.route("**/*", _handle)
+
+
+async def block_link_page_resources(page):
+    """子链接页面上再 abort LINK_BLOCK_RESOURCE_TYPES（默认样式表），其余请求 fallback 给 context 上的 block_resources。
+    持久化 profile 时不拦截（路由拦截会关闭 HTTP 缓存）。"""
+    blocked = getattr(config, "LINK_BLOCK_RESOURCE_TYPES", None) or frozenset()
+    if not blocked or getattr(config, "BROWSER_PROFILE_DIR", ""):
+        return
+
+    async def _handle(route):
+        if route.request.resource_type in blocked:
+            await route.abort()
+        else:
+            await route.fallback()
+
+    await page.route("**/*", _handle)
+
+
+def _context_options():
+    """new_context / launch_persistent_context 共用的参数（证书、视口、UA、请求头）。"""
+    return {
+        "ignore_https_errors": config.IGNORE_HTTPS_ERRORS,
+        "viewport": {"width": 1280, "height": 800},
+        "user_agent": getattr(config, "USER_AGENT", None) or None,
+        "extra_http_headers": dict(getattr(config, "EXTRA_HTTP_HEADERS", None) or {}),
+    }
+
+
+async def _new_context(browser):
+    """按配置创建 BrowserContext（证书、视口、UA、请求头、资源拦截）。"""
+    context = await browser.new_context(**_context_options())
+    await block_resources(context)
+    return context
+
+
+async def _launch(p):
+    """启动浏览器，返回 (browser, context)。BROWSER_PROFILE_DIR 非空时用持久化 profile：
+    只有一个 context，browser 位置返回的也是它（省份 worker 见 _worker_context），不做路由拦截以保留 HTTP 缓存。"""
+    profile_dir = getattr(config, "BROWSER_PROFILE_DIR", "")
+    if profile_dir:
+        Path(profile_dir).mkdir(parents=True, exist_ok=True)
+        context = await p.chromium.launch_persistent_context(profile_dir, **launch_options(), **_context_options())
+        return (context, context)
+    browser = await p.chromium.launch(**launch_options())
+    return (browser, await _new_context(browser))
+
+
+async def _worker_context(browser):
+    """省份 worker 使用的 context 及是否由 worker 负责关闭：普通 browser 时新建一个；
+    持久化 profile 时 browser 即共享的 persistent context（没有 new_context），直接在其中开页。"""
+    if hasattr(browser, "new_context"):
+        return (await _new_context(browser), True)
+    return (browser, False)
+
+
+# 表格行数已达到 minRows 且加载提示不可见：一个谓词同时判断，条件成立即返回
+_TABLE_LOADED_JS = """([minRows, loadPromptSel]) => {
+    if (document.querySelectorAll('table tr').length < minRows) return false;
+    const lp = document.querySelector(loadPromptSel);
+    return !lp || lp.getClientRects().length === 0 || getComputedStyle(lp).visibility === 'hidden';
+}"""
 
 
 async def _wait_for_table_loaded(frame, min_rows=5, timeout_ms=12000):
-    """等待 frame 内表格加载出至少 min_rows 行，或超时。"""
-    wait_ms = getattr(config, "TABLE_LOAD_WAIT_MS", 12000)
+    """等待 frame 内表格加载出至少 min_rows 行且加载提示已隐藏；返回是否等到，超时不再补睡满 wait_ms。"""
+    wait_ms = getattr(config, "TABLE_LOAD_WAIT_MAX_MS", 12000)
     if timeout_ms is not None:
         wait_ms = min(wait_ms, timeout_ms)
     try:
-        await frame.wait_for_selector(
-            f"table tr:nth-child({min_rows})",
+        await frame.wait_for_function(
+            _TABLE_LOADED_JS,
+            arg=[max(min_rows, 1), config.SELECTORS["load_prompt"]],
             timeout=wait_ms,
+            polling=100,
         )
+        return True
     except Exception:
-        await asyncio.sleep(wait_ms / 1000.0)
-    await _random_wait(getattr(config, "RANDOM_WAIT_MAX_MS", 5000))
+        return False
+
+
+_REGION_APPLIED_JS = """(text) => {
+    const btn = document.querySelector('button#ddm_Area');
+    return btn && (btn.innerText || btn.textContent || '').trim().indexOf(text) !== -1;
+}"""
 
 
 async def _wait_for_region_applied(frame, region_text, timeout_ms=15000):
-    """等待区域选择生效：button#ddm_Area 的文本包含所选区域名（说明 filterArea 已执行）。"""
+    """等待区域选择生效：button#ddm_Area 的文本包含所选区域名（说明 filterArea 已执行）。超时返回 False。"""
     if not region_text:
-        return
+        return True
     try:
-        await frame.wait_for_function(
-            """(text) => {
-            const btn = document.querySelector('button#ddm_Area');
-            return btn && (btn.innerText || btn.textContent || '').trim().indexOf(text) !== -1;
-            }""",
-            timeout=timeout_ms,
-            arg=region_text.strip(),
-        )
+        await frame.wait_for_function(_REGION_APPLIED_JS, arg=region_text.strip(), timeout=timeout_ms)
+        return True
     except Exception:
-        pass
+        return False
 
 
 async def _wait_for_table_refreshed(frame, region_text, wait_after_apply_ms=6000):
-    """选择区域后：先等按钮文本更新，再等加载提示消失，再等表格刷新。"""
-    await _wait_for_region_applied(frame, region_text, timeout_ms=15000)
-    await asyncio.sleep(wait_after_apply_ms / 1000.0)
+    """选择区域后：先等按钮文本更新，再等加载提示消失，再等表格刷新。返回区域按钮是否已切换到 region_text。
+    wait_after_apply_ms 只在 fixed 策略下作为固定等待（event 策略下选择函数已等到表格变化）。"""
+    applied = await _wait_for_region_applied(frame, region_text, timeout_ms=15000)
+    if getattr(config, "WAIT_STRATEGY", "event") != "event":
+        await asyncio.sleep(wait_after_apply_ms / 1000.0)
     try:
-        await frame.wait_for_selector("#loadPrompt", state="hidden", timeout=8000)
+        await frame.wait_for_selector(config.SELECTORS["load_prompt"], state="hidden", timeout=8000)
     except Exception:
         pass
     await _wait_for_table_loaded(frame, min_rows=5)
+    return applied
+
+
+_NEXT_PAGE_TEXTS = ("下一页", "下页", ">", "next")
+_NEXT_PAGE_MARK = "data-crawler-next"
+
+# 可用的「下一页」元素：a/button 的文本、aria-label 或 title 含 needle，可见且未禁用（自身或祖先带 disabled）
+_NEXT_PAGE_MATCH_JS = """(el, needle) => {
+    const label = [el.textContent, el.getAttribute('aria-label'), el.getAttribute('title')].join(' ').toLowerCase();
+    return label.indexOf(needle) !== -1 && el.getClientRects().length > 0
+        && getComputedStyle(el).visibility !== 'hidden'
+        && !el.disabled && el.getAttribute('aria-disabled') !== 'true' && !el.closest('.disabled');
+}"""
+
+# 按 _NEXT_PAGE_TEXTS 的优先顺序找第一个可用的「下一页」并打上标记，找不到返回 false
+_MARK_NEXT_PAGE_JS = """([nextTexts, mark]) => {
+    const match = """ + _NEXT_PAGE_MATCH_JS + """;
+    document.querySelectorAll('[' + mark + ']').forEach(el => el.removeAttribute(mark));
+    const candidates = Array.from(document.querySelectorAll('a, button'));
+    for (const text of nextTexts) {
+        const el = candidates.find(c => match(c, text.toLowerCase()));
+        if (el) {
+            el.setAttribute(mark, '1');
+            return true;
+        }
+    }
+    return false;
+}"""
 
 
 async def _click_next_page(frame):
-    """若 frame 内有分页「下一页」「下页」等，点击并返回 True；否则返回 False。"""
-    next_texts = ["下一页", "下页", ">", "next"]
-    for text in next_texts:
-        try:
-            # 优先找可点击的链接或按钮（分页常用 a 或 button）
-            loc = frame.get_by_role("link", name=re.compile(re.escape(text), re.I)).first
-            await loc.click(timeout=2000)
-            await asyncio.sleep(1.5)
-            return True
-        except Exception:
-            pass
-        try:
-            loc = frame.locator("a, button").filter(has_text=re.compile(re.escape(text), re.I)).first
-            await loc.click(timeout=2000)
-            await asyncio.sleep(1.5)
-            return True
-        except Exception:
-            pass
-    return False
+    """若 frame 内有可用的分页「下一页」「下页」等，点击并等表格变化后返回 True；否则返回 False。
+    一次 evaluate 找到并标记目标元素，没有「下一页」时不再逐个试 locator、空等点击超时。"""
+    try:
+        if not await frame.evaluate(_MARK_NEXT_PAGE_JS, [list(_NEXT_PAGE_TEXTS), _NEXT_PAGE_MARK]):
+            return False
+        before = await _table_signature(frame)
+        await frame.locator("[%s]" % _NEXT_PAGE_MARK).first.click(timeout=config.SELECTOR_TIMEOUT_MS)
+    except Exception:
+        return False
+    await _wait_for_table_change(frame, before, 1500)
+    return True
 
 
-def _is_data_table(rows):
-    """过滤掉明显是布局的空表，只保留有数据意义的表格（多行多列，或单行但列多）。"""
+def _is_data_table(rows, max_cols=None):
+    """过滤掉明显是布局的空表，只保留有数据意义的表格（多行多列，或单行但列多）。
+    max_cols 为调用方已算出的最大列数（省去再扫一遍）。"""
     if not rows:
         return False
     min_rows = getattr(config, "MIN_TABLE_ROWS", 2)
     min_cols = getattr(config, "MIN_TABLE_COLS", 2)
-    max_cols = max(len(r) for r in rows)
+    if max_cols is None:
+        max_cols = max(len(r) for r in rows)
     if len(rows) >= min_rows and max_cols >= min_cols:
         return True
     # 单行但列数较多（≥5）也视为可能的数据行
@@ -119,59 +344,66 @@ def _is_data_table(rows):
     return False
 
 
+# 在页面内按 _is_data_table 同样的行/列阈值先筛一遍：不合格的布局表只返回 null（保留下标），
+# 不再读取 textContent 并跨进程序列化
+_PAGE_TABLES_JS = """([minRows, minCols]) => {
+    const tables = document.querySelectorAll('table');
+    return Array.from(tables).map(t => {
+        const rows = Array.from(t.querySelectorAll('tr'));
+        const cells = rows.map(tr => tr.querySelectorAll('th, td'));
+        const maxCols = cells.reduce((m, c) => Math.max(m, c.length), 0);
+        const keep = (rows.length >= minRows && maxCols >= minCols) || (rows.length === 1 && maxCols >= 5);
+        if (!keep) return null;
+        return cells.map(c => Array.from(c).map(cell => (cell.textContent || '').trim()));
+    });
+}"""
+
+
 async def _extract_tables_from_page(page):
-    """从当前 page 提取所有 table 的二维数组列表。"""
+    """从当前 page 提取 table 的二维数组列表；明显是布局的表对应位置为 None。"""
     tables_data = await page.evaluate(
-        """() => {
-        const tables = document.querySelectorAll('table');
-        return Array.from(tables).map(t => {
-            const rows = t.querySelectorAll('tr');
-            return Array.from(rows).map(tr => 
-                Array.from(tr.querySelectorAll('th, td')).map(cell => (cell.textContent || '').trim())
-            );
-        });
-    }"""
+        _PAGE_TABLES_JS,
+        [getattr(config, "MIN_TABLE_ROWS", 2), getattr(config, "MIN_TABLE_COLS", 2)],
     )
     return tables_data
 
 
-def _table_extract_js():
-    """供 page 或 frame 共用的表格提取 JS。"""
-    return """() => {
-        const tables = document.querySelectorAll('table');
-        return Array.from(tables).map(t => {
-            const rows = t.querySelectorAll('tr');
-            return Array.from(rows).map(tr =>
-                Array.from(tr.querySelectorAll('th, td')).map(cell => (cell.textContent || '').trim())
-            );
-        });
-    }"""
+_FRAME_TABLES_JS = """() => {
+    const tables = document.querySelectorAll('table');
+    return Array.from(tables).map(t => {
+        const rows = t.querySelectorAll('tr');
+        return Array.from(rows).map(tr =>
+            Array.from(tr.querySelectorAll('th, td')).map(cell => (cell.textContent || '').trim())
+        );
+    });
+}"""
 
 
 async def _extract_tables_from_frame(frame):
     """从 iframe（Frame 对象）内提取所有 table 的二维数组列表。"""
     try:
-        return await frame.evaluate(_table_extract_js())
+        return await frame.evaluate(_FRAME_TABLES_JS)
     except Exception:
         return []
 
 
+_SELECT_OPTIONS_JS = """() => {
+    const sel = document.querySelectorAll('select');
+    if (!sel.length) return { l1: [], l2: [], custom: true };
+    const opts = (s) => Array.from(s.options).map(o => (o.textContent || '').trim()).filter(Boolean);
+    return {
+        l1: opts(sel[0]),
+        l2: sel.length > 1 ? opts(sel[1]) : [],
+        custom: false
+    };
+}"""
+
+
 async def _get_region_options(frame):
     """获取 iframe 内两级地域选择器的选项：返回 (level1_options, level2_options, use_custom)。
     先尝试原生 select，若无则用自定义下拉（button#ddm_Area + a.area-item）。"""
     try:
-        result = await frame.evaluate(
-            """() => {
-            const sel = document.querySelectorAll('select');
-            if (!sel.length) return { l1: [], l2: [], custom: true };
-            const opts = (s) => Array.from(s.options).map(o => (o.textContent || '').trim()).filter(Boolean);
-            return {
-                l1: opts(sel[0]),
-                l2: sel.length > 1 ? opts(sel[1]) : [],
-                custom: false
-            };
-            }"""
-        )
+        result = await frame.evaluate(_SELECT_OPTIONS_JS)
         l1 = result.get("l1") or []
         l2 = result.get("l2") or []
         if result.get("custom") is True or (not l1 and not l2):
@@ -184,35 +416,43 @@ async def _get_region_options(frame):
     return (l1, l2, True)
 
 
-def _level1_option_selector():
-    """一级选项的 CSS 选择器（与 _level1_selector 一致，供 evaluate 用）。"""
-    return getattr(config, "REGION_LEVEL1_OPTION_SELECTOR", None) or "ul.dropdown-menu[aria-labelledby='ddm_Area'] > li > a.area-item"
+def _level1_selector():
+    """一级区域选项的选择器（locator 与 evaluate 共用，保证取选项与点击时 DOM 顺序一致）。"""
+    return config.SELECTORS["region_level1"]
+
+
+_LEVEL1_TEXTS_JS = """(level1Sel) => {
+    const texts = [];
+    document.querySelectorAll(level1Sel).forEach(el => {
+        const t = (el.textContent || '').trim();
+        if (t && t.length < 50) texts.push(t);
+    });
+    return texts;
+}"""
+
+
+# 同 _LEVEL1_TEXTS_JS，但选项尚未显示（菜单未展开）时返回 null，供 wait_for_function 在菜单展开时立即返回选项文本
+_LEVEL1_TEXTS_READY_JS = """(level1Sel) => {
+    const shown = Array.from(document.querySelectorAll(level1Sel)).some(el => el.getClientRects().length > 0);
+    if (!shown) return null;
+    const texts = (""" + _LEVEL1_TEXTS_JS + """)(level1Sel);
+    return texts.length ? texts : null;
+}"""
 
 
 async def _eval_level1_texts(frame, level1_sel=None):
     """在 frame 内用同一选择器取一级选项文本列表（DOM 顺序）。"""
-    sel = level1_sel or _level1_option_selector()
+    sel = level1_sel or _level1_selector()
     try:
-        return await frame.evaluate(
-            """(level1Sel) => {
-            const items = document.querySelectorAll(level1Sel);
-            const texts = [];
-            items.forEach(el => {
-                const t = (el.textContent || '').trim();
-                if (t && t.length > 0 && t.length < 50) texts.push(t);
-            });
-            return texts;
-            }""",
-            sel,
-        )
+        return await frame.evaluate(_LEVEL1_TEXTS_JS, sel)
     except Exception:
         return []
 
 
 async def _get_region_options_custom(frame):
     """自定义下拉（button#ddm_Area）：先从 DOM 取一级选项（菜单常在 DOM 中）；若为空再点击触发后取。"""
-    level1_sel = _level1_option_selector()
-    trigger_sel = getattr(config, "REGION_TRIGGER_SELECTOR", "button#ddm_Area") or "button#ddm_Area"
+    level1_sel = _level1_selector()
+    trigger_sel = config.SELECTORS["region_trigger"]
 
     try:
         # 先不点击：菜单常在 DOM 中，直接取一级选项
@@ -221,10 +461,10 @@ async def _get_region_options_custom(frame):
             return (result, [])
         # 若为空则点击按钮展开后再取
         await frame.locator(trigger_sel).first.click(timeout=10000)
-        await asyncio.sleep(0.8)
+        await smart_wait(frame, level1_sel, max_ms=800)
         result = await _eval_level1_texts(frame, level1_sel)
         await frame.keyboard.press("Escape")
-        await asyncio.sleep(0.3)
+        await smart_wait(frame, level1_sel, max_ms=300, state="hidden")
         if isinstance(result, list) and result:
             return (result, [])
     except Exception:
@@ -234,14 +474,15 @@ async def _get_region_options_custom(frame):
 
 async def _get_region_options_after_open(frame):
     """在「已打开」区域下拉时取一级选项列表，保证顺序与后续按索引点击时一致（避免关闭态与打开态 DOM 顺序不同）。"""
-    trigger_sel = getattr(config, "REGION_TRIGGER_SELECTOR", "button#ddm_Area") or "button#ddm_Area"
-    level1_sel = _level1_option_selector()
+    trigger_sel = config.SELECTORS["region_trigger"]
+    level1_sel = _level1_selector()
     try:
         await frame.locator(trigger_sel).first.click(timeout=10000)
-        await asyncio.sleep(0.8)
-        result = await _eval_level1_texts(frame, level1_sel)
+        # 菜单渲染出选项即返回文本列表（一次往返），不再先等可见再单独 evaluate
+        handle = await frame.wait_for_function(_LEVEL1_TEXTS_READY_JS, arg=level1_sel, timeout=config.ACTION_TIMEOUT_MS)
+        result = await handle.json_value()
         await frame.keyboard.press("Escape")
-        await asyncio.sleep(0.3)
+        await smart_wait(frame, level1_sel, max_ms=300, state="hidden")
         if isinstance(result, list) and result:
             return result
     except Exception:
@@ -249,59 +490,59 @@ async def _get_region_options_after_open(frame):
     return []
 
 
+# 二级（城市）子菜单文本：按一级项下标或按一级项文本定位所属 li
+_SUBMENU_BY_INDEX_JS = """(idx) => {
+    var mainUl = document.querySelector('ul[aria-labelledby="ddm_Area"]');
+    if (!mainUl) return [];
+    var items = mainUl.querySelectorAll('li > a.area-item');
+    var li = items[idx] ? items[idx].closest('li') : null;
+    if (!li || !li.classList.contains('dropdown-submenu')) return [];
+    var subUl = li.querySelector('ul.dropdown-menu');
+    if (!subUl) return [];
+    var links = subUl.querySelectorAll('li > a');
+    return Array.from(links).map(function(x) { return (x.textContent || '').trim(); }).filter(Boolean);
+}"""
+
+_SUBMENU_BY_TEXT_JS = """(provinceText) => {
+    var mainUl = document.querySelector('ul[aria-labelledby="ddm_Area"]');
+    if (!mainUl) return [];
+    var items = mainUl.querySelectorAll('li > a.area-item');
+    var subUl = null;
+    for (var i = 0; i < items.length; i++) {
+        var a = items[i];
+        if ((a.textContent || '').trim() !== provinceText) continue;
+        var li = a.closest('li');
+        if (li && li.classList.contains('dropdown-submenu')) {
+            subUl = li.querySelector('ul.dropdown-menu');
+            break;
+        }
+    }
+    if (!subUl) return [];
+    var links = subUl.querySelectorAll('li > a');
+    return Array.from(links).map(function(x) { return (x.textContent || '').trim(); }).filter(Boolean);
+}"""
+
+
 async def _get_level2_options_custom(frame, level1_text, level1_dom_index=None):
     """打开区域下拉后，悬停在一级项（省）上，从子菜单取二级选项（城市）列表。level1_dom_index 不为 None 时按索引悬停，避免 has_text 误匹配。"""
-    trigger_sel = getattr(config, "REGION_TRIGGER_SELECTOR", "button#ddm_Area") or "button#ddm_Area"
+    trigger_sel = config.SELECTORS["region_trigger"]
     sel = _level1_selector()
     try:
         await frame.locator(trigger_sel).first.click()
-        await asyncio.sleep(0.5)
+        await smart_wait(frame, sel, max_ms=500)
         if level1_dom_index is not None:
             level1_link = frame.locator(sel).nth(level1_dom_index)
         else:
             level1_link = frame.locator(sel).filter(has_text=level1_text).first
         await level1_link.hover()
-        await asyncio.sleep(0.6)
+        await smart_wait(_submenu_link(level1_link), max_ms=600)
         # 按索引取子菜单：与悬停的 li 一致
         if level1_dom_index is not None:
-            result = await frame.evaluate(
-                """(idx) => {
-                var mainUl = document.querySelector('ul[aria-labelledby="ddm_Area"]');
-                if (!mainUl) return [];
-                var items = mainUl.querySelectorAll('li > a.area-item');
-                var li = items[idx] ? items[idx].closest('li') : null;
-                if (!li || !li.classList.contains('dropdown-submenu')) return [];
-                var subUl = li.querySelector('ul.dropdown-menu');
-                if (!subUl) return [];
-                var links = subUl.querySelectorAll('li > a');
-                return Array.from(links).map(function(x) { return (x.textContent || '').trim(); }).filter(Boolean);
-                }""",
-                level1_dom_index,
-            )
+            result = await frame.evaluate(_SUBMENU_BY_INDEX_JS, level1_dom_index)
         else:
-            result = await frame.evaluate(
-                """(provinceText) => {
-                var mainUl = document.querySelector('ul[aria-labelledby="ddm_Area"]');
-                if (!mainUl) return [];
-                var items = mainUl.querySelectorAll('li > a.area-item');
-                var subUl = null;
-                for (var i = 0; i < items.length; i++) {
-                    var a = items[i];
-                    if ((a.textContent || '').trim() !== provinceText) continue;
-                    var li = a.closest('li');
-                    if (li && li.classList.contains('dropdown-submenu')) {
-                        subUl = li.querySelector('ul.dropdown-menu');
-                        break;
-                    }
-                }
-                if (!subUl) return [];
-                var links = subUl.querySelectorAll('li > a');
-                return Array.from(links).map(function(x) { return (x.textContent || '').trim(); }).filter(Boolean);
-                }""",
-                level1_text.strip(),
-            )
+            result = await frame.evaluate(_SUBMENU_BY_TEXT_JS, level1_text.strip())
         await frame.keyboard.press("Escape")
-        await asyncio.sleep(0.3)
+        await smart_wait(frame, sel, max_ms=300, state="hidden")
         if isinstance(result, list):
             return result
     except Exception:
@@ -309,64 +550,63 @@ async def _get_level2_options_custom(frame, level1_text, level1_dom_index=None):
     return []
 
 
-def _level1_selector():
-    """一级区域选项的 locator 选择器（与 _get_region_options_custom 中取选项的 DOM 一致）。"""
-    return "ul.dropdown-menu[aria-labelledby='ddm_Area'] > li > a.area-item"
-
-
 async def _select_region_custom(frame, level1_text, level2_text=None):
     """自定义下拉（#ddm_Area）：打开后选一级；若 level2_text 则悬停一级再点二级（市）。"""
-    trigger_sel = getattr(config, "REGION_TRIGGER_SELECTOR", "button#ddm_Area") or "button#ddm_Area"
-    wait_ms = getattr(config, "REGION_WAIT_MS", 6000)
+    trigger_sel = config.SELECTORS["region_trigger"]
+    wait_ms = getattr(config, "REGION_WAIT_MAX_MS", 6000)
+    sel = _level1_selector()
     try:
+        before = await _table_signature(frame)
         await frame.locator(trigger_sel).first.click()
-        await asyncio.sleep(0.5)
+        await smart_wait(frame, sel, max_ms=500)
+        level1_link = frame.locator(sel, has_text=level1_text).first
         if level2_text:
-            level1_link = frame.locator("ul.dropdown-menu[aria-labelledby='ddm_Area'] > li > a.area-item", has_text=level1_text).first
             await level1_link.hover()
-            await asyncio.sleep(0.4)
-            city_link = frame.locator("ul.dropdown-menu[aria-labelledby='ddm_Area'] li.dropdown-submenu ul.dropdown-menu li a", has_text=level2_text).first
+            await smart_wait(_submenu_link(level1_link), max_ms=400)
+            city_link = frame.locator(config.SELECTORS["region_level2"], has_text=level2_text).first
             await city_link.click()
         else:
-            level1_link = frame.locator("ul.dropdown-menu[aria-labelledby='ddm_Area'] > li > a.area-item", has_text=level1_text).first
             await level1_link.click()
-        await asyncio.sleep(wait_ms / 1000.0)
+        await _wait_for_table_change(frame, before, wait_ms)
     except Exception:
         pass
 
 
 async def _select_region_custom_by_index(frame, level1_dom_index, level2_text=None):
     """按 DOM 索引选择区域，避免 has_text 误匹配（如“河南”“河北”）。打开下拉后点击第 level1_dom_index 个一级项；若有 level2_text 则悬停该项再点二级。"""
-    trigger_sel = getattr(config, "REGION_TRIGGER_SELECTOR", "button#ddm_Area") or "button#ddm_Area"
-    wait_ms = getattr(config, "REGION_WAIT_MS", 6000)
+    trigger_sel = config.SELECTORS["region_trigger"]
+    wait_ms = getattr(config, "REGION_WAIT_MAX_MS", 6000)
     sel = _level1_selector()
     try:
+        before = await _table_signature(frame)
         await frame.locator(trigger_sel).first.click()
-        await asyncio.sleep(0.5)
+        await smart_wait(frame, sel, max_ms=500)
         level1_loc = frame.locator(sel).nth(level1_dom_index)
         if level2_text:
             await level1_loc.hover()
-            await asyncio.sleep(0.4)
-            city_link = frame.locator("ul.dropdown-menu[aria-labelledby='ddm_Area'] li.dropdown-submenu ul.dropdown-menu li a", has_text=level2_text).first
+            await smart_wait(_submenu_link(level1_loc), max_ms=400)
+            city_link = frame.locator(config.SELECTORS["region_level2"], has_text=level2_text).first
             await city_link.click()
         else:
             await level1_loc.click()
-        await asyncio.sleep(wait_ms / 1000.0)
+        await _wait_for_table_change(frame, before, wait_ms)
     except Exception:
         pass
 
 
 async def _select_region_in_frame(frame, level1_text=None, level2_text=None):
     """在 iframe 内选择一级/二级区域。先尝试原生 select，再尝试自定义下拉（button#ddm_Area）。"""
-    wait_ms = getattr(config, "REGION_WAIT_MS", 3000)
+    wait_ms = getattr(config, "REGION_WAIT_MAX_MS", 3000)
     level1_text = level1_text or getattr(config, "REGION_OPTION", "全国")
     try:
         try:
-            await frame.locator("select").first.select_option(label=level1_text, timeout=2000)
-            await asyncio.sleep(wait_ms / 1000.0)
+            before = await _table_signature(frame)
+            await frame.locator("select").first.select_option(label=level1_text, timeout=config.SELECTOR_TIMEOUT_MS)
+            await _wait_for_table_change(frame, before, wait_ms)
             if level2_text:
-                await frame.locator("select").nth(1).select_option(label=level2_text, timeout=2000)
-                await asyncio.sleep(wait_ms / 1000.0)
+                before = await _table_signature(frame)
+                await frame.locator("select").nth(1).select_option(label=level2_text, timeout=config.SELECTOR_TIMEOUT_MS)
+                await _wait_for_table_change(frame, before, wait_ms)
             return
         except Exception:
             pass
@@ -374,48 +614,51 @@ async def _select_region_in_frame(frame, level1_text=None, level2_text=None):
         return
     except Exception:
         pass
-    labels = getattr(config, "REGION_SELECT_LABELS", None) or ["选择区域", "区域"]
+    labels = getattr(config, "REGION_SELECT_LABELS", None) or ("选择区域", "区域")
     for lab in labels:
         try:
             trigger = frame.get_by_text(lab).first
-            await trigger.click(timeout=2000)
-            await asyncio.sleep(0.5)
+            before = await _table_signature(frame)
+            await trigger.click(timeout=config.SELECTOR_TIMEOUT_MS)
             opt = frame.get_by_text(level1_text).first
-            await opt.click(timeout=2000)
-            await asyncio.sleep(wait_ms / 1000.0)
+            await smart_wait(opt, max_ms=500)
+            await opt.click(timeout=config.SELECTOR_TIMEOUT_MS)
+            await _wait_for_table_change(frame, before, wait_ms)
             if level2_text:
+                before = await _table_signature(frame)
                 opt2 = frame.get_by_text(level2_text).first
-                await opt2.click(timeout=2000)
-                await asyncio.sleep(wait_ms / 1000.0)
+                await opt2.click(timeout=config.SELECTOR_TIMEOUT_MS)
+                await _wait_for_table_change(frame, before, wait_ms)
             return
         except Exception:
             continue
 
 
+def _fit_row(row, width):
+    """把一行补空串/截断到 width 列；已是 width 列的 list 原样返回，不再复制。"""
+    n = len(row)
+    if n == width and isinstance(row, list):
+        return row
+    if n >= width:
+        return list(row[:width])
+    return list(row) + [""] * (width - n)
+
+
 def _pick_main_data_table(tables):
     """从合并后的表列表中选出主数据表（行数最多且符合有效表条件）。返回 (header_row, data_rows) 或 (None, [])。"""
     if not tables:
         return (None, [])
     best = None
-    best_rows = []
+    max_cols = 0
     for t in tables:
-        if not t or not _is_data_table(t):
+        if not t or (best is not None and len(t) <= len(best)):
             continue
-        if len(t) > len(best_rows):
-            best = t
-            best_rows = t
+        width = max(len(r) for r in t)
+        if _is_data_table(t, width):
+            best, max_cols = t, width
     if not best or len(best) < 2:
         return (None, [])
-    header = list(best[0])
-    max_cols = max(len(r) for r in best)
-    data_rows = []
-    for r in best[1:]:
-        row = list(r) + [""] * (max_cols - len(r))
-        row = row[:max_cols]
-        data_rows.append(row)
-    header = header + [""] * (max_cols - len(header))
-    header = header[:max_cols]
-    return (header, data_rows)
+    return (_fit_row(list(best[0]), max_cols), [_fit_row(r, max_cols) for r in best[1:]])
 
 
 def _collect_all_data_tables(tables):
@@ -426,6 +669,7 @@ def _collect_all_data_tables(tables):
         return (None, [])
     header = None
     max_cols = 0
+    stale = 0  # all_data_rows[:stale] 是按较窄列数补齐的，最后需要再补齐
     all_data_rows = []
     for t in tables:
         if not t:
@@ -433,30 +677,27 @@ def _collect_all_data_tables(tables):
         if len(t) < 2:
             # 单行表：若已有 header 且该行像数据行（列数足够），当作最后一条数据收集（解决偶数条漏最后一条）
             if header is not None and len(t) == 1 and len(t[0]) >= getattr(config, "MIN_TABLE_COLS", 2):
-                row = list(t[0]) + [""] * (max_cols - len(t[0]))
-                row = row[:max_cols]
-                all_data_rows.append(row)
+                all_data_rows.append(_fit_row(t[0], max_cols))
             continue
-        if not _is_data_table(t):
+        width = max(len(r) for r in t)
+        if not _is_data_table(t, width):
             continue
         if header is None:
             header = list(t[0])
-            max_cols = max(len(r) for r in t)
-            rows_to_add = list(t[1:])
+            max_cols = width
+            rows_to_add = t[1:]
         else:
-            rows_to_add = list(t)
-            max_cols = max(max_cols, max(len(r) for r in t))
-        for r in rows_to_add:
-            row = list(r) + [""] * (max_cols - len(r))
-            row = row[:max_cols]
-            all_data_rows.append(row)
+            rows_to_add = t
+            if width > max_cols:
+                max_cols = width
+                stale = len(all_data_rows)
+        # 追加时即按当前列数补齐；只有后续表更宽时，之前追加的行才需要最后再补一遍
+        all_data_rows.extend(_fit_row(r, max_cols) for r in rows_to_add)
     if header is None:
         return (None, [])
-    header = header + [""] * (max_cols - len(header))
-    header = header[:max_cols]
-    all_data_rows = [list(r) + [""] * (max_cols - len(r)) for r in all_data_rows]
-    all_data_rows = [r[:max_cols] for r in all_data_rows]
-    return (header, all_data_rows)
+    for i in range(stale):
+        all_data_rows[i] = _fit_row(all_data_rows[i], max_cols)
+    return (_fit_row(header, max_cols), all_data_rows)
 
 
 def _find_column_index(header, candidates):
@@ -471,10 +712,19 @@ def _find_column_index(header, candidates):
     return -1
 
 
-def _region_from_row(row, header, level1_fallback, level2_fallback):
-    """根据行数据与表头，取表格中的省份/城市作为一级/二级区域；若无则用 fallback。"""
-    province_idx = _find_column_index(header, ["省份"])
-    city_idx = _find_column_index(header, ["城市", "地市", "地区", "地市名称"])
+_PROVINCE_COLUMNS = ("省份",)
+_CITY_COLUMNS = ("城市", "地市", "地区", "地市名称")
+
+
+def _region_columns(header):
+    """表头中省份列、城市列的索引 (province_idx, city_idx)，未找到为 -1；每张表算一次，供 _region_from_row 逐行复用。"""
+    return (_find_column_index(header, _PROVINCE_COLUMNS), _find_column_index(header, _CITY_COLUMNS))
+
+
+def _region_from_row(row, header, level1_fallback, level2_fallback, columns=None):
+    """根据行数据与表头，取表格中的省份/城市作为一级/二级区域；若无则用 fallback。
+    columns 为 _region_columns(header) 的结果，逐行调用时传入以免每行重新查找表头。"""
+    province_idx, city_idx = columns if columns is not None else _region_columns(header)
     level1 = level1_fallback
     level2 = level2_fallback
     if province_idx >= 0 and province_idx < len(row) and row[province_idx] and str(row[province_idx]).strip():
@@ -484,103 +734,146 @@ def _region_from_row(row, header, level1_fallback, level2_fallback):
     return (level1, level2)
 
 
-def _merge_header_data_tables(tables):
-    """若前一个表仅 1 行且与后一个表列数一致，则合并为 [表头行] + [数据行]，返回合并后的表列表（去重/去空）。"""
-    if not tables or len(tables) < 2:
-        return tables
-    merged = []
-    i = 0
-    while i < len(tables):
+def _iter_merged_tables(tables):
+    """逐个产出合并后的表（不建中间列表）：若某表仅 1 行且后一个表的列数不超过它 +2，
+    两者合并为 [表头行] + [数据行] 产出；空表跳过。"""
+    i, n = 0, len(tables)
+    while i < n:
         t = tables[i]
+        i += 1
         if not t:
-            i += 1
             continue
-        if i + 1 < len(tables) and len(t) == 1:
-            next_t = tables[i + 1]
-            if next_t:
-                cols_head = len(t[0])
-                cols_body = max(len(r) for r in next_t) if next_t else 0
-                if cols_head == cols_body or cols_body <= cols_head + 2:
-                    merged.append(t + next_t)
-                    i += 2
-                    continue
-        merged.append(t)
-        i += 1
-    return merged
+        if len(t) == 1 and i < n and tables[i] and max(len(r) for r in tables[i]) <= len(t[0]) + 2:
+            yield t + tables[i]
+            i += 1
+        else:
+            yield t
 
 
-async def _scrape_frame_all_pages(frame):
-    """从当前 frame 抓取表格数据（含分页），返回 (header, data_rows)。"""
-    tables_raw = await _extract_tables_from_frame(frame)
-    tables_merged = _merge_header_data_tables(tables_raw or [])
-    header, data_rows = _collect_all_data_tables(tables_merged)
+def _tables_to_rows(tables):
+    """frame 内原始表格列表 -> (header, data_rows)：表头/数据表合并（_iter_merged_tables）与
+    收集（_collect_all_data_tables）在同一趟遍历中完成。"""
+    return _collect_all_data_tables(_iter_merged_tables(tables or []))
+
+
+# 一次 evaluate 取回 frame 当前状态：全部表格、是否有可见的「下一页」、加载提示是否可见、表格总行数
+_FRAME_STATE_JS = """([nextTexts, loadPromptSel]) => {
+    const visible = (el) => !!el && el.getClientRects().length > 0 && getComputedStyle(el).visibility !== 'hidden';
+    const tables = Array.from(document.querySelectorAll('table')).map(t =>
+        Array.from(t.querySelectorAll('tr')).map(tr =>
+            Array.from(tr.querySelectorAll('th, td')).map(cell => (cell.textContent || '').trim())
+        )
+    );
+    const match = """ + _NEXT_PAGE_MATCH_JS + """;
+    const needles = nextTexts.map(t => t.toLowerCase());
+    const hasNext = Array.from(document.querySelectorAll('a, button')).some(el => needles.some(n => match(el, n)));
+    return {
+        tables: tables,
+        hasNext: hasNext,
+        loading: visible(document.querySelector(loadPromptSel)),
+        rowCount: document.querySelectorAll('table tr').length,
+    };
+}"""
+
+
+async def _frame_state(frame):
+    """frame 当前状态（见 _FRAME_STATE_JS）；evaluate 失败时返回空状态。"""
+    try:
+        return await frame.evaluate(_FRAME_STATE_JS, [list(_NEXT_PAGE_TEXTS), config.SELECTORS["load_prompt"]])
+    except Exception:
+        return {"tables": [], "hasNext": False, "loading": False, "rowCount": 0}
+
+
+def _rows_from_state(state):
+    return _tables_to_rows(state.get("tables"))
+
+
+async def _iter_frame_pages(frame):
+    """逐页产出当前 frame 的表格数据 (header, page_rows)：先产出第一页，之后每翻一页产出该页的数据行。
+    每页一次 evaluate 拿到表格与分页状态；页面上没有「下一页」时不再逐个试点分页按钮。
+    第一页无表头或无数据时什么也不产出。"""
+    state = await _frame_state(frame)
+    header, data_rows = _rows_from_state(state)
     if not header or not data_rows:
-        return (None, [])
-    all_rows = list(data_rows)
-    while await _click_next_page(frame):
-        # 翻页后先等加载提示消失，再等表格；最后一页可能只有 1 行，用 min_rows=1 避免漏抓
-        try:
-            await frame.wait_for_selector("#loadPrompt", state="hidden", timeout=8000)
-        except Exception:
-            pass
+        return
+    yield (header, data_rows)
+    while state.get("hasNext") and await _click_next_page(frame):
+        state = await _frame_state(frame)
+        # 翻页后若加载提示可见先等它消失，再等表格；最后一页可能只有 1 行，用 min_rows=1 避免漏抓
+        stale = state.get("loading") or not state.get("rowCount")
+        if state.get("loading"):
+            try:
+                await frame.wait_for_selector(config.SELECTORS["load_prompt"], state="hidden", timeout=8000)
+            except Exception:
+                pass
         await _wait_for_table_loaded(frame, min_rows=1)
-        tables_raw = await _extract_tables_from_frame(frame)
-        tables_merged = _merge_header_data_tables(tables_raw or [])
-        _, more_rows = _collect_all_data_tables(tables_merged)
+        if stale:
+            state = await _frame_state(frame)
+        _, more_rows = _rows_from_state(state)
         # 若翻页后拿到 0 行，可能是新页尚未渲染，再等一次并重试抓取一次（避免漏掉最后一页仅 1 条）
         if not more_rows:
             await asyncio.sleep(2.0)
-            tables_raw = await _extract_tables_from_frame(frame)
-            tables_merged = _merge_header_data_tables(tables_raw or [])
-            _, more_rows = _collect_all_data_tables(tables_merged)
+            state = await _frame_state(frame)
+            _, more_rows = _rows_from_state(state)
         if more_rows:
-            all_rows.extend(more_rows)
-    return (header, all_rows)
+            yield (header, more_rows)
+
+
+async def _scrape_frame_all_pages(frame):
+    """从当前 frame 抓取表格数据（含分页），返回 (header, data_rows)；逐页数据见 _iter_frame_pages。"""
+    header, rows = None, []
+    async for header, page_rows in _iter_frame_pages(frame):
+        rows.extend(page_rows)
+    return (header, rows)
 
 
 async def _get_data_frame(page):
-    """定位数据 iframe（RealDatas.html）。先按 url 匹配，再按 iframe#MF 取 content_frame。"""
-    wait_ms = getattr(config, "IFRAME_WAIT_MS", 8000)
-    src_key = getattr(config, "DATA_IFRAME_SRC_CONTAINS", "RealDatas") or "RealDatas"
-    iframe_id = getattr(config, "DATA_IFRAME_ID", "MF") or "MF"
-    await asyncio.sleep(wait_ms / 1000.0)
-    for frame in page.frames:
-        if frame == page.main_frame:
-            continue
-        if src_key in (frame.url or ""):
-            # 可选：等待 frame 内出现表格（AJAX 可能延后）
-            try:
-                await frame.wait_for_selector("table", timeout=3000)
-            except Exception:
-                pass
-            return frame
+    """定位数据 iframe（RealDatas.html）：按 config.FRAME_LOCATOR（iframe#MF 或 src 含 RealDatas）一次查询取 content_frame。
+    先等该 iframe 挂到 DOM 上（最多 IFRAME_WAIT_MAX_MS，出现即返回），不再固定等满。"""
+    wait_ms = getattr(config, "IFRAME_WAIT_MAX_MS", 8000)
+    await smart_wait(page, config.SELECTORS["data_iframe"], max_ms=wait_ms, state="attached")
     try:
-        el = await page.query_selector(f"iframe#{iframe_id}")
-        if el:
-            return await el.content_frame()
+        el = await page.query_selector(config.SELECTORS["data_iframe"])
+        frame = await el.content_frame() if el else None
     except Exception:
-        pass
-    return None
+        return None
+    if frame is not None:
+        # 可选：等待 frame 内出现表格（AJAX 可能延后）
+        try:
+            await frame.wait_for_selector("table tr", timeout=3000)
+        except Exception:
+            pass
+    return frame
+
+
+_BODY_TEXT_JS = """(maxChars) => {
+    const body = document.body;
+    if (!body) return '';
+    const text = (body.innerText || '').trim();
+    return text.length > maxChars ? text.slice(0, maxChars) + '...' : text;
+}"""
 
 
 async def _extract_text_from_page(page, max_chars=10000):
-    """提取当前页面主要文本（用于无表格时的内容）。"""
-    return await page.evaluate(
-        """(maxChars) => {
-        const body = document.body;
-        if (!body) return '';
-        let text = (body.innerText || '').trim();
-        return text.length > maxChars ? text.slice(0, maxChars) + '...' : text;
-    }"""
-    )
+    """提取当前页面主要文本（用于无表格时的内容），超过 max_chars 截断。"""
+    return await page.evaluate(_BODY_TEXT_JS, max_chars)
 
 
-async def _click_and_collect(context, page, url, sheet_name, collected_urls, all_sheets):
-    """在 page 上点击入口并收集表格；若为同源链接则递归。"""
-    base_url = config.BASE_URL
-    base_domain = urlparse(base_url).netloc
+_LINKS_JS = """() => {
+    const as = Array.from(document.querySelectorAll('a[href]'));
+    return as.map(a => ({
+        text: (a.textContent || '').trim().slice(0, 80),
+        href: a.getAttribute('href')
+    }));
+}"""
+
+
+# 主页面优先点击的链接：名称正则在导入时编译一次
+_PRIORITY_PATTERNS = [(t, re.compile(re.escape(t), re.I)) for t in config.PRIORITY_LINK_TEXTS]
+
 
-    # 当前页表格（只保留有效表格）
+async def _collect_page(page, sheet_name, all_sheets):
+    """收集 page 上的有效表格；没有表格时收集正文文本。"""
     tables = await _extract_tables_from_page(page)
     if tables:
         for i, rows in enumerate(tables):
@@ -593,65 +886,485 @@ async def _click_and_collect(context, page, url, sheet_name, collected_urls, all
             if lines:
                 all_sheets.append({"sheet_name": sheet_name, "rows": [["内容"], *[[ln] for ln in lines]]})
 
-    # 同页面上的链接（仅同源且未访问过）
-    links = await page.evaluate(
-        """() => {
-        const as = Array.from(document.querySelectorAll('a[href]'));
-        return as.map(a => ({
-            text: (a.textContent || '').trim().slice(0, 80),
-            href: a.getAttribute('href')
-        }));
-    }"""
-    )
+
+def _enqueue_links(queue, links, page_url, collected_urls, default_name):
+    """把同源且未访问过的链接放入队列；collected_urls 存 _canonical_url 形式，只因 #锚点、末尾 / 或主机名大小写
+    不同的链接视为同一页面。每个链接只 urljoin、urlsplit 各一次。检查与 add 之间没有 await，单线程事件循环下无需加锁。"""
+    base = urlsplit(config.BASE_URL)
+    base_origin = (base.scheme.lower(), base.netloc.lower())
     for link in links:
-        href = link.get("href")
-        text = (link.get("text") or "").strip()
-        full_url = _normalize_href(url, href)
-        if not full_url or full_url in collected_urls:
+        full_url = _normalize_href(page_url, link.get("href"))
+        if not full_url:
             continue
-        if not _same_origin(base_url, full_url):
+        parts = urlsplit(full_url)
+        if (parts.scheme.lower(), parts.netloc.lower()) != base_origin:
             continue
-        collected_urls.add(full_url)
+        key = urlunsplit((base_origin[0], base_origin[1], parts.path.rstrip("/"), parts.query, ""))
+        if key in collected_urls:
+            continue
+        collected_urls.add(key)
+        name = re.sub(r"[^\w\u4e00-\u9fff\s-]", "", (link.get("text") or "").strip())[:30] or default_name
+        queue.put_nowait((urlunsplit(parts._replace(fragment="")), name))
+
+
+class _StaticPageParser(HTMLParser):
+    """不执行 JS 的 HTML 解析，口径与 _PAGE_TABLES_JS / _LINKS_JS 一致：table/tr/单元格按起始标签的文档顺序登记，
+    外层 table 的行、外层 tr 的单元格包含嵌套表格中的部分，单元格文本为 textContent。
+    与浏览器一样容忍省略的 </td>、</tr>。"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.tables = []  # 每个 table：行列表；每行：单元格文本片段列表的列表
+        self.links = []  # [href, 文本片段]
+        self._open_tables = []
+        self._open_rows = []  # (depth, row)
+        self._open_cells = []  # (depth, parts)
+        self._open_links = []
+
+    def _close(self, stack, depth):
+        while stack and stack[-1][0] >= depth:
+            stack.pop()
+
+    def handle_starttag(self, tag, attrs):
+        depth = len(self._open_tables)
+        if tag == "table":
+            rows = []
+            self.tables.append(rows)
+            self._open_tables.append(rows)
+        elif tag == "a":
+            href = dict(attrs).get("href")
+            if href is not None:
+                link = [href, []]
+                self.links.append(link)
+                self._open_links.append(link)
+        elif tag == "tr" and depth:
+            self._close(self._open_cells, depth)
+            self._close(self._open_rows, depth)
+            row = []
+            for rows in self._open_tables:
+                rows.append(row)
+            self._open_rows.append((depth, row))
+        elif tag in ("td", "th") and depth:
+            self._close(self._open_cells, depth)
+            parts = []
+            for _, row in self._open_rows:
+                row.append(parts)
+            self._open_cells.append((depth, parts))
+
+    def handle_endtag(self, tag):
+        depth = len(self._open_tables)
+        if tag == "a":
+            if self._open_links:
+                self._open_links.pop()
+        elif not depth:
+            return
+        elif tag in ("td", "th"):
+            self._close(self._open_cells, depth)
+        elif tag == "tr":
+            self._close(self._open_cells, depth)
+            self._close(self._open_rows, depth)
+        elif tag == "table":
+            self._close(self._open_cells, depth)
+            self._close(self._open_rows, depth)
+            self._open_tables.pop()
+
+    def handle_data(self, data):
+        for _, parts in self._open_cells:
+            parts.append(data)
+        for link in self._open_links:
+            link[1].append(data)
+
+
+_META_CHARSET = re.compile(rb"""<meta[^>]+charset=["']?([\w-]+)""", re.I)
+
+
+def _decode_html(body, content_type=""):
+    """按 Content-Type 或 <meta charset> 解码 HTML（国内站点常见 gbk/gb2312），默认 utf-8。"""
+    m = re.search(r"charset=([\w-]+)", content_type or "", re.I) or _META_CHARSET.search(body[:4096])
+    charset = m.group(1) if m else "utf-8"
+    if isinstance(charset, bytes):
+        charset = charset.decode("ascii", "ignore")
+    try:
+        return body.decode(charset, errors="replace")
+    except LookupError:
+        return body.decode("utf-8", errors="replace")
+
+
+def _parse_static_lexbor(html):
+    """用 selectolax（lexbor，C 实现）解析：与浏览器同一套 HTML 规范解析与 CSS 选择，口径同 _PAGE_TABLES_JS。"""
+    tree = LexborHTMLParser(html)
+    tables = [
+        [[cell.text(deep=True).strip() for cell in tr.css("th, td")] for tr in table.css("tr")]
+        for table in tree.css("table")
+    ]
+    links = [
+        {"text": a.text(deep=True).strip()[:80], "href": a.attributes.get("href") or ""}
+        for a in tree.css("a[href]")
+    ]
+    return tables, links
+
+
+def _parse_static_stdlib(html):
+    parser = _StaticPageParser()
+    parser.feed(html)
+    parser.close()
+    tables = [[["".join(parts).strip() for parts in row] for row in rows] for rows in parser.tables]
+    links = [{"text": "".join(parts).strip()[:80], "href": href} for href, parts in parser.links]
+    return tables, links
+
+
+def _parse_static_html(html):
+    """返回 (tables, links)：tables 与 _extract_tables_from_page 同结构（不合格的表为 None），links 同 _LINKS_JS。
+    已安装 selectolax 时用其 C 实现的解析器，否则用标准库 _StaticPageParser。"""
+    tables, links = (_parse_static_lexbor if LexborHTMLParser is not None else _parse_static_stdlib)(html)
+    return [t if t and _is_data_table(t) else None for t in tables], links
+
+
+async def _collect_static(context, url, sheet_name, all_sheets):
+    """不开浏览器页面，直接请求 HTML 解析表格与链接；有有效表格时收集并返回链接列表，
+    否则（无表格、需要 JS 渲染或请求失败）返回 None，由调用方改用浏览器打开。"""
+    try:
+        resp = await context.request.get(url, timeout=config.NAV_TIMEOUT_MS)
+        headers = resp.headers
+        if not resp.ok or "html" not in headers.get("content-type", ""):
+            return None
+        tables, links = _parse_static_html(_decode_html(await resp.body(), headers.get("content-type", "")))
+    except Exception:
+        return None
+    if not any(tables):
+        return None
+    for i, rows in enumerate(tables):
+        if rows:
+            all_sheets.append({"sheet_name": f"{sheet_name}_表格{i+1}", "rows": rows})
+    return links
+
+
+async def _crawl_links(context, start_url, links, collected_urls, all_sheets):
+    """从 start_url 页上的 links 出发，用 LINK_CONCURRENCY 个 worker 并发访问全部同源子链接（广度优先），
+    每个页面收集表格/文本后把其中的新链接继续放入队列。STATIC_FETCH_LINKS 开启时先直接请求 HTML，
+    静态内容里没有有效表格时才用浏览器打开。每个 worker 复用同一个 page 依次 goto，出错时关闭、下个链接重开。"""
+    queue = asyncio.Queue()
+    _enqueue_links(queue, links, start_url, collected_urls, "子页面")
+
+    async def close_page(page):
         try:
-            new_page = await context.new_page()
-            new_page.set_default_timeout(config.TIMEOUT_MS)
-            await new_page.goto(full_url, wait_until="domcontentloaded")
-            await asyncio.sleep(config.CLICK_WAIT_MS / 1000.0)
-            name = re.sub(r"[^\w\u4e00-\u9fff\s-]", "", text)[:30] or "页面"
-            await _click_and_collect(context, new_page, full_url, name, collected_urls, all_sheets)
-            await new_page.close()
-        except Exception as e:
-            print(f"  访问子链接失败 {full_url}: {e}")
+            await page.close()
+        except Exception:
+            pass
+
+    async def worker():
+        page = None
+        try:
+            while True:
+                url, name = await queue.get()
+                try:
+                    if getattr(config, "STATIC_FETCH_LINKS", False):
+                        found = await _collect_static(context, url, name, all_sheets)
+                        if found is not None:
+                            _enqueue_links(queue, found, url, collected_urls, "页面")
+                            continue
+                    if page is None:
+                        page = await context.new_page()
+                        page.set_default_navigation_timeout(config.NAV_TIMEOUT_MS)
+                        page.set_default_timeout(config.ACTION_TIMEOUT_MS)
+                        await block_link_page_resources(page)
+                    await page.goto(url, wait_until="domcontentloaded")
+                    await smart_wait(page, max_ms=config.CLICK_WAIT_MAX_MS)
+                    await _collect_page(page, name, all_sheets)
+                    _enqueue_links(queue, await page.evaluate(_LINKS_JS), url, collected_urls, "页面")
+                except Exception as e:
+                    print(f"  访问子链接失败 {url}: {e}")
+                    if page is not None:
+                        await close_page(page)
+                        page = None
+                finally:
+                    queue.task_done()
+        finally:
+            if page is not None:
+                await close_page(page)
+
+    workers = [asyncio.create_task(worker()) for _ in range(max(1, int(getattr(config, "LINK_CONCURRENCY", 1) or 1)))]
+    try:
+        await queue.join()
+    finally:
+        for w in workers:
+            w.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+
+def _region_cache_path():
+    return Path(config.CACHE_DIR) / "region_list.json"
+
+
+def _load_cached_regions():
+    """读取 TTL 内缓存的省份列表（按 BASE_URL 区分）；无缓存、过期或已关闭缓存时返回 None。"""
+    ttl = getattr(config, "REGION_LIST_TTL_S", 0)
+    if not ttl or ttl <= 0:
+        return None
+    try:
+        data = json.loads(_region_cache_path().read_text(encoding="utf-8"))
+        entry = data.get(config.BASE_URL) or {}
+        if time.time() - float(entry.get("ts", 0)) <= ttl and entry.get("regions"):
+            return list(entry["regions"])
+    except Exception:
+        pass
+    return None
+
+
+def _save_cached_regions(regions):
+    """写入省份列表缓存，失败不影响抓取。"""
+    if not regions or getattr(config, "REGION_LIST_TTL_S", 0) <= 0:
+        return
+    path = _region_cache_path()
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+        except Exception:
+            data = {}
+        data[config.BASE_URL] = {"ts": time.time(), "regions": list(regions)}
+        path.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+    except OSError as e:
+        print("  写入省份列表缓存失败: %s" % e)
+
+
+def _json_items(payload):
+    """取数据接口 JSON 中第一个「dict 列表」（顶层或顶层 dict 的某个值）；无法识别时返回 []。"""
+    items = None
+    if isinstance(payload, list):
+        items = payload
+    elif isinstance(payload, dict):
+        for v in payload.values():
+            if isinstance(v, list) and v and isinstance(v[0], dict):
+                items = v
+                break
+    if not items or not isinstance(items[0], dict):
+        return []
+    return items
+
+
+def _json_to_rows(payload):
+    """把数据接口返回的 JSON 转为 [表头, 数据行...]：取第一个「dict 列表」（见 _json_items），
+    表头为各 dict 键的并集（按首次出现顺序）。无法识别时返回 []。"""
+    return _items_to_rows(_json_items(payload))
+
+
+def _items_to_rows(items):
+    """dict 列表转为 [表头, 数据行...]，表头为各 dict 键的并集（按首次出现顺序）。"""
+    if not items:
+        return []
+    header = list(dict.fromkeys(k for it in items if isinstance(it, dict) for k in it))
+    rows = [["" if it.get(k) is None else str(it.get(k)) for k in header] for it in items if isinstance(it, dict)]
+    return [header] + rows
+
+
+def _record_api_request(request, seen, base_url):
+    """page.on("request") 回调：记录同源的 XHR/fetch 请求 URL（去重、最多 200 条），供配置 DATA_API_URL_TEMPLATE 参考。"""
+    if request.resource_type in ("xhr", "fetch") and _same_origin(base_url, request.url) and len(seen) < 200:
+        seen.setdefault(request.url, request.method)
+
+
+def _save_endpoints_log(endpoints):
+    """把预热时观察到的接口列表写到 ENDPOINTS_LOG_PATH，失败不影响抓取。
+    不保存 cookies：快速通道直接用当前 context.request，会话已在其中。"""
+    if not endpoints:
+        return
+    try:
+        path = Path(config.ENDPOINTS_LOG_PATH)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(
+            json.dumps([{"method": m, "url": u} for u, m in endpoints.items()], ensure_ascii=False, indent=2),
+            encoding="utf-8",
+        )
+    except Exception as e:
+        print("  保存接口列表失败: %s" % e)
+
+
+async def _fetch_api_items(request_ctx, url, limiter):
+    """请求一次数据接口，返回其中的 dict 列表（见 _json_items）；HTTP 状态非 2xx 时返回 None。"""
+    await limiter.acquire()
+    resp = await request_ctx.get(url, timeout=config.NAV_TIMEOUT_MS)
+    if not resp.ok:
+        return None
+    return _json_items(await resp.json())
+
+
+async def _fetch_api_pages(request_ctx, template, area, limiter):
+    """模板含 {page} 时：先取第 1 页，之后每批并发请求 DATA_API_PAGE_CONCURRENCY 页，按页码顺序拼接，
+    遇到空页、条数少于第 1 页（最后一页）或与第 1 页相同（接口忽略页码）即结束；任一页请求失败返回 None。"""
+    first = await _fetch_api_items(request_ctx, template.format(area=area, page=1), limiter)
+    if not first:
+        return first
+    items = list(first)
+    batch = max(1, int(getattr(config, "DATA_API_PAGE_CONCURRENCY", 1) or 1))
+    max_pages = getattr(config, "DATA_API_MAX_PAGES", 200)
+    page = 2
+    while page <= max_pages:
+        numbers = range(page, min(page + batch, max_pages + 1))
+        got_pages = await asyncio.gather(
+            *[_fetch_api_items(request_ctx, template.format(area=area, page=n), limiter) for n in numbers]
+        )
+        for got in got_pages:
+            if got is None:
+                return None
+            if not got or got == first:
+                return items
+            items.extend(got)
+            if len(got) < len(first):
+                return items
+        page += batch
+    return items
+
+
+async def _fetch_province_fast(request_ctx, province, limiter):
+    """HTTP 快速通道：用与浏览器共享 cookies 的 APIRequestContext 直接请求数据接口，返回 sheet 项或 None。
+    DATA_API_URL_TEMPLATE 含 {page} 时分页并发请求（见 _fetch_api_pages），省去浏览器里逐页点击「下一页」。"""
+    template = config.DATA_API_URL_TEMPLATE
+    area = quote(province)
+    try:
+        if "{page}" in template:
+            items = await _fetch_api_pages(request_ctx, template, area, limiter)
+        else:
+            items = await _fetch_api_items(request_ctx, template.format(area=area), limiter)
+        if items is None:
+            return None
+        rows = _items_to_rows(items)
+    except Exception as e:
+        print("  [api] 区域 %s 接口请求失败，改用浏览器: %s" % (province, e))
+        return None
+    if len(rows) < 2:
+        return None
+    print("  [api] 区域 %s: %d 行" % (province, len(rows) - 1))
+    return {"sheet_name": getattr(config, "SINGLE_SHEET_NAME", "水质实时数据"), "rows": rows, "province": province}
+
+
+async def _open_data_frame(page, base_url, limiter):
+    """（重新）打开主页并返回数据 frame；找不到时返回 None。limiter 控制对站点的导航频率。"""
+    await limiter.acquire()
+    await page.goto(base_url, wait_until="domcontentloaded")
+    await smart_wait(page, max_ms=config.NAVIGATION_WAIT_MAX_MS)
+    data_frame = await _get_data_frame(page)
+    if data_frame:
+        try:
+            await data_frame.wait_for_selector(config.SELECTORS["region_trigger"], state="visible", timeout=10000)
+        except Exception:
+            pass
+    return data_frame
+
+
+async def _scrape_region(data_frame, province, strict=False):
+    """在已打开的数据 frame 中选择省份并抓取全部分页，返回 sheet 项或 None。
+    strict=True（复用上一省份的页面）时，区域按钮文本未切换到该省份即抛 RuntimeError，避免把上一省份的数据记到本省份。"""
+    await _select_region_custom(data_frame, level1_text=province, level2_text=None)
+    applied = await _wait_for_table_refreshed(data_frame, province, wait_after_apply_ms=config.REGION_WAIT_MAX_MS)
+    if strict and not applied:
+        raise RuntimeError("区域未切换到 %s" % province)
+    # 逐页追加到以表头开头的 rows，不再先攒全部数据行再拼 [header] + rows 复制一遍
+    rows = []
+    async for header, page_rows in _iter_frame_pages(data_frame):
+        if not rows:
+            rows.append(header)
+        rows.extend(page_rows)
+    if rows:
+        print("  [iframe] 区域 %s: %d 行" % (province, len(rows) - 1))
+        return {
+            "sheet_name": getattr(config, "SINGLE_SHEET_NAME", "水质实时数据"),
+            "rows": rows,
+            "province": province,
+        }
+    print("  [iframe] 区域 %s: 无数据" % province)
+    return None
+
+
+async def _province_worker(browser, base_url, queue, limiter, on_done):
+    """prod worker：在自己的 BrowserContext 中依次处理队列里的省份，每个省份处理完调用 on_done(province, item)。
+    REUSE_FRAME_BETWEEN_PROVINCES 开启时，后续省份直接在已加载的数据 frame 里切换区域，
+    不再整页重新加载；复用失败时退回重新打开主页。使用持久化 profile 时在共享 context 中开自己的页面。
+    连续失败（抓取异常或找不到数据 frame）的次数作为 _random_wait 的重试次数，失败越多等待越长，成功后归零。"""
+    reuse = getattr(config, "REUSE_FRAME_BETWEEN_PROVINCES", True)
+    context = page = None
+    owned = False
+    data_frame = None
+    failures = 0
+    try:
+        context, owned = await _worker_context(browser)
+        page = await context.new_page()
+        page.set_default_navigation_timeout(config.NAV_TIMEOUT_MS)
+        page.set_default_timeout(config.ACTION_TIMEOUT_MS)
+        while not queue.empty():
+            province = queue.get_nowait()
+            item = None
+            failed = False
             try:
-                await new_page.close()
-            except Exception:
-                pass
+                reused = False
+                if reuse and data_frame is not None:
+                    try:
+                        item = await _scrape_region(data_frame, province, strict=True)
+                        reused = True
+                    except Exception as e:
+                        print("  [iframe] 区域 %s 复用当前页面失败，重新打开主页: %s" % (province, e))
+                if not reused:
+                    data_frame = await _open_data_frame(page, base_url, limiter)
+                    if not data_frame:
+                        print("  [iframe] 刷新后未找到数据 frame，跳过 %s" % province)
+                        failed = True
+                    else:
+                        item = await _scrape_region(data_frame, province)
+            except Exception as e:
+                print("  [iframe] 区域 %s 抓取失败: %s" % (province, e))
+                data_frame = None
+                failed = True
+            failures = failures + 1 if failed else 0
+            await on_done(province, item)
+            if not queue.empty():
+                await asyncio.sleep(getattr(config, "PROD_INTERVAL_MS", 5000) / 1000.0)
+                await _random_wait(attempt=failures)
+    except Exception as e:
+        print("  [iframe] 省份 worker 异常退出: %s" % e)
+    finally:
+        if owned:
+            await context.close()
+        elif page is not None:
+            await page.close()
+
+
+async def _scrape_provinces(browser, base_url, provinces, limiter, on_done):
+    """prod：_prod_concurrency() 个 worker 共享一个省份队列（各自一个 BrowserContext，共用同一个 browser 进程）。"""
+    queue = asyncio.Queue()
+    for province in provinces:
+        queue.put_nowait(province)
+    workers = min(_prod_concurrency(), len(provinces))
+    await asyncio.gather(*[_province_worker(browser, base_url, queue, limiter, on_done) for _ in range(workers)])
+
+
+async def _emit_province(item, on_province):
+    """on_province 非空时把省份结果交给它（在线程池中写出，不阻塞事件循环）并返回 None，否则原样返回。"""
+    if item is None or on_province is None:
+        return item
+    await asyncio.get_running_loop().run_in_executor(None, on_province, item)
+    return None
 
 
-async def run_crawl():
-    """主抓取流程：打开主页 -> 优先点击「实时数据」「发布说明」-> 遍历同源链接 -> 提取表格 -> 返回 sheets 数据。"""
+async def run_crawl(on_province=None):
+    """主抓取流程：打开主页 -> 优先点击「实时数据」「发布说明」-> 遍历同源链接 -> 提取表格 -> 返回 sheets 数据。
+    on_province(item)：prod 下每个省份抓完即回调（流式写出），该省份不再出现在返回值中。"""
     all_sheets = []
     collected_urls = set()
     base_url = config.BASE_URL
 
     async with async_playwright() as p:
-        launch_opts = {"headless": config.HEADLESS}
-        if getattr(config, "CHROMIUM_EXECUTABLE_PATH", None):
-            launch_opts["executable_path"] = config.CHROMIUM_EXECUTABLE_PATH
-        browser = await p.chromium.launch(**launch_opts)
-        context = await browser.new_context(
-            ignore_https_errors=config.IGNORE_HTTPS_ERRORS,
-            viewport={"width": 1280, "height": 800},
-            user_agent=getattr(config, "USER_AGENT", None) or None,
-            extra_http_headers=getattr(config, "EXTRA_HTTP_HEADERS", None) or {},
-        )
+        browser, context = await _launch(p)
         page = await context.new_page()
-        page.set_default_timeout(config.TIMEOUT_MS)
+        api_requests = {}
+        if config.USE_HTTP_FAST_PATH:
+            page.on("request", lambda req: _record_api_request(req, api_requests, base_url))
+        page.set_default_navigation_timeout(config.NAV_TIMEOUT_MS)
+        page.set_default_timeout(config.ACTION_TIMEOUT_MS)
 
         try:
             await page.goto(base_url, wait_until="domcontentloaded")
-            await asyncio.sleep(config.NAVIGATION_WAIT_MS / 1000.0)
-            collected_urls.add(base_url.rstrip("/"))
+            await smart_wait(page, max_ms=config.NAVIGATION_WAIT_MAX_MS)
+            collected_urls.add(_canonical_url(base_url))
 
             # 先处理主页面上的表格/内容（只保留有效表格）
             tables = await _extract_tables_from_page(page)
@@ -668,17 +1381,18 @@ async def run_crawl():
 
             # 定位并处理数据 iframe（RealDatas.html）：单 sheet 汇总 + 一级/二级区域列
             data_frame = await _get_data_frame(page)
+            if config.USE_HTTP_FAST_PATH:
+                _save_endpoints_log(api_requests)
             run_mode = getattr(config, "RUN_MODE", "test").lower()
             single_sheet_name = getattr(config, "SINGLE_SHEET_NAME", "水质实时数据")
             col1 = getattr(config, "REGION_COLUMN_1", "一级区域")
             col2 = getattr(config, "REGION_COLUMN_2", "二级区域")
-            prod_interval_ms = getattr(config, "PROD_INTERVAL_MS", 5000)
 
             unified_header = None
             unified_rows = []
 
             if not data_frame:
-                print("  [iframe] 未找到数据 frame（RealDatas），请检查页面或延长 IFRAME_WAIT_MS")
+                print("  [iframe] 未找到数据 frame（RealDatas），请检查页面或延长 IFRAME_WAIT_MAX_MS")
             else:
                 print("  [iframe] 数据 frame 已找到，RUN_MODE=%s" % run_mode)
 
@@ -687,89 +1401,96 @@ async def run_crawl():
                     若表头含「省份」则用该行「省份」作为一级区域；若含「城市/地市/地区」则作为二级区域，保证与数据一致。"""
                     nonlocal unified_header, unified_rows
                     tables_raw = await _extract_tables_from_frame(data_frame)
-                    tables_merged = _merge_header_data_tables(tables_raw or [])
-                    header, data_rows = _collect_all_data_tables(tables_merged)
+                    header, data_rows = _tables_to_rows(tables_raw)
                     if not header or not data_rows:
                         return 0
                     if unified_header is None:
                         unified_header = header + [col1, col2]
+                    columns = _region_columns(header)
                     for row in data_rows:
-                        r1, r2 = _region_from_row(row, header, level1_text, level2_text)
+                        r1, r2 = _region_from_row(row, header, level1_text, level2_text, columns)
                         unified_rows.append(row + [r1, r2])
                     return len(data_rows)
 
                 if run_mode == "prod":
-                    # 第一步：获取地域选择器中所有省份（去掉「全国」），保存成列表
-                    await asyncio.sleep(2.0)
-                    try:
-                        await data_frame.wait_for_selector("button#ddm_Area", state="visible", timeout=10000)
-                    except Exception:
-                        pass
-                    province_list_raw = await _get_region_options_after_open(data_frame)
+                    # 第一步：获取地域选择器中所有省份（去掉「全国」），保存成列表；TTL 内直接用缓存
                     nationwide = getattr(config, "REGION_OPTION", "全国")
-                    province_list = [p for p in (province_list_raw or []) if p != nationwide]
-                    if not province_list:
-                        province_list_raw, _, _ = await _get_region_options(data_frame)
+                    province_list = _load_cached_regions()
+                    if province_list:
+                        print("  [iframe] prod 使用缓存的省份列表（%s）" % _region_cache_path())
+                    else:
+                        # 区域按钮出现与默认视图表格加载同时等待，取代固定 sleep
+                        await asyncio.gather(
+                            smart_wait(data_frame, config.SELECTORS["region_trigger"], max_ms=10000),
+                            _wait_for_table_loaded(data_frame, min_rows=1),
+                        )
+                        province_list_raw = await _get_region_options_after_open(data_frame)
                         province_list = [p for p in (province_list_raw or []) if p != nationwide]
+                        if not province_list:
+                            province_list_raw, _, _ = await _get_region_options(data_frame)
+                            province_list = [p for p in (province_list_raw or []) if p != nationwide]
+                        _save_cached_regions(province_list)
                     if not province_list:
                         print("  [iframe] prod 未检测到省份列表，按全国抓取一次")
                         await _select_region_in_frame(data_frame, level1_text=config.REGION_OPTION, level2_text=None)
                         await _wait_for_table_loaded(data_frame, min_rows=5)
                         header, rows = await _scrape_frame_all_pages(data_frame)
                         if header and rows:
-                            all_sheets.append({
+                            item = await _emit_province({
                                 "sheet_name": single_sheet_name,
                                 "rows": [header] + rows,
                                 "province": config.REGION_OPTION,
-                            })
+                            }, on_province)
+                            if item:
+                                all_sheets.append(item)
                     else:
                         print("  [iframe] prod 已获取省份列表，共 %d 个（已去掉「全国」）" % len(province_list))
                         top_n = getattr(config, "PROD_TOP_N", None)
                         if top_n and top_n > 0:
                             province_list = province_list[: int(top_n)]
                             print("  [iframe] prod 仅抓取前 %d 个省份（PROD_TOP_N=%s）" % (len(province_list), top_n))
-                        # 第二步：依次刷新页面 → 选择指定省份 → 抓取数据 → 每个省份独立一项（由 main 保存成独立文件）
-                        for province in province_list:
-                            await page.goto(base_url, wait_until="domcontentloaded")
-                            await asyncio.sleep(config.NAVIGATION_WAIT_MS / 1000.0)
-                            data_frame = await _get_data_frame(page)
-                            if not data_frame:
-                                print("  [iframe] 刷新后未找到数据 frame，跳过 %s" % province)
-                                continue
-                            try:
-                                await data_frame.wait_for_selector("button#ddm_Area", state="visible", timeout=10000)
-                            except Exception:
-                                pass
-                            await _select_region_custom(data_frame, level1_text=province, level2_text=None)
-                            await _wait_for_table_refreshed(data_frame, province, wait_after_apply_ms=config.REGION_WAIT_MS)
-                            header, rows = await _scrape_frame_all_pages(data_frame)
-                            if header and rows:
-                                all_sheets.append({
-                                    "sheet_name": single_sheet_name,
-                                    "rows": [header] + rows,
-                                    "province": province,
-                                })
-                                print("  [iframe] 区域 %s: %d 行" % (province, len(rows)))
-                            else:
-                                print("  [iframe] 区域 %s: 无数据" % province)
-                            await asyncio.sleep(prod_interval_ms / 1000.0)
-                            await _random_wait()
+                        province_list = _shard(province_list)
+                        # 第二步：最多 PROD_CONCURRENCY 个 worker（且不超过 MAX_BROWSER_CONTEXTS，均共用同一个 browser 进程），
+                        # 每个 worker 一个 BrowserContext，依次打开主页 → 选择省份 → 抓取数据，后续省份复用已加载的 frame；
+                        # 每个省份独立一项（由 main 保存成独立文件），顺序与列表一致
+                        limiter = _AsyncRateLimiter(getattr(config, "PROD_PER_HOST_RPS", 0))
+                        by_province = {}
+                        done = set()
+
+                        # 接口请求单独限速（DATA_API_RPS）：共用导航限速器时分页请求会按 PROD_PER_HOST_RPS 逐个排队
+                        api_limiter = _AsyncRateLimiter(getattr(config, "DATA_API_RPS", 0))
+
+                        async def _fast_then_emit(province):
+                            item = await _fetch_province_fast(context.request, province, api_limiter)
+                            if item:
+                                done.add(province)
+                            return await _emit_province(item, on_province)
+
+                        async def _scraped(province, item):
+                            by_province[province] = await _emit_province(item, on_province)
+
+                        if config.USE_HTTP_FAST_PATH and config.DATA_API_URL_TEMPLATE:
+                            fast = await asyncio.gather(*[_fast_then_emit(province) for province in province_list])
+                            by_province = dict(zip(province_list, fast))
+                        pending = [p for p in province_list if p not in done]
+                        await _scrape_provinces(browser, base_url, pending, limiter, _scraped)
+                        all_sheets.extend(by_province[p] for p in province_list if by_province.get(p))
                 else:
                     # test：仅抓「全国」，等待表格加载完成后再抓
                     level1 = getattr(config, "REGION_OPTION", "全国")
                     await _select_region_in_frame(data_frame, level1_text=level1, level2_text=None)
-                    await asyncio.sleep(config.REGION_WAIT_MS / 1000.0)
                     l1_opts, l2_opts, _ = await _get_region_options(data_frame)
                     level2 = level1
                     if l2_opts:
+                        before = await _table_signature(data_frame)
                         try:
                             await data_frame.locator("select").nth(1).select_option(label=l2_opts[0], timeout=3000)
-                            await asyncio.sleep(config.REGION_WAIT_MS / 1000.0)
+                            await _wait_for_table_change(data_frame, before, config.REGION_WAIT_MAX_MS)
                             level2 = l2_opts[0]
                         except Exception:
                             try:
                                 await data_frame.locator("select").nth(1).select_option(index=0, timeout=3000)
-                                await asyncio.sleep(config.REGION_WAIT_MS / 1000.0)
+                                await _wait_for_table_change(data_frame, before, config.REGION_WAIT_MAX_MS)
                                 level2 = l2_opts[0]
                             except Exception:
                                 pass
@@ -786,62 +1507,21 @@ async def run_crawl():
                     print("  [iframe] 已汇总到单 sheet「%s」: 共 %d 行" % (single_sheet_name, len(unified_rows)))
 
             # 优先点击主页面「实时数据」「发布说明」等（可能切换 iframe 或跳转）
-            for link_text in config.PRIORITY_LINK_TEXTS:
+            for link_text, name_re in _PRIORITY_PATTERNS:
                 try:
-                    loc = page.get_by_role("link", name=re.compile(re.escape(link_text), re.I))
-                    await loc.first.click(timeout=1500)
-                    await asyncio.sleep(config.CLICK_WAIT_MS / 1000.0)
-                    tables = await _extract_tables_from_page(page)
-                    if tables:
-                        for i, rows in enumerate(tables):
-                            if rows and _is_data_table(rows):
-                                all_sheets.append({"sheet_name": f"{link_text}_表格{i+1}", "rows": rows})
-                    else:
-                        text = await _extract_text_from_page(page)
-                        if text.strip():
-                            lines = [line.strip() for line in text.split("\n") if line.strip()][:500]
-                            if lines:
-                                all_sheets.append({"sheet_name": link_text, "rows": [["内容"], *[[ln] for ln in lines]]})
+                    await page.get_by_role("link", name=name_re).first.click(timeout=1500)
+                    await smart_wait(page, max_ms=config.CLICK_WAIT_MAX_MS)
+                    await _collect_page(page, link_text, all_sheets)
                 except (PlaywrightTimeout, Exception) as e:
                     print(f"  未找到或点击「{link_text}」: {e}")
 
-            # 回到主页面，再收集所有同源链接并逐个访问
+            # 回到主页面，再收集所有同源链接
             await page.goto(base_url, wait_until="domcontentloaded")
-            await asyncio.sleep(config.CLICK_WAIT_MS / 1000.0)
-
-            # 收集当前页所有同源链接并逐个访问
-            links = await page.evaluate(
-                """() => {
-                const as = Array.from(document.querySelectorAll('a[href]'));
-                return as.map(a => ({
-                    text: (a.textContent || '').trim().slice(0, 80),
-                    href: a.getAttribute('href')
-                }));
-            }"""
-            )
-            for link in links:
-                href = link.get("href")
-                text = (link.get("text") or "").strip()
-                full_url = _normalize_href(base_url, href)
-                if not full_url or full_url in collected_urls:
-                    continue
-                if not _same_origin(base_url, full_url):
-                    continue
-                collected_urls.add(full_url)
-                try:
-                    new_page = await context.new_page()
-                    new_page.set_default_timeout(config.TIMEOUT_MS)
-                    await new_page.goto(full_url, wait_until="domcontentloaded")
-                    await asyncio.sleep(config.CLICK_WAIT_MS / 1000.0)
-                    name = re.sub(r"[^\w\u4e00-\u9fff\s-]", "", text)[:30] or "子页面"
-                    await _click_and_collect(context, new_page, full_url, name, collected_urls, all_sheets)
-                    await new_page.close()
-                except Exception as e:
-                    print(f"  访问子链接失败 {full_url}: {e}")
-                    try:
-                        await new_page.close()
-                    except Exception:
-                        pass
+            await smart_wait(page, max_ms=config.CLICK_WAIT_MAX_MS)
+
+            # 收集当前页所有同源链接，交给 worker 并发访问
+            links = await page.evaluate(_LINKS_JS)
+            await _crawl_links(context, base_url, links, collected_urls, all_sheets)
 
         except Exception as e:
             print(f"抓取过程出错: {e}")
@@ -852,9 +1532,9 @@ async def run_crawl():
     return all_sheets
 
 
-def run():
-    """同步入口：执行异步抓取并返回 sheets 数据。"""
-    return asyncio.run(run_crawl())
+def run(on_province=None):
+    """同步入口：执行异步抓取并返回 sheets 数据（on_province 见 run_crawl）。"""
+    return asyncio.run(run_crawl(on_province=on_province))
 
 
 if __name__ == "__main__":
@@ -1,7 +1,12 @@
 # -*- coding: utf-8 -*-
-"""将抓取结果写入 Excel。每个 sheet 对应一个页面/模块。"""
+"""将抓取结果写入 Excel（每个 sheet 对应一个页面/模块），或按 config.OUTPUT_FORMAT 写出 parquet。"""
 from pathlib import Path
 
+try:
+    import xlsxwriter
+except ImportError:
+    xlsxwriter = None
+
 try:
     import pandas as pd
 except ImportError:
@@ -9,37 +14,87 @@ except ImportError:
 
 import config
 
+# sheet 名称中 Excel 不允许的字符 -> 替换字符（一次 translate 完成）
+_SHEET_TRANS = str.maketrans({"[": "(", "]": ")", "*": "-", ":": "-", "?": "-", "/": "-", "\\": "-"})
+
 
 def to_excel(sheets_data, output_path=None):
     """
     sheets_data: list of dict:
         [ {"sheet_name": "实时数据", "rows": [["列1","列2"], ["a","b"], ...] }, ... ]
+    使用 xlsxwriter 的 constant_memory 模式逐行写出，已写出的行立即释放，不经过 pandas DataFrame。
     """
-    if pd is None:
-        raise ImportError("请安装 pandas 与 openpyxl: pip install pandas openpyxl")
-    out = output_path or Path(config.OUTPUT_DIR) / config.OUTPUT_EXCEL
-    out = Path(out)
+    if xlsxwriter is None:
+        raise ImportError("请安装 xlsxwriter: pip install xlsxwriter")
+    out = Path(output_path) if output_path else config.OUTPUT_EXCEL_PATH
     out.parent.mkdir(parents=True, exist_ok=True)
 
     used_names = set()
-    with pd.ExcelWriter(out, engine="openpyxl") as writer:
+    wb = xlsxwriter.Workbook(str(out), {"constant_memory": True, "strings_to_urls": False})
+    try:
         for item in sheets_data:
             name = item.get("sheet_name", "Sheet")
             rows = item.get("rows", [])
             # 限制 sheet 名称长度与非法字符，并保证唯一
-            base = name[:28].replace("[", "(").replace("]", ")").replace("*", "-").replace(":", "-").replace("?", "-").replace("/", "-").replace("\\", "-")
+            base = name[:28].translate(_SHEET_TRANS)
             safe_name = base
             n = 0
             while safe_name in used_names:
                 n += 1
                 safe_name = f"{base[:24]}_{n}"[:31]
             used_names.add(safe_name)
+            ws = wb.add_worksheet(safe_name)
             if not rows:
-                pd.DataFrame([["(无数据)"]]).to_excel(writer, sheet_name=safe_name, index=False, header=False)
-            else:
-                # 统一列数：部分表格首行与数据行列数不一致会导致 pandas 报错，按最大列数补齐
-                max_cols = max(len(r) for r in rows)
-                padded = [list(r) + [""] * (max_cols - len(r)) for r in rows]
-                df = pd.DataFrame(padded[1:], columns=padded[0])
-                df.to_excel(writer, sheet_name=safe_name, index=False)
+                ws.write(0, 0, "(无数据)")
+                continue
+            # 先扫一遍全部数据行找出含日期的列（首行可能为空值/字符串），之后整行 write_row，避免逐单元格 write
+            date_cols = {i for row in rows[1:] for i, v in enumerate(row) if hasattr(v, "isoformat")}
+            # 各行列数可不一致（xlsxwriter 按行写入，无需像 DataFrame 那样按最大列数补齐）
+            for r_i, row in enumerate(rows):
+                if date_cols and r_i > 0:
+                    row = [v.isoformat() if i in date_cols and hasattr(v, "isoformat") else v for i, v in enumerate(row)]
+                ws.write_row(r_i, 0, row)
+    finally:
+        wb.close()
+    return str(out)
+
+
+def _column_names(header, width):
+    """表头转为唯一列名，规则与 pandas.read_excel 一致（空 -> Unnamed: i，重复 -> name.1），
+    使 geo_search 把该文件当作旁路缓存读取时列名与读 xlsx 相同。"""
+    names, seen = [], {}
+    for i in range(width):
+        v = header[i] if i < len(header) else None
+        name = str(v).strip() if v not in (None, "") else f"Unnamed: {i}"
+        base = name
+        while name in seen:
+            seen[base] += 1
+            name = f"{base}.{seen[base]}"
+        seen[name] = 0
+        names.append(name)
+    return names
+
+
+def to_parquet(sheets_data, output_path):
+    """
+    sheets_data 同 to_excel；每个 sheet 首行为表头，合并为一张表写出（多个 sheet 时增加 sheet_name 列）。
+    压缩方式取 config.PARQUET_COMPRESSION，需要 pyarrow 或 fastparquet。
+    """
+    if pd is None:
+        raise ImportError("请安装 pandas 与 pyarrow: pip install pandas pyarrow")
+    out = Path(output_path)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    frames = []
+    for item in sheets_data:
+        rows = item.get("rows", [])
+        if not rows:
+            continue
+        width = max(len(r) for r in rows)
+        body = [list(r) + [None] * (width - len(r)) for r in rows[1:]]
+        df = pd.DataFrame(body, columns=_column_names(rows[0], width))
+        if len(sheets_data) > 1:
+            df.insert(0, "sheet_name", item.get("sheet_name", "Sheet"))
+        frames.append(df)
+    df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    df.to_parquet(out, index=False, compression=config.PARQUET_COMPRESSION)
     return str(out)
@@ -1,9 +1,25 @@
-import requests
+import heapq
+import math
+from pathlib import Path
+
 from geopy.distance import geodesic
 
+from amap_http import make_session
+
 # 配置你的高德地图 Key
 AMAP_KEY = '88daf6da379071667d2a1cd2d8efb861'
 
+# 高德响应磁盘缓存（安装 requests-cache 时生效），与 geo_search 共用同一文件
+_HTTP_CACHE = Path(__file__).resolve().parent.parent / 'output' / 'amap_http_cache.sqlite'
+_SESSION = None
+
+def _session():
+    """首次请求时创建会话：keep-alive 连接复用 + 磁盘缓存。"""
+    global _SESSION
+    if _SESSION is None:
+        _SESSION = make_session(_HTTP_CACHE)
+    return _SESSION
+
 def get_coordinates(address):
     """
     1. 地名转经纬度 (Geocoding)
@@ -18,7 +34,7 @@ def get_coordinates(address):
     }
     
     try:
-        response = requests.get(url, params=params)
+        response = _session().get(url, params=params, timeout=8)
         data = response.json()
         
         if data['status'] == '1' and data['geocodes']:
@@ -34,6 +50,17 @@ def get_coordinates(address):
         print(f"请求异常: {e}")
         return None
 
+_SHORTLIST = 5  # 进入 geodesic 精算的候选数；球面与椭球面距离相差 <0.5%，5 个候选足以覆盖排序差异
+
+def _hav(lat1, lon1, lat2, lon2):
+    """球面 Haversine 距离（km），与 geo_search.haversine_km 一致。"""
+    R = 6371.0
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = math.radians(lat2 - lat1)
+    dlam = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlam / 2) ** 2
+    return 2 * R * math.asin(math.sqrt(min(1.0, a)))
+
 def find_nearest_location(target_coord, location_list):
     """
     2. 计算最近距离
@@ -43,17 +70,24 @@ def find_nearest_location(target_coord, location_list):
     if not target_coord or not location_list:
         return None
     
+    # 先用球面 Haversine 粗筛出最近的几个候选，再只对候选计算较慢的 geodesic（椭球面精确距离）
+    lat0, lon0 = target_coord
+    dists = [_hav(lat0, lon0, item['coord'][0], item['coord'][1]) for item in location_list]
+    shortlist = heapq.nsmallest(_SHORTLIST, range(len(dists)), key=dists.__getitem__)
+
     nearest_item = None
     min_distance = float('inf')
-    
-    for item in location_list:
-        # 使用 geodesic 计算大圆距离（考虑地球曲率，比勾股定理精确）
+
+    for i in shortlist:
+        item = location_list[i]
         dist = geodesic(target_coord, item['coord']).kilometers
-        
+
         if dist < min_distance:
             min_distance = dist
             nearest_item = item
-            
+            if dist == 0:
+                break  # 坐标重合，不可能更近
+
     return {
         "nearest_info": nearest_item,
         "distance_km": round(min_distance, 3)
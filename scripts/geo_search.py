@@ -34,6 +34,7 @@
     --top N       返回最近 N 条，默认 10
     --scheme      地理编码方案: amap(高德,需 AMAP_KEY) | offline(CSV)
     --build-cache 对全部唯一地址建坐标缓存并写入 output/geo_cache.json
+    --workers N   与 --build-cache 同用时并发请求数，默认环境变量 AMAP_MAX_WORKERS（4）
     --geocode ADDRESS  仅将地址转成坐标并打印（用于测试地理编码）
     --distance A B    给定两个地点描述，分别转坐标后计算距离(km)
     --serve       启动 HTTP 服务
@@ -42,8 +43,9 @@
 二、HTTP 接口（--serve 启动后）
 -----------------------------
   GET /nearest
-  查询参数: place(必填), top(可选), scheme(可选, 默认 amap)
+  查询参数: place(必填), top(可选), scheme(可选, 默认 amap), format(可选, ndjson 时流式返回)
   返回: JSON，{ "place": "...", "count": N, "results": [ { 记录字段, "_distance_km": 距离km }, ... ] }
+        format=ndjson 时为 application/x-ndjson：首行 {"place","count"}，其后每行一条记录
 
   GET /distance
   查询参数: place_a(必填), place_b(必填), scheme(可选, 默认 amap)
@@ -68,10 +70,14 @@
 from __future__ import annotations
 
 import argparse
+import functools
 import json
 import math
 import os
 import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from pathlib import Path
 
 # 脚本目录加入 path，便于同目录 import
@@ -87,68 +93,177 @@ try:
 except ImportError:
     pd = None
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    from scipy.spatial import cKDTree  # 可选：最近邻查询 O(log N)
+except ImportError:
+    cKDTree = None
+
+try:
+    import python_calamine  # 可选：Rust 实现的 xlsx 读取器（pandas engine="calamine"），未安装时用 openpyxl
+except ImportError:
+    python_calamine = None
+
+try:
+    import orjson  # 可选：更快的 JSON 序列化，未安装时用标准库 json
+except ImportError:
+    orjson = None
+
+try:
+    import amap_http  # 依赖 requests
+except ImportError:
+    amap_http = None
+
 # ---------------------------------------------------------------------------
 # 配置
 # ---------------------------------------------------------------------------
-OUTPUT_DIR = Path(config.OUTPUT_DIR)
+OUTPUT_DIR = config.OUTPUT_DIR
 GEO_CACHE_JSON = OUTPUT_DIR / "geo_cache.json"   # 方案 A/B 的地址 -> (lat, lon) 缓存
 GEO_CACHE_CSV = OUTPUT_DIR / "geo_cache.csv"     # 方案 C 离线表：address, lat, lon
+AMAP_HTTP_CACHE = OUTPUT_DIR / "amap_http_cache.sqlite"  # 高德响应的磁盘缓存（需 requests-cache）
 DATA_GLOB = "water_info_*.xlsx"                  # 数据文件匹配
+SEARCH_RADIUS_KM = 500.0                         # search_nearest 包围盒粗筛半径（km），盒内不足 top 条时全量计算
 
 # 用于拼地址的列（按优先级，存在则用）
 ADDRESS_COLUMNS = ["省份", "城市", "地市", "地区", "断面名称", "流域"]
 
 # 高德 API（方案 B）需配置 key，否则跳过
 AMAP_KEY = os.environ.get("AMAP_KEY", "88daf6da379071667d2a1cd2d8efb861")
+AMAP_GEO_URL = "https://restapi.amap.com/v3/geocode/geo"
+# 批量地理编码（--build-cache）的并发请求数上限；高德按 key 限 QPS，不宜过大
+AMAP_MAX_WORKERS = int(os.environ.get("AMAP_MAX_WORKERS", "4"))
+# 每秒最多发出的高德请求数（所有线程共享一个限速器）；个人 key 的地理编码配额一般为数十 QPS
+AMAP_QPS = float(os.environ.get("AMAP_QPS", "10"))
+AMAP_MAX_RETRIES = 3                               # 429 / QPS 超限 / 网络异常时的重试次数
+AMAP_QPS_INFOCODES = {"10019", "10020", "10021"}   # 高德返回的 QPS/并发超限错误码，可重试
+
+
+class _Limiter:
+    """线程安全的最小间隔限速器：每次调用按 1/qps 的间隔排队，到点前 sleep。"""
+
+    def __init__(self, qps: float):
+        self.min_dt = 1.0 / qps if qps > 0 else 0.0
+        self.lock = threading.Lock()
+        self.next = 0.0
+
+    def __call__(self) -> None:
+        with self.lock:
+            now = time.monotonic()
+            wait = self.next - now
+            self.next = max(now, self.next) + self.min_dt
+        if wait > 0:
+            time.sleep(wait)
+
+
+_AMAP_LIMITER = _Limiter(AMAP_QPS)
+
+
+_AMAP_HTTP = None
+_AMAP_HTTP_LOCK = threading.Lock()
+
+
+def _amap_session():
+    """首次调用时才创建高德 HTTP 会话（import 本模块不会生成缓存文件）；未安装 requests 时返回 None，退回 urllib。"""
+    global _AMAP_HTTP
+    if _AMAP_HTTP is None and amap_http is not None:
+        with _AMAP_HTTP_LOCK:
+            if _AMAP_HTTP is None:
+                _AMAP_HTTP = amap_http.make_session(AMAP_HTTP_CACHE, limiter=_AMAP_LIMITER)
+    return _AMAP_HTTP
+
 
 
 # ---------------------------------------------------------------------------
 # 高德地图 Web 服务 API（国内精度好，需 AMAP_KEY）
 # ---------------------------------------------------------------------------
+def _amap_request(address: str) -> tuple[int, dict]:
+    """发出一次高德地理编码请求，返回 (HTTP 状态码, JSON)。"""
+    session = _amap_session()
+    if session is not None:
+        resp = session.get(AMAP_GEO_URL, params={"key": AMAP_KEY, "address": address}, timeout=8)
+        return resp.status_code, (resp.json() if resp.status_code == 200 else {})
+    import urllib.error
+    import urllib.request
+    import urllib.parse
+    q = urllib.parse.quote(address)
+    url = f"{AMAP_GEO_URL}?key={AMAP_KEY}&address={q}"
+    req = urllib.request.Request(url)
+    _AMAP_LIMITER()
+    try:
+        with urllib.request.urlopen(req, timeout=8) as resp:
+            return resp.status, json.load(resp)  # json 直接解析 UTF-8 bytes，省去 decode() 的中间 str
+    except urllib.error.HTTPError as e:
+        return e.code, {}
+
+
 def geocode_amap(address: str) -> tuple[float, float] | None:
+    """高德地理编码。请求经共享限速器排队；遇 HTTP 429、QPS 超限错误码或网络异常时指数退避重试，
+    其余失败（地址无法解析等）直接返回 None。"""
     if not AMAP_KEY:
         return None
-    try:
-        import urllib.request
-        import urllib.parse
-        q = urllib.parse.quote(address)
-        url = f"https://restapi.amap.com/v3/geocode/geo?key={AMAP_KEY}&address={q}"
-        req = urllib.request.Request(url)
-        with urllib.request.urlopen(req, timeout=8) as resp:
-            data = json.loads(resp.read().decode())
-        if data.get("status") == "1" and data.get("geocodes"):
-            loc = data["geocodes"][0]["location"]
-            lon, lat = map(float, loc.split(","))
+    for attempt in range(AMAP_MAX_RETRIES + 1):
+        try:
+            code, data = _amap_request(address)
+        except Exception:
+            code, data = None, {}
+        if data.get("status") == "1":
+            if not data.get("geocodes"):
+                return None
+            try:
+                loc = data["geocodes"][0]["location"]
+                lon, lat = map(float, loc.split(","))
+            except (KeyError, IndexError, TypeError, ValueError):
+                return None
             return (lat, lon)
-    except Exception:
-        pass
+        retryable = code is None or code == 429 or data.get("infocode") in AMAP_QPS_INFOCODES
+        if not retryable or attempt == AMAP_MAX_RETRIES:
+            return None
+        time.sleep(2 ** attempt)
     return None
 
 
 # ---------------------------------------------------------------------------
 # 离线 CSV 表（address, lat, lon），无网络、无 key
 # ---------------------------------------------------------------------------
-def load_offline_cache() -> dict[str, tuple[float, float]]:
-    path = GEO_CACHE_CSV
+def _file_key(path: Path) -> tuple:
+    """文件缓存键：路径 + mtime + 大小；文件不存在时 mtime 为 None。"""
+    try:
+        st = path.stat()
+        return (str(path), st.st_mtime_ns, st.st_size)
+    except OSError:
+        return (str(path), None, 0)
+
+
+@functools.lru_cache(maxsize=4)
+def _load_offline_cached(key: tuple) -> dict[str, tuple[float, float]]:
+    path = Path(key[0])
     out = {}
-    if not path.exists():
+    if key[1] is None:
         return out
     try:
         df = pd.read_csv(path, encoding="utf-8")
         if "address" not in df.columns or "lat" not in df.columns or "lon" not in df.columns:
             return out
-        for _, row in df.iterrows():
-            addr = str(row["address"]).strip()
-            try:
-                lat, lon = float(row["lat"]), float(row["lon"])
-                out[addr] = (lat, lon)
-            except (ValueError, TypeError):
-                continue
+        # 按列整体转换，坐标无法转成数字的行丢弃
+        lats = pd.to_numeric(df["lat"], errors="coerce")
+        lons = pd.to_numeric(df["lon"], errors="coerce")
+        ok = lats.notna() & lons.notna()
+        addrs = df.loc[ok, "address"].astype(str).str.strip()
+        out = dict(zip(addrs, zip(lats[ok].astype(float), lons[ok].astype(float))))
     except Exception:
         pass
     return out
 
 
+def load_offline_cache() -> dict[str, tuple[float, float]]:
+    """读取离线坐标表；按文件 mtime 缓存解析结果，文件未变时直接复用（返回的 dict 为共享对象，勿修改）。"""
+    return _load_offline_cached(_file_key(GEO_CACHE_CSV))
+
+
 def geocode_offline(address: str, cache: dict[str, tuple[float, float]]) -> tuple[float, float] | None:
     # 精确匹配
     if address in cache:
@@ -181,50 +296,108 @@ def geocode(scheme: str, address: str, cache: dict | None = None) -> tuple[float
     return coord
 
 
-def load_json_cache() -> dict[str, list[float]]:
-    if not GEO_CACHE_JSON.exists():
+@functools.lru_cache(maxsize=4)
+def _load_json_cached(key: tuple) -> dict[str, tuple[float, float]]:
+    if key[1] is None:
         return {}
     try:
-        with open(GEO_CACHE_JSON, "r", encoding="utf-8") as f:
+        with open(key[0], "r", encoding="utf-8") as f:
             data = json.load(f)
         return {k: tuple(v) for k, v in data.items()}
     except Exception:
         return {}
 
 
+def load_json_cache() -> dict[str, list[float]]:
+    """读取 geo_cache.json；按文件 mtime 缓存解析结果，返回副本供调用方写入。"""
+    return dict(_load_json_cached(_file_key(GEO_CACHE_JSON)))
+
+
 def save_json_cache(cache: dict[str, tuple[float, float]]) -> None:
     OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+    data = {k: [c[0], c[1]] for k, c in cache.items()}
+    if orjson is not None:
+        GEO_CACHE_JSON.write_bytes(orjson.dumps(data, option=orjson.OPT_INDENT_2))
+        return
     with open(GEO_CACHE_JSON, "w", encoding="utf-8") as f:
-        json.dump({k: [c[0], c[1]] for k, c in cache.items()}, f, ensure_ascii=False, indent=2)
+        json.dump(data, f, ensure_ascii=False, indent=2)
 
 
 # ---------------------------------------------------------------------------
 # 数据加载：从 output/water_info_*.xlsx 读入所有记录
 # ---------------------------------------------------------------------------
-def _row_address(row: dict, columns: list[str]) -> str:
-    parts = []
+def _address_series(df, columns: list[str]):
+    """按列拼接地址（跳过空值与空白），返回与 df 等长的字符串 Series。"""
+    addr = pd.Series("", index=df.index, dtype=object)
     for col in columns:
-        if col in row and pd.notna(row[col]) and str(row[col]).strip():
-            parts.append(str(row[col]).strip())
-    return "".join(parts) if parts else ""
+        if col not in df.columns:
+            continue
+        part = df[col].astype(str).str.strip().where(df[col].notna(), "")
+        addr = addr + part
+    return addr
+
+
+def _read_excel(path: Path):
+    """读取 xlsx 首个 sheet：已安装 python-calamine 时用 calamine 引擎（比 openpyxl 快数倍、内存占用小），
+    引擎不可用（如 pandas < 2.2）时退回默认引擎。"""
+    if python_calamine is not None:
+        try:
+            return pd.read_excel(path, sheet_name=0, engine="calamine")
+        except ValueError:
+            pass
+    return pd.read_excel(path, sheet_name=0)
+
+
+def _read_table(path: Path):
+    """读取数据文件首个 sheet。优先读同名 .parquet 旁路文件（比 xlsx 快一个数量级）；
+    旁路文件缺失或比 xlsx 旧时读 xlsx 并重新生成。未安装 pyarrow 等 parquet 引擎时只读 xlsx。"""
+    pq = path.with_suffix(".parquet")
+    try:
+        if pq.exists() and pq.stat().st_mtime >= path.stat().st_mtime:
+            return pd.read_parquet(pq)
+    except Exception:
+        pass
+    df = _read_excel(path)
+    tmp = pq.with_name(pq.name + ".tmp")
+    try:
+        df.to_parquet(tmp, index=False)
+        os.replace(tmp, pq)
+    except Exception:
+        # 无 parquet 引擎或列类型混杂无法转换，下次仍读 xlsx
+        try:
+            tmp.unlink()
+        except OSError:
+            pass
+    return df
+
+
+def _load_one(path: Path) -> list[dict]:
+    """读取单个数据文件为记录列表（每条附 _address、_source_file）；读取失败返回空列表。"""
+    try:
+        df = _read_table(path)
+    except Exception:
+        return []
+    addrs = _address_series(df, ADDRESS_COLUMNS).tolist()
+    rows = df.to_dict(orient="records")
+    for r, addr in zip(rows, addrs):
+        r["_address"] = addr
+        r["_source_file"] = path.name
+    return rows
 
 
 def load_all_records() -> list[dict]:
     if pd is None:
         raise ImportError("请安装 pandas: pip install pandas openpyxl")
+    paths = sorted(OUTPUT_DIR.glob(DATA_GLOB))
     records = []
-    for path in sorted(OUTPUT_DIR.glob(DATA_GLOB)):
-        try:
-            df = pd.read_excel(path, sheet_name=0)
-            cols = list(df.columns)
-            for _, row in df.iterrows():
-                r = row.to_dict()
-                addr = _row_address(r, ADDRESS_COLUMNS)
-                r["_address"] = addr
-                r["_source_file"] = path.name
-                records.append(r)
-        except Exception:
-            continue
+    if len(paths) <= 1:
+        for path in paths:
+            records.extend(_load_one(path))
+        return records
+    # 各省文件互相独立，openpyxl 解析为 CPU 密集型，多进程并行读取；map 保持文件顺序
+    with ProcessPoolExecutor(max_workers=min(len(paths), os.cpu_count() or 1)) as ex:
+        for recs in ex.map(_load_one, paths):
+            records.extend(recs)
     return records
 
 
@@ -241,9 +414,128 @@ def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
     return R * c
 
 
+def haversine_km_many(qlat: float, qlon: float, lats, lons):
+    """向量化 Haversine：查询点到一批坐标的距离数组（km），需 numpy。"""
+    R = 6371.0
+    phi1 = np.radians(qlat)
+    phi2 = np.radians(lats)
+    dphi = phi2 - phi1
+    dlam = np.radians(lons - qlon)
+    a = np.sin(dphi / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(dlam / 2) ** 2
+    return 2 * R * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
 # ---------------------------------------------------------------------------
 # 最近记录查询
 # ---------------------------------------------------------------------------
+def _resolve_coords(records: list[dict], scheme: str, cache: dict | None) -> tuple[list[dict], list[tuple[float, float]]]:
+    """为每条记录解析坐标（用 _address），返回 (有坐标的记录, 对应坐标)。"""
+    matched, coords = [], []
+    offline_cache = load_offline_cache() if scheme == "offline" else None
+    for r in records:
+        addr = r.get("_address", "")
+        if not addr:
+            continue
+        if scheme == "offline":
+            coord = geocode_offline(addr, offline_cache or {})
+        else:
+            coord = geocode(scheme, addr, cache)
+        if coord is None:
+            continue
+        matched.append(r)
+        coords.append(coord)
+    return matched, coords
+
+
+def _unit_xyz(lats, lons):
+    """经纬度（度）投影到单位球面三维坐标；球面上弦长与大圆距离单调一致，KD-tree 的欧氏近邻即球面近邻。"""
+    phi = np.radians(lats)
+    lam = np.radians(lons)
+    cos_phi = np.cos(phi)
+    return np.stack([cos_phi * np.cos(lam), cos_phi * np.sin(lam), np.sin(phi)], axis=-1)
+
+
+class _SearchState:
+    """预先解析好坐标的记录集：records 与 coords 一一对应，lats/lons 为 numpy 数组（无 numpy 时为 None）。"""
+
+    def __init__(self, records: list[dict], coords: list[tuple[float, float]]):
+        self.records = records
+        self.coords = coords
+        self.tree = None
+        if np is not None:
+            self.lats = np.fromiter((c[0] for c in coords), dtype=np.float64, count=len(coords))
+            self.lons = np.fromiter((c[1] for c in coords), dtype=np.float64, count=len(coords))
+            if cKDTree is not None and coords:
+                self.tree = cKDTree(_unit_xyz(self.lats, self.lons))
+        else:
+            self.lats = self.lons = None
+
+
+_STATES: dict[str, tuple[tuple, _SearchState]] = {}
+_STATES_LOCK = threading.Lock()
+
+
+def _state_key(scheme: str) -> tuple:
+    """数据文件与坐标缓存文件的 (路径, mtime, 大小)，任一变化即需重建。"""
+    data = tuple(_file_key(p) for p in sorted(OUTPUT_DIR.glob(DATA_GLOB)))
+    return data, _file_key(GEO_CACHE_CSV if scheme == "offline" else GEO_CACHE_JSON)
+
+
+def _get_state(scheme: str) -> _SearchState:
+    """返回该方案下全部记录的坐标状态；文件未变时跨调用复用（--serve 下每次请求只需算距离）。"""
+    key = _state_key(scheme)
+    with _STATES_LOCK:
+        hit = _STATES.get(scheme)
+        if hit is not None and hit[0] == key:
+            return hit[1]
+        cache = load_json_cache() if scheme != "offline" else None
+        state = _SearchState(*_resolve_coords(load_all_records(), scheme, cache))
+        _STATES[scheme] = (key, state)
+        return state
+
+
+def _nearest(state: _SearchState, qlat: float, qlon: float, top: int) -> list[tuple[dict, float]]:
+    if not state.records or top <= 0:
+        return []
+    if state.lats is None:
+        results = [(r, haversine_km(qlat, qlon, lat, lon)) for r, (lat, lon) in zip(state.records, state.coords)]
+        results.sort(key=lambda x: x[1])
+        return results[: top]
+
+    if state.tree is not None:
+        # KD-tree 按弦长取最近 top 个（已按距离升序），再对这几个算 Haversine 距离
+        k = min(top, len(state.records))
+        _, idx = state.tree.query(_unit_xyz(qlat, qlon), k=k)
+        idx = np.atleast_1d(idx)
+        dists = haversine_km_many(qlat, qlon, state.lats[idx], state.lons[idx])
+        return [(state.records[i], float(d)) for i, d in zip(idx.tolist(), dists.tolist())]
+
+    # 无 scipy 时先用经纬度包围盒（覆盖查询点 SEARCH_RADIUS_KM 内的全部球面点）粗筛，只对盒内记录算三角函数；
+    # 盒内不足 top 条或第 top 近已超出半径时，盒外可能有更近的点，退回全量计算
+    r = SEARCH_RADIUS_KM / 6371.0
+    lat_tol = math.degrees(r)
+    s = math.sin(r) / max(1e-12, math.cos(math.radians(qlat)))
+    lon_tol = math.degrees(math.asin(s)) if s < 1 else 180.0
+    dlon = np.abs((state.lons - qlon + 180.0) % 360.0 - 180.0)
+    cand = np.flatnonzero((np.abs(state.lats - qlat) <= lat_tol) & (dlon <= lon_tol))
+    if len(cand) >= top:
+        picked = _top_k(haversine_km_many(qlat, qlon, state.lats[cand], state.lons[cand]), top)
+        if picked[-1][1] <= SEARCH_RADIUS_KM:
+            return [(state.records[cand[i]], d) for i, d in picked]
+    picked = _top_k(haversine_km_many(qlat, qlon, state.lats, state.lons), top)
+    return [(state.records[i], d) for i, d in picked]
+
+
+def _top_k(dists, top: int) -> list[tuple[int, float]]:
+    """距离数组中最小的 top 个 (下标, 距离)，按距离升序；只对这 top 个排序（argpartition 为 O(N)）。"""
+    if top < len(dists):
+        idx = np.argpartition(dists, top - 1)[:top]
+    else:
+        idx = np.arange(len(dists))
+    idx = idx[np.argsort(dists[idx], kind="stable")]
+    return [(int(i), float(dists[i])) for i in idx]
+
+
 def search_nearest(
     place_name: str,
     top: int = 10,
@@ -253,10 +545,9 @@ def search_nearest(
 ) -> list[tuple[dict, float]]:
     """
     输入地名，返回物理距离最近的 top 条记录。
+    未传 records 时使用按文件 mtime 缓存的全量坐标状态（见 _get_state）。
     返回: [(record, distance_km), ...]
     """
-    if records is None:
-        records = load_all_records()
     if cache is None and scheme != "offline":
         cache = load_json_cache()
 
@@ -269,25 +560,11 @@ def search_nearest(
     if scheme != "offline":
         cache[place_name] = query_coord
 
-    # 为每条记录解析坐标（用 _address）
-    results = []
-    offline_cache = load_offline_cache() if scheme == "offline" else None
-    for r in records:
-        addr = r.get("_address", "")
-        if not addr:
-            continue
-        if scheme == "offline":
-            coord = geocode_offline(addr, offline_cache or {})
-        else:
-            coord = geocode(scheme, addr, cache)
-        if coord is None:
-            continue
-        lat, lon = coord
-        dist = haversine_km(qlat, qlon, lat, lon)
-        results.append((r, dist))
-
-    results.sort(key=lambda x: x[1])
-    return results[: top]
+    if records is None:
+        state = _get_state(scheme)
+    else:
+        state = _SearchState(*_resolve_coords(records, scheme, cache))
+    return _nearest(state, qlat, qlon, top)
 
 
 # ---------------------------------------------------------------------------
@@ -330,23 +607,97 @@ def distance_between(
 # ---------------------------------------------------------------------------
 # 构建缓存：对全部唯一地址做地理编码并写入 geo_cache.json
 # ---------------------------------------------------------------------------
-def build_cache(scheme: str = "amap") -> None:
+def build_cache(scheme: str = "amap", max_workers: int | None = None) -> None:
+    max_workers = max(1, max_workers or AMAP_MAX_WORKERS)
     records = load_all_records()
     addrs = set(r.get("_address", "") for r in records if r.get("_address"))
     cache = load_json_cache()
     total = len(addrs)
-    for i, addr in enumerate(sorted(addrs)):
-        if addr in cache:
-            continue
-        coord = geocode(scheme, addr, cache)
-        if coord:
-            cache[addr] = coord
-        if (i + 1) % 10 == 0:
-            print("  已处理 %d / %d 个地址" % (i + 1, total))
+    todo = [a for a in sorted(addrs) if a not in cache]
+    done = total - len(todo)
+    # 地理编码为网络 I/O，线程池并发请求；结果只在主线程合并进 cache，无需加锁
+    with ThreadPoolExecutor(max_workers=max_workers) as ex:
+        futures = {ex.submit(geocode, scheme, a): a for a in todo}
+        for f in as_completed(futures):
+            coord = f.result()
+            if coord:
+                cache[futures[f]] = coord
+            done += 1
+            if done % 10 == 0:
+                print("  已处理 %d / %d 个地址" % (done, total))
+            if done % 500 == 0:
+                save_json_cache(cache)
     save_json_cache(cache)
     print("  缓存已写入: %s（共 %d 条）" % (GEO_CACHE_JSON, len(cache)))
 
 
+# ---------------------------------------------------------------------------
+# HTTP 接口（--serve）
+# ---------------------------------------------------------------------------
+def _record_json(r: dict, dist: float) -> dict:
+    """记录转为可 JSON 序列化的 dict：去掉 _ 开头的内部字段，空值转 None，附距离。"""
+    rec = {k: (v if pd.notna(v) else None) for k, v in r.items() if not k.startswith("_")}
+    rec["_distance_km"] = round(dist, 4)
+    return rec
+
+
+def create_app():
+    """创建 Flask 应用（需 flask，未安装时抛 ImportError）。"""
+    from flask import Flask, Response, request, jsonify, stream_with_context
+    from flask.json.provider import DefaultJSONProvider
+
+    app = Flask(__name__)
+    if orjson is not None:
+        class _OrjsonProvider(DefaultJSONProvider):
+            """jsonify 改用 orjson；日期等非原生类型仍交给 Flask 默认的 default 处理，输出格式不变。"""
+            _OPTS = orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+            def dumps(self, obj, **kwargs):
+                return orjson.dumps(obj, default=self.default, option=self._OPTS).decode()
+
+            def loads(self, s, **kwargs):
+                return orjson.loads(s)
+
+        app.json = _OrjsonProvider(app)
+
+    @app.route("/nearest")
+    def api_nearest():
+        place = request.args.get("place", "").strip()
+        top = int(request.args.get("top", 10))
+        scheme = request.args.get("scheme", "amap")
+        if not place:
+            return jsonify({"error": "缺少 place 参数"}), 400
+        results = search_nearest(place, top=top, scheme=scheme)
+        if request.args.get("format") == "ndjson":
+            # 流式输出：首行为 {place, count}，之后每行一条记录，大 top 时服务端无需缓冲整个响应
+            def gen():
+                yield app.json.dumps({"place": place, "count": len(results)}) + "\n"
+                for r, dist in results:
+                    yield app.json.dumps(_record_json(r, dist)) + "\n"
+            return Response(stream_with_context(gen()), mimetype="application/x-ndjson")
+        out = [_record_json(r, dist) for r, dist in results]
+        return jsonify({"place": place, "count": len(out), "results": out})
+
+    @app.route("/distance")
+    def api_distance():
+        place_a = request.args.get("place_a", "").strip()
+        place_b = request.args.get("place_b", "").strip()
+        scheme = request.args.get("scheme", "amap")
+        if not place_a or not place_b:
+            return jsonify({"error": "缺少 place_a 或 place_b 参数"}), 400
+        dist_km, coord_a, coord_b = distance_between(place_a, place_b, scheme=scheme)
+        if dist_km is None:
+            return jsonify({"error": "无法解析坐标", "place_a": place_a, "place_b": place_b}), 400
+        return jsonify({
+            "place_a": place_a, "place_b": place_b,
+            "coord_a": [round(coord_a[0], 6), round(coord_a[1], 6)] if coord_a else None,
+            "coord_b": [round(coord_b[0], 6), round(coord_b[1], 6)] if coord_b else None,
+            "distance_km": round(dist_km, 4),
+        })
+
+    return app
+
+
 # ---------------------------------------------------------------------------
 # CLI
 # ---------------------------------------------------------------------------
@@ -357,6 +708,8 @@ def main() -> int:
     parser.add_argument("--scheme", choices=["amap", "offline"], default="amap",
                         help="地理编码方案: amap(高德,需 AMAP_KEY) | offline(CSV)")
     parser.add_argument("--build-cache", action="store_true", help="对全部唯一地址建坐标缓存")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="--build-cache 并发请求数，默认取环境变量 AMAP_MAX_WORKERS（4）")
     parser.add_argument("--geocode", metavar="ADDRESS", default="",
                         help="仅将地址转成坐标并打印，不查最近记录。例: --geocode \"北京市朝阳区\"")
     parser.add_argument("--distance", nargs=2, metavar=("PLACE_A", "PLACE_B"), default=None,
@@ -405,49 +758,17 @@ def main() -> int:
 
     if args.build_cache:
         print("正在构建坐标缓存 (scheme=%s) ..." % args.scheme)
-        build_cache(scheme=args.scheme)
+        build_cache(scheme=args.scheme, max_workers=args.workers)
         return 0
 
     if args.serve:
         try:
-            from flask import Flask, request, jsonify
+            app = create_app()
         except ImportError:
             print("请安装 flask: pip install flask")
             return 1
-        app = Flask(__name__)
-
-        @app.route("/nearest")
-        def api_nearest():
-            place = request.args.get("place", "").strip()
-            top = int(request.args.get("top", 10))
-            scheme = request.args.get("scheme", "amap")
-            if not place:
-                return jsonify({"error": "缺少 place 参数"}), 400
-            results = search_nearest(place, top=top, scheme=scheme)
-            out = []
-            for r, dist in results:
-                rec = {k: (v if pd.notna(v) else None) for k, v in r.items() if not k.startswith("_")}
-                rec["_distance_km"] = round(dist, 4)
-                out.append(rec)
-            return jsonify({"place": place, "count": len(out), "results": out})
-
-        @app.route("/distance")
-        def api_distance():
-            place_a = request.args.get("place_a", "").strip()
-            place_b = request.args.get("place_b", "").strip()
-            scheme = request.args.get("scheme", "amap")
-            if not place_a or not place_b:
-                return jsonify({"error": "缺少 place_a 或 place_b 参数"}), 400
-            dist_km, coord_a, coord_b = distance_between(place_a, place_b, scheme=scheme)
-            if dist_km is None:
-                return jsonify({"error": "无法解析坐标", "place_a": place_a, "place_b": place_b}), 400
-            return jsonify({
-                "place_a": place_a, "place_b": place_b,
-                "coord_a": [round(coord_a[0], 6), round(coord_a[1], 6)] if coord_a else None,
-                "coord_b": [round(coord_b[0], 6), round(coord_b[1], 6)] if coord_b else None,
-                "distance_km": round(dist_km, 4),
-            })
-
+        # 启动时预先加载记录并解析坐标，首个请求无需等待
+        print("已预加载 %d 条带坐标的记录" % len(_get_state("amap").records))
         print("HTTP 接口: http://127.0.0.1:%s/nearest?place=郑州&top=5" % args.port)
         print("          http://127.0.0.1:%s/distance?place_a=北京&place_b=郑州" % args.port)
         app.run(host="0.0.0.0", port=args.port)
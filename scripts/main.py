@@ -2,11 +2,12 @@
 """
 入口脚本：执行页面抓取并保存为 Excel。
 用法: python main.py
-prod 模式下：每个省份独立保存为 output/water_info_<省份>.xlsx
+prod 模式下：每个省份独立保存为 output/water_info_<省份>.xlsx（OUTPUT_FORMAT 为 parquet/both 时写 .parquet）
 """
 import os
 import re
 import sys
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
 # 保证脚本目录在 path、工作目录为项目根（output 在根目录下）
@@ -18,7 +19,7 @@ os.chdir(_PROJECT_ROOT)
 
 import config
 from crawler import run as run_crawl
-from export_excel import to_excel
+from export_excel import to_excel, to_parquet
 
 
 def _safe_filename(name):
@@ -28,30 +29,56 @@ def _safe_filename(name):
     return s[:50] if s else "未命名"
 
 
+def _save(sheets, xlsx_path, parquet_path):
+    """按 config.OUTPUT_FORMAT 写出 xlsx 和/或 parquet，返回已保存路径（多个时以逗号分隔）。"""
+    fmt = config.OUTPUT_FORMAT
+    saved = []
+    if fmt in ("xlsx", "both"):
+        saved.append(to_excel(sheets, output_path=xlsx_path))
+    if fmt in ("parquet", "both"):
+        saved.append(to_parquet(sheets, output_path=parquet_path))
+    return ", ".join(saved)
+
+
+def _write_province(item):
+    """将单个省份写入 water_info_<省份>.xlsx / .parquet（供进程池调用，需为模块级函数）。"""
+    province = item.get("province", "")
+    one_sheet = [{"sheet_name": item.get("sheet_name", "水质实时数据"), "rows": item.get("rows", [])}]
+    stem = "water_info_%s" % _safe_filename(province)
+    return _save(one_sheet, config.OUTPUT_DIR / (stem + ".xlsx"), config.OUTPUT_DIR / (stem + ".parquet"))
+
+
 def main():
     print("开始抓取:", config.BASE_URL)
-    sheets_data = run_crawl()
+    streamed = []
+
+    def _save_now(item):
+        saved = _write_province(item)
+        print("已保存:", saved)
+        streamed.append(saved)
+
+    streaming = config.STREAMING_WRITE and config.RUN_MODE == "prod"
+    sheets_data = run_crawl(on_province=_save_now if streaming else None)
+    if streamed:
+        # 流式写出：各省份文件已在抓取过程中逐个保存
+        return 0
     if not sheets_data:
         print("未抓取到任何数据，请检查网络或页面结构。")
         return 1
     # prod 模式：带 province 的项按省份独立保存为 water_info_<省份>.xlsx
     per_province = [s for s in sheets_data if s.get("province") is not None]
     if per_province:
-        out_dir = Path(config.OUTPUT_DIR)
-        out_dir.mkdir(parents=True, exist_ok=True)
-        for item in per_province:
-            province = item.get("province", "")
-            one_sheet = [{"sheet_name": item.get("sheet_name", "水质实时数据"), "rows": item.get("rows", [])}]
-            fname = "water_info_%s.xlsx" % _safe_filename(province)
-            out_path = out_dir / fname
-            saved = to_excel(one_sheet, output_path=str(out_path))
-            print("已保存:", saved)
+        config.OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+        # 各省份文件相互独立，用进程池并行写出（xlsx 序列化为纯 Python CPU 计算，线程无法并行）
+        workers = min(len(per_province), os.cpu_count() or 1)
+        with ProcessPoolExecutor(max_workers=workers) as ex:
+            for saved in ex.map(_write_province, per_province):
+                print("已保存:", saved)
         return 0
     # 非 prod 或旧格式：全部写入单个文件
     for item in sheets_data:
         item.pop("province", None)
-    out_path = Path(config.OUTPUT_DIR) / config.OUTPUT_EXCEL
-    saved = to_excel(sheets_data, output_path=str(out_path))
+    saved = _save(sheets_data, config.OUTPUT_DIR / config.OUTPUT_EXCEL, config.OUTPUT_DIR / config.OUTPUT_PARQUET)
     print("已保存到:", saved)
     return 0
 
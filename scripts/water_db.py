@@ -19,10 +19,17 @@
 """
 from __future__ import annotations
 
+import atexit
+import itertools
 import json
+import math
 import os
 import sqlite3
 import sys
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path
 
 _SCRIPT_DIR = Path(__file__).resolve().parent
@@ -36,10 +43,15 @@ try:
 except ImportError:
     pd = None
 
+try:
+    import orjson  # 可选：data_json 的序列化 / 解析更快，未安装时用标准库 json
+except ImportError:
+    orjson = None
+
 # ---------------------------------------------------------------------------
 # 配置
 # ---------------------------------------------------------------------------
-OUTPUT_DIR = Path(config.OUTPUT_DIR)
+OUTPUT_DIR = config.OUTPUT_DIR
 DB_PATH = OUTPUT_DIR / "water_data.db"
 TABLE_CURRENT = "water_data"       # 线上查询始终读此表
 TABLE_STAGING = "water_data_new"   # 全量更新时先写此表，再原子切换
@@ -49,34 +61,24 @@ DATA_GLOB = "water_info_*.xlsx"
 ADDRESS_COLUMNS = ["省份", "断面名称"]
 
 
-def _row_address(row: dict) -> str:
-    parts = []
-    for col in ADDRESS_COLUMNS:
-        if col in row and pd is not None and pd.notna(row.get(col)) and str(row[col]).strip():
-            parts.append(str(row[col]).strip())
-    return "".join(parts) if parts else ""
+_ORJSON_OPTS = (orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_PASSTHROUGH_DATETIME) if orjson else 0
 
 
 def _row_to_json(row: dict) -> str:
-    """将单行转为 JSON，NaN -> null。"""
-    d = {}
-    for k, v in row.items():
-        if k.startswith("_"):
-            continue
-        if pd is not None and pd.isna(v):
-            d[k] = None
-        else:
-            try:
-                json.dumps(v)
-                d[k] = v
-            except (TypeError, ValueError):
-                d[k] = str(v)
-    return json.dumps(d, ensure_ascii=False)
+    """将单行转为紧凑 JSON，NaN -> null，其余无法直接序列化的值（日期等）转为 str。
+    空值先在一遍字典推导里换成 None（json 对 NaN 不会调用 default），整行只序列化一次。"""
+    d = {k: (None if pd is not None and pd.isna(v) else v) for k, v in row.items() if not k.startswith("_")}
+    if orjson is not None:
+        # 日期交给 default=str，与标准库输出一致（orjson 默认会输出 ISO 8601 的 T 分隔格式）
+        return orjson.dumps(d, default=str, option=_ORJSON_OPTS).decode()
+    return json.dumps(d, ensure_ascii=False, separators=(",", ":"), default=str)
 
 
 def _json_to_record(data_json: str) -> dict:
     try:
-        return json.loads(data_json) if data_json else {}
+        if not data_json:
+            return {}
+        return orjson.loads(data_json) if orjson is not None else json.loads(data_json)
     except Exception:
         return {}
 
@@ -84,15 +86,67 @@ def _json_to_record(data_json: str) -> dict:
 # ---------------------------------------------------------------------------
 # 建表与写入
 # ---------------------------------------------------------------------------
-def get_connection(path: Path | str | None = None) -> sqlite3.Connection:
+# 每个连接都要设置的 PRAGMA：WAL 下 NORMAL 只在检查点 fsync；临时表放内存；页缓存 64MB；mmap 256MB
+_CONNECTION_PRAGMAS = (
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-65536",
+    "PRAGMA mmap_size=268435456",
+)
+# 已切换为 WAL 的库文件（journal_mode 持久保存在文件中，每个文件每个进程只需设置一次）
+_WAL_DB_FILES: set[str] = set()
+
+
+def get_connection(path: Path | str | None = None, check_same_thread: bool = True) -> sqlite3.Connection:
+    """打开库文件并设置 PRAGMA：WAL 模式下全量更新写入时查询端读旧快照、互不阻塞。"""
     p = path if path is not None else DB_PATH
     p = Path(p) if not isinstance(p, Path) else p
     p.parent.mkdir(parents=True, exist_ok=True)
-    conn = sqlite3.connect(str(p))
+    conn = sqlite3.connect(str(p), check_same_thread=check_same_thread)
     conn.row_factory = sqlite3.Row
+    key = str(p.resolve())
+    if key not in _WAL_DB_FILES:
+        conn.execute("PRAGMA journal_mode=WAL")
+        _WAL_DB_FILES.add(key)
+    for pragma in _CONNECTION_PRAGMAS:
+        conn.execute(pragma)
     return conn
 
 
+# 查询端共享的只读连接：{库文件: (inode, conn)}。serve 每个请求都在新线程里处理，线程局部连接无法复用，
+# 因此各线程共用一个连接（check_same_thread=False），用锁串行使用；页缓存与 mmap 在请求间保持热。
+# 库文件被整体替换（inode 变化）时重新打开；进程退出时关闭
+_READ_CONNS: dict[str, tuple[int, sqlite3.Connection]] = {}
+_READ_LOCK = threading.RLock()
+
+
+@contextmanager
+def _reading(db_path: Path | str | None = None):
+    """持锁取出 db_path 的共享查询连接，with 块内独占使用，结束后不关闭。"""
+    p = Path(db_path) if db_path is not None else DB_PATH
+    key = str(p.resolve())
+    with _READ_LOCK:
+        hit = _READ_CONNS.get(key)
+        try:
+            ino = p.stat().st_ino
+        except OSError:
+            ino = None
+        if hit is None or hit[0] != ino:
+            if hit is not None:
+                hit[1].close()
+            conn = get_connection(p, check_same_thread=False)
+            hit = _READ_CONNS[key] = (p.stat().st_ino, conn)
+        yield hit[1]
+
+
+@atexit.register
+def close_read_connections() -> None:
+    with _READ_LOCK:
+        for _, conn in _READ_CONNS.values():
+            conn.close()
+        _READ_CONNS.clear()
+
+
 def create_table(conn: sqlite3.Connection, table_name: str = TABLE_CURRENT) -> None:
     conn.execute(
         """
@@ -121,22 +175,53 @@ def drop_table_if_exists(conn: sqlite3.Connection, table_name: str) -> None:
 # ---------------------------------------------------------------------------
 # 1. 从 Excel 加载记录，2. 用「省份」+「断面名称」拼接地址并地理编码
 # ---------------------------------------------------------------------------
-def load_records_from_excel() -> list[dict]:
-    """从 output/water_info_*.xlsx 加载所有行，每条增加 address = 省份 + 断面名称。"""
+def _read_one_excel(path: Path) -> list[dict] | None:
+    """读取单个 Excel 为记录列表（每条增加 address = 省份 + 断面名称）；读取失败返回 None。
+    定义在模块顶层，供进程池 pickle 调用。"""
+    from geo_search import _address_series, _read_excel
+
+    try:
+        df = _read_excel(path)
+    except Exception:
+        return None
+    # 整列拼地址、一次 to_dict 转记录，不再逐行 iterrows 构造 Series
+    addrs = _address_series(df, ADDRESS_COLUMNS).tolist()
+    rows = df.to_dict(orient="records")
+    for r, addr in zip(rows, addrs):
+        r["address"] = addr
+        r["_source_file"] = path.name
+    return rows
+
+
+def iter_records_from_excel():
+    """按文件顺序逐个产出 output/water_info_*.xlsx 的记录批次，读取失败的文件跳过。
+    多个文件时用进程池并行解析（openpyxl 为 CPU 密集型），但最多只有 worker 数个文件在读取中，
+    调用方处理完一批才提交下一个文件，内存中的记录不会随文件数增长。"""
     if pd is None:
         raise ImportError("请安装 pandas 与 openpyxl")
-    records = []
-    for path in sorted(OUTPUT_DIR.glob(DATA_GLOB)):
-        try:
-            df = pd.read_excel(path, sheet_name=0)
-            for _, row in df.iterrows():
-                r = row.to_dict()
-                r["address"] = _row_address(r)
-                r["_source_file"] = path.name
-                records.append(r)
-        except Exception:
-            continue
-    return records
+    paths = sorted(OUTPUT_DIR.glob(DATA_GLOB))
+    if len(paths) <= 1:
+        for path in paths:
+            rows = _read_one_excel(path)
+            if rows is not None:
+                yield rows
+        return
+    workers = min(len(paths), os.cpu_count() or 1)
+    todo = iter(paths)
+    with ProcessPoolExecutor(max_workers=workers) as ex:
+        pending = deque(ex.submit(_read_one_excel, path) for path in itertools.islice(todo, workers))
+        while pending:
+            rows = pending.popleft().result()
+            nxt = next(todo, None)
+            if nxt is not None:
+                pending.append(ex.submit(_read_one_excel, nxt))
+            if rows is not None:
+                yield rows
+
+
+def load_records_from_excel() -> list[dict]:
+    """从 output/water_info_*.xlsx 加载所有行，每条增加 address = 省份 + 断面名称。"""
+    return [r for batch in iter_records_from_excel() for r in batch]
 
 
 def geocode_records(
@@ -144,22 +229,26 @@ def geocode_records(
     scheme: str = "amap",
     cache: dict | None = None,
 ) -> list[dict]:
-    """为每条记录计算坐标：address 已存在，调用 geo_search.geocode 写入 lat, lon。"""
-    from geo_search import geocode, load_json_cache, save_json_cache
+    """为每条记录计算坐标：address 已存在，按唯一地址调用 geo_search.geocode 写入 lat, lon。
+    缓存未命中的地址经线程池并发请求（并发数取 AMAP_MAX_WORKERS，仍受共享限速器约束），缓存只写一次。"""
+    from geo_search import AMAP_MAX_WORKERS, geocode, load_json_cache, save_json_cache
 
     if cache is None:
         cache = load_json_cache()
-    for r in records:
-        addr = r.get("address", "")
-        if not addr:
-            r["lat"], r["lon"] = None, None
-            continue
-        coord = geocode(scheme, addr, cache)
-        if coord:
-            r["lat"], r["lon"] = coord[0], coord[1]
+    addrs = [(r.get("address") or "").strip() for r in records]
+    todo = sorted({a for a in addrs if a and a not in cache})
+    if todo:
+        if scheme == "offline":
+            coords = [geocode(scheme, a) for a in todo]
         else:
-            r["lat"], r["lon"] = None, None
-    if scheme != "offline":
+            # 网络 I/O 并发；结果只在主线程合并进 cache，无需加锁
+            with ThreadPoolExecutor(max_workers=max(1, min(AMAP_MAX_WORKERS, len(todo)))) as ex:
+                coords = list(ex.map(lambda a: geocode(scheme, a), todo))
+        cache.update((a, c) for a, c in zip(todo, coords) if c)
+    for r, addr in zip(records, addrs):
+        coord = cache.get(addr) if addr else None
+        r["lat"], r["lon"] = (coord[0], coord[1]) if coord else (None, None)
+    if scheme != "offline" and todo:
         save_json_cache(cache)
     return records
 
@@ -168,23 +257,30 @@ def geocode_records(
 # 插入到指定表（用于全量更新时写入 staging 表）
 # ---------------------------------------------------------------------------
 def insert_records(conn: sqlite3.Connection, records: list[dict], table_name: str = TABLE_STAGING) -> int:
+    """先在 Python 侧把记录转成参数元组，再在一个 BEGIN IMMEDIATE 事务内 executemany 一次写入。"""
     create_table(conn, table_name)
-    cur = conn.cursor()
-    n = 0
-    for r in records:
-        province = r.get("省份") or r.get("province")
-        site_name = r.get("断面名称") or r.get("site_name")
-        address = r.get("address", "")
-        lat = r.get("lat")
-        lon = r.get("lon")
-        data_json = _row_to_json(r)
-        cur.execute(
+    rows = [
+        (
+            r.get("省份") or r.get("province"),
+            r.get("断面名称") or r.get("site_name"),
+            r.get("address", ""),
+            r.get("lat"),
+            r.get("lon"),
+            _row_to_json(r),
+        )
+        for r in records
+    ]
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.executemany(
             "INSERT INTO %s (province, site_name, address, lat, lon, data_json) VALUES (?,?,?,?,?,?)" % (table_name,),
-            (province, site_name, address, lat, lon, data_json),
+            rows,
         )
-        n += 1
+    except Exception:
+        conn.rollback()
+        raise
     conn.commit()
-    return n
+    return len(rows)
 
 
 # ---------------------------------------------------------------------------
@@ -194,15 +290,135 @@ def swap_tables(conn: sqlite3.Connection) -> None:
     """
     原子切换：删除当前表，将 staging 表改名为当前表。
     查询端始终读 water_data，仅在 COMMIT 瞬间从旧数据切换到新数据，无中间态。
+    sqlite3 模块不会为 DDL 隐式开启事务，因此显式 BEGIN IMMEDIATE；改名失败（如 staging 表不存在）时回滚，旧表保留。
     """
-    conn.execute("DROP TABLE IF EXISTS %s" % (TABLE_CURRENT,))
-    conn.execute("ALTER TABLE %s RENAME TO %s" % (TABLE_STAGING, TABLE_CURRENT))
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute("DROP TABLE IF EXISTS %s" % (TABLE_CURRENT,))
+        conn.execute("ALTER TABLE %s RENAME TO %s" % (TABLE_STAGING, TABLE_CURRENT))
+    except Exception:
+        conn.rollback()
+        raise
     conn.commit()
+    write_coords_sidecar(conn)
+
+
+def _coords_path(db_file: str | Path) -> Path:
+    return Path(db_file).with_suffix(".coords.npy")
+
+
+def write_coords_sidecar(conn: sqlite3.Connection) -> Path | None:
+    """
+    把当前表有坐标的 (id, lat, lon) 存成库文件旁的 .coords.npy（float64, 形状 (N, 3)），
+    serve 建 KD-tree 时直接读该文件，不必从 SQLite 逐行取出再构造元组。无 numpy 或内存库时跳过。
+    """
+    from geo_search import np
+
+    db_file = conn.execute("PRAGMA database_list").fetchone()[2]
+    if np is None or not db_file:
+        return None
+    path = _coords_path(db_file)
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        np.save(f, _fetch_coords(conn))
+    os.replace(tmp, path)  # 先写临时文件再替换，读端不会读到半个文件
+    return path
+
+
+def _fetch_coords(conn: sqlite3.Connection):
+    """查当前表有坐标的 (id, lat, lon)，直接填入连续的 (N, 3) float64 数组：
+    游标不用 sqlite3.Row，np.fromiter 逐值写入，不构造整张表的行元组列表。"""
+    from geo_search import np
+
+    cur = conn.cursor()
+    cur.row_factory = None
+    cur.execute("SELECT id, lat, lon FROM %s WHERE lat IS NOT NULL AND lon IS NOT NULL ORDER BY id" % TABLE_CURRENT)
+    return np.fromiter(itertools.chain.from_iterable(cur), dtype=np.float64).reshape(-1, 3)
+
+
+def _load_coords_sidecar(conn: sqlite3.Connection, p: Path):
+    """mmap 读取 .coords.npy；文件缺失、损坏或与当前表不一致（条数 / 最大 id 不同，如切换后又追加写入）时返回 None。"""
+    from geo_search import np
+
+    try:
+        arr = np.load(_coords_path(p), mmap_mode="r")
+    except (OSError, ValueError):
+        return None
+    if arr.ndim != 2 or arr.shape[1] != 3:
+        return None
+    count, max_id = conn.execute(
+        "SELECT count(*), max(id) FROM %s WHERE lat IS NOT NULL AND lon IS NOT NULL" % TABLE_CURRENT
+    ).fetchone()
+    if len(arr) != count or (count and int(arr[-1, 0]) != max_id):
+        return None
+    return arr
 
 
 # ---------------------------------------------------------------------------
 # 3. 高效最近邻：用户输入地名 -> 转坐标 -> KD-tree 与库内坐标算距离 -> 返回最近位置的水质数据
 # ---------------------------------------------------------------------------
+# KD-tree 缓存：{库文件: (版本, ids, points, tree)}，未变化时 serve 的每次请求都复用同一棵树。
+# 版本取 (文件 inode, schema_version, 当前表最大 id)：全量更新切换表会改变 schema_version，追加写入会改变最大 id，
+# 整个库文件被替换时 inode 改变。不用文件 mtime：WAL 模式下写入先落在 -wal，最后一个连接关闭时检查点又会改写库文件
+_TREE_CACHE: dict[str, tuple] = {}
+KDTREE_LEAFSIZE = 32  # 叶子更大：树更浅、查询时缓存局部性更好
+
+
+def _db_version(conn: sqlite3.Connection, p: Path) -> tuple:
+    schema = conn.execute("PRAGMA schema_version").fetchone()[0]
+    try:
+        max_id = conn.execute("SELECT max(id) FROM %s" % TABLE_CURRENT).fetchone()[0]
+    except sqlite3.OperationalError:  # 表尚未创建
+        max_id = None
+    return (p.stat().st_ino, schema, max_id)
+
+
+def _nearest_index(db_path: Path | None, kdtree_cls) -> tuple[object, object, object]:
+    """
+    返回 (ids, points, tree)：有坐标记录的 id 数组、对应 (lat, lon) 的 (N, 2) 数组、以其单位球面坐标建的 KD-tree；
+    库无有效坐标时 tree 为 None。坐标优先取 .coords.npy 旁路文件，不一致时回退到查表。按 _db_version 缓存。
+    """
+    p = Path(db_path) if db_path is not None else DB_PATH
+    with _reading(p) as conn:
+        return _index_for(conn, p, kdtree_cls)
+
+
+def _index_for(conn: sqlite3.Connection, p: Path, kdtree_cls) -> tuple[object, object, object]:
+    """_nearest_index 的实现，使用调用方已持有的连接（可在调用方的读事务内执行）。"""
+    import numpy as np
+    from geo_search import _unit_xyz
+
+    key = str(p.resolve())
+    version = _db_version(conn, p)
+    hit = _TREE_CACHE.get(key)
+    if hit is not None and hit[0] == version:
+        return hit[1], hit[2], hit[3]
+    arr = _load_coords_sidecar(conn, p)
+    if arr is None:
+        arr = _fetch_coords(conn)
+    # 拷贝出 mmap：KD-tree 本身也要常驻内存，且不持有打开的映射，下次全量更新才能替换旁路文件
+    ids = np.array(arr[:, 0], dtype=np.int64)
+    points = np.array(arr[:, 1:], dtype=np.float64)
+    tree = None
+    if len(ids):
+        # 在单位球面三维坐标上建树：欧氏弦长与大圆距离单调一致，直接按经纬度度数建树在高纬度会选错近邻
+        xyz = _unit_xyz(points[:, 0], points[:, 1])
+        tree = kdtree_cls(xyz, leafsize=KDTREE_LEAFSIZE, compact_nodes=True, balanced_tree=True)
+    _TREE_CACHE[key] = (version, ids, points, tree)
+    return ids, points, tree
+
+
+def _records_by_id(conn: sqlite3.Connection, ids) -> dict[int, str]:
+    """只取选中的 id 的 data_json（分批 IN 查询，避免超过 SQLite 参数个数上限）。"""
+    ids = sorted(set(ids))
+    out = {}
+    for i in range(0, len(ids), 500):
+        chunk = ids[i:i + 500]
+        sql = "SELECT id, data_json FROM %s WHERE id IN (%s)" % (TABLE_CURRENT, ",".join("?" * len(chunk)))
+        out.update(conn.execute(sql, chunk).fetchall())
+    return out
+
+
 def query_nearest(
     place_name: str,
     k: int = 10,
@@ -214,46 +430,98 @@ def query_nearest(
     返回距离最近的 k 条记录的完整水质数据及距离(km)。
     返回: [(record_dict, distance_km), ...]
     """
-    from geo_search import geocode, load_json_cache, haversine_km
+    return query_nearest_batch([place_name], k=k, scheme=scheme, db_path=db_path)[0]
+
+
+def query_nearest_batch(
+    place_names: list[str],
+    k: int = 10,
+    scheme: str = "amap",
+    db_path: Path | None = None,
+) -> list[list[tuple[dict, float]]]:
+    """
+    多个地名一次查询：各自地理编码后投影为 (M, 3) 单位球面坐标，对缓存的 KD-tree 只调用一次 query（workers=-1 多核并行）。
+    返回与 place_names 一一对应的结果列表，每项同 query_nearest；无法解析坐标的地名对应 []。
+    """
+    from geo_search import _unit_xyz, geocode, load_json_cache
 
+    # 每个不同地名只解析一次（解析失败的地名不进缓存，重复出现时也不再重复请求）
+    names = [(p or "").strip() for p in place_names]
     try:
         from scipy.spatial import cKDTree
     except ImportError:
-        return _query_nearest_fallback(place_name, k=k, scheme=scheme, db_path=db_path)
+        found = {n: _query_nearest_fallback(n, k=k, scheme=scheme, db_path=db_path) for n in dict.fromkeys(names)}
+        return [list(found[n]) for n in names]
 
     cache = load_json_cache()
-    coord = geocode(scheme, (place_name or "").strip(), cache)
-    if coord is None:
-        return []
-    qlat, qlon = coord
-
-    conn = get_connection(db_path)
-    cur = conn.execute(
-        "SELECT id, lat, lon, data_json FROM %s WHERE lat IS NOT NULL AND lon IS NOT NULL" % TABLE_CURRENT
-    )
-    rows = cur.fetchall()
-    conn.close()
-    if not rows:
-        return []
+    resolved = {n: geocode(scheme, n, cache) for n in dict.fromkeys(names)}
+    coords = [resolved[n] for n in names]
+    results: list[list[tuple[dict, float]]] = [[] for _ in place_names]
+    valid = [i for i, c in enumerate(coords) if c is not None]
+    if not valid:
+        return results
 
     import numpy as np
-    points = [(r[1], r[2]) for r in rows]
-    tree = cKDTree(points)
-    k_actual = min(k, len(points))
-    _, indices = tree.query([(qlat, qlon)], k=k_actual)
-    indices = np.atleast_1d(indices).tolist()
-
-    out = []
-    for idx in indices:
-        if idx >= len(rows):
-            continue
-        r = rows[idx]
-        rec = _json_to_record(r[3])
-        lat, lon = r[1], r[2]
-        dist_km = haversine_km(qlat, qlon, lat, lon)
-        rec["_distance_km"] = round(dist_km, 4)
-        out.append((rec, rec["_distance_km"]))
-    return out[:k]
+    p = Path(db_path) if db_path is not None else DB_PATH
+    with _reading(p) as conn:
+        # 取树（按库版本）与按 id 取 data_json 在同一个读事务里、看到同一快照：其间即使切换了表，
+        # 也不会用旧树的 id 取到新表中同 id 的另一条记录（staging 表的自增 id 从 1 重新开始）
+        conn.execute("BEGIN")
+        try:
+            ids, points, tree = _index_for(conn, p, cKDTree)
+            if tree is None:
+                return results
+            k_actual = min(k, len(ids))
+            q = np.asarray([coords[i] for i in valid], dtype=np.float64)
+            chords, indices = tree.query(_unit_xyz(q[:, 0], q[:, 1]), k=k_actual, workers=-1)
+            indices = np.asarray(indices).reshape(len(valid), k_actual)
+            data = _records_by_id(conn, ids[indices[indices < len(ids)]].tolist())
+        finally:
+            conn.commit()
+    # 弦长换算为大圆距离（km），与 Haversine 结果相同，不必再逐条算三角函数
+    dists = 2.0 * 6371.0 * np.arcsin(np.minimum(1.0, np.asarray(chords).reshape(len(valid), k_actual) / 2.0))
+
+    for i, row_idx, row_dist in zip(valid, indices.tolist(), dists.tolist()):
+        out = []
+        for idx, dist_km in zip(row_idx, row_dist):
+            if idx >= len(ids) or int(ids[idx]) not in data:
+                continue
+            rec = _json_to_record(data[int(ids[idx])])
+            rec["_distance_km"] = round(dist_km, 4)
+            out.append((rec, rec["_distance_km"]))
+        results[i] = out[:k]
+    return results
+
+
+BBOX_START_DEG = 1.0   # 边界框预筛选的初始半宽（度），不足 k 条或不能保证最近时加倍
+BBOX_MAX_DEG = 20.0    # 超过该半宽仍不满足则退回全表扫描
+_KM_PER_DEG = 6371.0 * math.pi / 180.0
+
+
+def _bbox_rows(conn: sqlite3.Connection, qlat: float, qlon: float, k: int) -> list:
+    """
+    在查询点周围按 lat/lon 边界框取候选行（走 (lat, lon) 索引的范围扫描，不读全表），框内不足 k 条时半宽加倍。
+    只在框内第 k 近的距离不超过框的内切半径时才返回，保证结果与全表计算一致；否则（含跨 ±180° 经线）返回全表。
+    """
+    from geo_search import haversine_km
+
+    if k <= 0:
+        return []
+    sql = ("SELECT id, lat, lon, data_json FROM %s WHERE lat BETWEEN ? AND ? AND lon BETWEEN ? AND ?"
+           " AND lat IS NOT NULL AND lon IS NOT NULL" % TABLE_CURRENT)
+    delta = BBOX_START_DEG
+    while delta <= BBOX_MAX_DEG and -180.0 <= qlon - delta and qlon + delta <= 180.0:
+        rows = conn.execute(sql, (qlat - delta, qlat + delta, qlon - delta, qlon + delta)).fetchall()
+        if len(rows) >= k:
+            # 框内任意点到边界的最短距离：纬向 delta 度，经向按框内最高纬度处的 cos 收缩
+            radius_km = delta * _KM_PER_DEG * math.cos(math.radians(min(90.0, abs(qlat) + delta)))
+            kth = sorted(haversine_km(qlat, qlon, r[1], r[2]) for r in rows)[k - 1]
+            if kth <= radius_km:
+                return rows
+        delta *= 2
+    return conn.execute(
+        "SELECT id, lat, lon, data_json FROM %s WHERE lat IS NOT NULL AND lon IS NOT NULL" % TABLE_CURRENT
+    ).fetchall()
 
 
 def _query_nearest_fallback(
@@ -262,8 +530,9 @@ def _query_nearest_fallback(
     scheme: str = "amap",
     db_path: Path | None = None,
 ) -> list[tuple[dict, float]]:
-    """无 scipy 时：查全表，用 Haversine 算距离后排序取前 k。"""
-    from geo_search import geocode, load_json_cache, haversine_km
+    """无 scipy 时：先用 SQL 边界框预筛选候选行，再用 Haversine 算距离后取前 k。
+    有 numpy 时整列向量化计算并用 argpartition 取前 k。"""
+    from geo_search import _top_k, geocode, haversine_km, haversine_km_many, load_json_cache, np
 
     cache = load_json_cache()
     coord = geocode(scheme, (place_name or "").strip(), cache)
@@ -271,13 +540,21 @@ def _query_nearest_fallback(
         return []
     qlat, qlon = coord
 
-    conn = get_connection(db_path)
-    cur = conn.execute("SELECT id, lat, lon, data_json FROM %s WHERE lat IS NOT NULL AND lon IS NOT NULL" % TABLE_CURRENT)
-    rows = cur.fetchall()
-    conn.close()
+    with _reading(db_path) as conn:
+        rows = _bbox_rows(conn, qlat, qlon, k)
     if not rows:
         return []
 
+    if np is not None:
+        lats = np.fromiter((r[1] for r in rows), dtype=np.float64, count=len(rows))
+        lons = np.fromiter((r[2] for r in rows), dtype=np.float64, count=len(rows))
+        out = []
+        for i, dist in _top_k(haversine_km_many(qlat, qlon, lats, lons), k):
+            rec = _json_to_record(rows[i][3])
+            rec["_distance_km"] = round(dist, 4)
+            out.append((rec, rec["_distance_km"]))
+        return out
+
     scored = []
     for r in rows:
         dist = haversine_km(qlat, qlon, r[1], r[2])
@@ -295,8 +572,8 @@ def full_update(scheme: str = "amap", skip_crawl: bool = False) -> None:
     """
     全量更新数据库：
     1) 可选：执行 prod 模式抓取（main.py 逻辑），生成 output/water_info_*.xlsx；若 skip_crawl=True 则跳过，直接使用已有 Excel。
-    2) 从 Excel 加载记录，用「省份」+「断面名称」地理编码
-    3) 写入 water_data_new，再原子切换为 water_data（无缝、无服务中断）
+    2) 逐个 Excel 文件加载记录，用「省份」+「断面名称」地理编码后写入 water_data_new
+    3) 全部写完后原子切换为 water_data（无缝、无服务中断）
     """
     if not skip_crawl:
         # 1) prod 抓取（环境变量 + 已导入的 config 需同步，否则 crawler 仍读到 RUN_MODE=test）
@@ -309,18 +586,24 @@ def full_update(scheme: str = "amap", skip_crawl: bool = False) -> None:
     else:
         print("已跳过抓取步骤，直接使用 output/ 下已有 Excel 进行地理编码与入库")
 
-    # 2) 加载 + 地理编码
-    records = load_records_from_excel()
-    if not records:
-        raise RuntimeError("未从 output/water_info_*.xlsx 加载到任何记录")
-    records = geocode_records(records, scheme=scheme)
+    # 2) 逐个文件加载 + 地理编码 + 写入 staging 表（每个文件一个事务，内存中只有一个文件的记录），3) 原子切换
+    from geo_search import load_json_cache
 
-    # 3) 写入新表并原子切换
+    cache = load_json_cache()
     conn = get_connection()
-    create_table(conn, TABLE_STAGING)
-    n = insert_records(conn, records, table_name=TABLE_STAGING)
-    swap_tables(conn)
-    conn.close()
+    try:
+        # 清掉上次中断留下的 staging 表，避免旧数据混入
+        drop_table_if_exists(conn, TABLE_STAGING)
+        create_table(conn, TABLE_STAGING)
+        n = 0
+        for batch in iter_records_from_excel():
+            if batch:
+                n += insert_records(conn, geocode_records(batch, scheme=scheme, cache=cache), table_name=TABLE_STAGING)
+        if not n:
+            raise RuntimeError("未从 output/water_info_*.xlsx 加载到任何记录")
+        swap_tables(conn)
+    finally:
+        conn.close()
     print("全量更新完成: 共 %d 条，已原子切换为 water_data" % n)
 
 
@@ -357,6 +640,22 @@ def serve(port: int = 5001, db_path: Path | None = None) -> None:
         out = [rec for rec, _ in results]
         return jsonify({"place": place, "count": len(out), "results": out})
 
+    @app.route("/nearest_batch", methods=["GET", "POST"])
+    def api_nearest_batch():
+        """多个地名一次查询：GET ?place=A&place=B 或 POST {"places": [...]}；KD-tree 只查询一次。"""
+        body = request.get_json(silent=True) or {}
+        places = [p.strip() for p in (body.get("places") or request.args.getlist("place")) if p and p.strip()]
+        top = int(body.get("top") or request.args.get("top", 10))
+        scheme = body.get("scheme") or request.args.get("scheme", "amap")
+        if not places:
+            return jsonify({"error": "缺少 place 参数"}), 400
+        batches = query_nearest_batch(places, k=top, scheme=scheme, db_path=db_path)
+        items = []
+        for place, results in zip(places, batches):
+            out = [rec for rec, _ in results]
+            items.append({"place": place, "count": len(out), "results": out})
+        return jsonify({"count": len(items), "items": items})
+
     print("DB 最近邻接口: http://127.0.0.1:%s/nearest?place=郑州&top=5" % port)
     app.run(host="0.0.0.0", port=port)
 
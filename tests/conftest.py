@@ -0,0 +1,8 @@
+# -*- coding: utf-8 -*-
+"""测试公共设置：scripts/ 下模块按同目录 import 方式组织，这里把 scripts/ 加入 sys.path。"""
+import sys
+from pathlib import Path
+
+_SCRIPT_DIR = Path(__file__).resolve().parent.parent / "scripts"
+if str(_SCRIPT_DIR) not in sys.path:
+    sys.path.insert(0, str(_SCRIPT_DIR))
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+import asyncio
+
+import pytest
+
+pytest.importorskip("playwright")
+
+import analyze_page
+
+
+class _FakeBrowser:
+    """new_context 对指定 URL 失败的假 browser，用于验证单个 URL 出错不影响其他 URL。"""
+
+    async def new_context(self, **kwargs):
+        raise RuntimeError("context boom")
+
+
+def test_context_failure_is_recorded_per_url():
+    async def run():
+        sem = asyncio.Semaphore(2)
+        return await asyncio.gather(
+            analyze_page._analyze_url(_FakeBrowser(), "https://a.example", sem),
+            analyze_page._analyze_url(_FakeBrowser(), "https://b.example", sem),
+        )
+
+    results = asyncio.run(run())
+    assert [r["url"] for r in results] == ["https://a.example", "https://b.example"]
+    assert all(r["error"] == "context boom" for r in results)
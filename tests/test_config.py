@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+import os
+
+import config
+
+
+def _fake_chrome(root, name, mtime):
+    d = root / name / "chrome-linux64"
+    d.mkdir(parents=True)
+    (d / "chrome").write_text("")
+    (d / "chrome").chmod(0o755)
+    os.utime(root / name, (mtime, mtime))
+    return str(d / "chrome")
+
+
+def test_find_full_chromium_picks_newest_and_caches(tmp_path, monkeypatch):
+    old = _fake_chrome(tmp_path, "chromium-1000", 1_000)
+    new = _fake_chrome(tmp_path, "chromium-1100", 2_000)
+    (tmp_path / "chromium-1200").mkdir()  # 无可执行文件，忽略
+    monkeypatch.setenv("PLAYWRIGHT_BROWSERS_PATH", str(tmp_path))
+    monkeypatch.delenv("WATER_CRAWLER_CHROMIUM_PATH", raising=False)
+    config._find_full_chromium.cache_clear()
+    try:
+        assert config.CHROMIUM_EXECUTABLE_PATH == new != old
+        os.utime(tmp_path / "chromium-1000", (3_000, 3_000))
+        assert config.CHROMIUM_EXECUTABLE_PATH == new  # 已缓存，不再扫描
+        monkeypatch.setenv("WATER_CRAWLER_CHROMIUM_PATH", old)
+        assert config.CHROMIUM_EXECUTABLE_PATH == old
+    finally:
+        config._find_full_chromium.cache_clear()
+
+
+def test_find_full_chromium_missing_cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv("PLAYWRIGHT_BROWSERS_PATH", str(tmp_path / "nope"))
+    config._find_full_chromium.cache_clear()
+    try:
+        assert config._find_full_chromium() is None
+    finally:
+        config._find_full_chromium.cache_clear()
+
+
+def test_timeouts_env_override(monkeypatch):
+    import importlib
+
+    monkeypatch.setenv("WATER_CRAWLER_NAV_TIMEOUT_MS", "7000")
+    try:
+        mod = importlib.reload(config)
+        assert mod.NAV_TIMEOUT_MS == mod.TIMEOUT_MS == 7000
+        assert mod.SELECTOR_TIMEOUT_MS < mod.ACTION_TIMEOUT_MS
+    finally:
+        monkeypatch.delenv("WATER_CRAWLER_NAV_TIMEOUT_MS")
+        importlib.reload(config)
+
+
+def test_selectors_registry_is_read_only():
+    import pytest
+
+    assert config.SELECTORS["region_trigger"] == config.REGION_TRIGGER_SELECTOR
+    with pytest.raises(TypeError):
+        config.SELECTORS["table"] = "div"
+
+
+def test_extra_http_headers_bundle_is_read_only():
+    import pytest
+
+    assert config.EXTRA_HTTP_HEADERS["User-Agent"] == config.USER_AGENT
+    assert "br" in config.EXTRA_HTTP_HEADERS["Accept-Encoding"]
+    with pytest.raises(TypeError):
+        config.EXTRA_HTTP_HEADERS["Accept"] = "*/*"
+
+
+def test_env_helpers(monkeypatch):
+    import pytest
+
+    monkeypatch.setenv("X_INT", " 42 ")
+    monkeypatch.setenv("X_BAD", "abc")
+    monkeypatch.setenv("X_EMPTY", "")
+    monkeypatch.setenv("X_BOOL", "Yes")
+    assert config._env("X_INT", 1, int) == 42
+    assert config._env("X_EMPTY", 7, int) == 7
+    assert config._env("X_MISSING", "d") == "d"
+    with pytest.raises(ValueError, match="X_BAD"):
+        config._env("X_BAD", 1, int)
+    assert config._env_bool("X_BOOL") is True
+    assert config._env_bool("X_MISSING", True) is True
+
+
+def test_invalid_run_mode_fails_at_import(monkeypatch):
+    import importlib
+
+    import pytest
+
+    monkeypatch.setenv("WATER_CRAWLER_MODE", "staging")
+    try:
+        with pytest.raises(ValueError, match="WATER_CRAWLER_MODE"):
+            importlib.reload(config)
+        monkeypatch.setenv("WATER_CRAWLER_MODE", "PROD")
+        assert importlib.reload(config).RUN_MODE == "prod"
+    finally:
+        monkeypatch.delenv("WATER_CRAWLER_MODE")
+        importlib.reload(config)
+
+
+def test_output_paths_are_paths():
+    from pathlib import Path
+
+    assert isinstance(config.OUTPUT_DIR, Path)
+    assert config.OUTPUT_EXCEL_PATH == config.OUTPUT_DIR / config.OUTPUT_EXCEL
+    assert config.OUTPUT_DIR_STR == str(config.OUTPUT_DIR)
+
+
+def test_next_wait_ms_truncated_exponential(monkeypatch):
+    monkeypatch.setattr(config, "WAIT_CAP_MS", 1000)
+    samples = [config.next_wait_ms() for _ in range(2000)]
+    assert all(0 <= w <= 1000 for w in samples)
+    # 均值约 WAIT_BASE_MS / WAIT_LAMBDA = 400ms，远低于均匀分布的 cap/2
+    assert 250 < sum(samples) / len(samples) < 550
+    assert max(config.next_wait_ms(attempt=10) for _ in range(50)) == 1000
+
+
+def test_chromium_env_path_validated(tmp_path, monkeypatch, caplog):
+    exe = tmp_path / "chrome"
+    exe.write_text("")
+    exe.chmod(0o755)
+    monkeypatch.setenv("WATER_CRAWLER_CHROMIUM_PATH", str(exe))
+    assert config.CHROMIUM_EXECUTABLE_PATH == str(exe)
+
+    exe.chmod(0o644)
+    config._checked_executable.cache_clear()
+    try:
+        with caplog.at_level("WARNING"):
+            assert config.CHROMIUM_EXECUTABLE_PATH is None
+            assert config.CHROMIUM_EXECUTABLE_PATH is None
+        assert len(caplog.records) == 1
+        monkeypatch.setenv("WATER_CRAWLER_CHROMIUM_PATH", str(tmp_path / "missing"))
+        assert config.CHROMIUM_EXECUTABLE_PATH is None
+    finally:
+        config._checked_executable.cache_clear()
+
+
+def test_shard_and_top_n_from_env(monkeypatch):
+    import importlib
+
+    import pytest
+
+    monkeypatch.setenv("WATER_CRAWLER_TOP_N", "3")
+    monkeypatch.setenv("WATER_CRAWLER_SHARD_I", "1")
+    monkeypatch.setenv("WATER_CRAWLER_SHARD_N", "4")
+    try:
+        importlib.reload(config)
+        assert (config.PROD_TOP_N, config.REGION_SHARD_INDEX, config.REGION_SHARD_COUNT) == (3, 1, 4)
+        monkeypatch.setenv("WATER_CRAWLER_SHARD_I", "4")
+        with pytest.raises(ValueError, match="WATER_CRAWLER_SHARD_I"):
+            importlib.reload(config)
+    finally:
+        for name in ("WATER_CRAWLER_TOP_N", "WATER_CRAWLER_SHARD_I", "WATER_CRAWLER_SHARD_N"):
+            monkeypatch.delenv(name, raising=False)
+        importlib.reload(config)
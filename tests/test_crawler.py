@@ -0,0 +1,905 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import json
+
+import pytest
+
+pytest.importorskip("playwright")
+
+import config
+import crawler
+
+
+class _FakePage:
+    def __init__(self, stats):
+        self.stats = stats
+
+    def set_default_navigation_timeout(self, ms):
+        pass
+
+    def set_default_timeout(self, ms):
+        pass
+
+    async def wait_for_load_state(self, state, timeout=None):
+        pass
+
+    async def goto(self, url, **kwargs):
+        self.stats["active"] += 1
+        self.stats["peak"] = max(self.stats["peak"], self.stats["active"])
+        await asyncio.sleep(0.01)
+        self.stats["active"] -= 1
+
+    async def close(self):
+        self.stats["pages_closed"] = self.stats.get("pages_closed", 0) + 1
+
+
+class _FakeContext:
+    def __init__(self, stats):
+        self.stats = stats
+
+    async def new_page(self):
+        return _FakePage(self.stats)
+
+    async def route(self, pattern, handler):
+        self.stats["routes"] = self.stats.get("routes", 0) + 1
+
+    async def close(self):
+        self.stats["closed"] += 1
+
+
+class _FakeBrowser:
+    def __init__(self):
+        self.stats = {"active": 0, "peak": 0, "closed": 0, "contexts": 0}
+
+    async def new_context(self, **kwargs):
+        self.stats["contexts"] += 1
+        return _FakeContext(self.stats)
+
+
+@pytest.fixture
+def no_waits(monkeypatch):
+    monkeypatch.setattr(config, "NAVIGATION_WAIT_MAX_MS", 0)
+    monkeypatch.setattr(config, "PROD_INTERVAL_MS", 0)
+    monkeypatch.setattr(config, "RANDOM_WAIT_MAX_MS", 0)
+
+
+def _run_provinces(browser, provinces):
+    done = {}
+
+    async def on_done(province, item):
+        done[province] = item
+
+    async def run():
+        limiter = crawler._AsyncRateLimiter(0)
+        await crawler._scrape_provinces(browser, "https://x.example", provinces, limiter, on_done)
+
+    asyncio.run(run())
+    return done
+
+
+def test_scrape_provinces_bounded_and_closes_contexts(no_waits, monkeypatch):
+    async def no_frame(page):
+        return None
+
+    monkeypatch.setattr(crawler, "_get_data_frame", no_frame)
+    monkeypatch.setattr(config, "PROD_CONCURRENCY", 2)
+    browser = _FakeBrowser()
+    provinces = ["北京", "天津", "河北", "山西"]
+    assert _run_provinces(browser, provinces) == dict.fromkeys(provinces)
+    assert browser.stats["contexts"] == browser.stats["closed"] == 2
+    assert browser.stats["peak"] == 2
+
+
+def test_scrape_provinces_share_persistent_context(no_waits, monkeypatch):
+    async def no_frame(page):
+        return None
+
+    monkeypatch.setattr(crawler, "_get_data_frame", no_frame)
+    monkeypatch.setattr(config, "PROD_CONCURRENCY", 2)
+    stats = {"active": 0, "peak": 0, "closed": 0}
+    shared = _FakeContext(stats)
+    provinces = ["北京", "天津", "河北"]
+    assert _run_provinces(shared, provinces) == dict.fromkeys(provinces)
+    # 持久化 context 由 run_crawl 关闭：worker 只关自己的页面
+    assert stats["closed"] == 0 and stats["pages_closed"] == 2
+
+
+def test_launch_persistent_profile(tmp_path, monkeypatch):
+    profile = tmp_path / "profile"
+    monkeypatch.setattr(config, "BROWSER_PROFILE_DIR", str(profile))
+    calls = {}
+
+    class _Chromium:
+        async def launch_persistent_context(self, user_data_dir, **kwargs):
+            calls["dir"], calls["kwargs"] = user_data_dir, kwargs
+            return _FakeContext({})
+
+    class _P:
+        chromium = _Chromium()
+
+    browser, context = asyncio.run(crawler._launch(_P()))
+    assert browser is context and profile.is_dir()
+    assert calls["dir"] == str(profile)
+    assert "--blink-settings=imagesEnabled=false" in calls["kwargs"]["args"]
+    assert calls["kwargs"]["viewport"] == {"width": 1280, "height": 800}
+    # 不做路由拦截，保留 HTTP 缓存
+    assert "routes" not in context.stats
+
+
+def test_scrape_provinces_reuses_frame(no_waits, monkeypatch):
+    monkeypatch.setattr(config, "PROD_CONCURRENCY", 1)
+    opened, scraped = [], []
+
+    async def fake_open(page, base_url, limiter):
+        opened.append(base_url)
+        return "frame"
+
+    async def fake_scrape(frame, province, strict=False):
+        scraped.append((province, strict))
+        if province == "河北" and strict:
+            raise RuntimeError("区域未切换")
+        return {"province": province, "rows": [["h"], ["v"]]}
+
+    monkeypatch.setattr(crawler, "_open_data_frame", fake_open)
+    monkeypatch.setattr(crawler, "_scrape_region", fake_scrape)
+    done = _run_provinces(_FakeBrowser(), ["北京", "天津", "河北"])
+    assert list(done) == ["北京", "天津", "河北"] and all(done.values())
+    # 首个省份打开主页；天津直接复用；河北复用失败后重新打开
+    assert len(opened) == 2
+    assert scraped == [("北京", False), ("天津", True), ("河北", True), ("河北", False)]
+
+    monkeypatch.setattr(config, "REUSE_FRAME_BETWEEN_PROVINCES", False)
+    opened.clear()
+    _run_provinces(_FakeBrowser(), ["北京", "天津"])
+    assert len(opened) == 2
+
+
+def test_new_context_passes_plain_header_dict():
+    seen = {}
+
+    class _Browser:
+        async def new_context(self, **kwargs):
+            seen.update(kwargs)
+            return _FakeContext({})
+
+    asyncio.run(crawler._new_context(_Browser()))
+    headers = seen["extra_http_headers"]
+    assert type(headers) is dict
+    assert headers == dict(config.EXTRA_HTTP_HEADERS)
+
+
+def test_prod_concurrency_capped_by_max_contexts(monkeypatch):
+    monkeypatch.setattr(config, "PROD_CONCURRENCY", 10)
+    monkeypatch.setattr(config, "MAX_BROWSER_CONTEXTS", 4)
+    assert crawler._prod_concurrency() == 4
+    monkeypatch.setattr(config, "MAX_BROWSER_CONTEXTS", 0)
+    assert crawler._prod_concurrency() == 10
+    monkeypatch.setattr(config, "PROD_CONCURRENCY", 0)
+    assert crawler._prod_concurrency() == 1
+
+
+def test_block_resources_aborts_configured_types(monkeypatch):
+    monkeypatch.setattr(config, "CHROMIUM_BLOCK_RESOURCE_TYPES", frozenset({"image"}))
+    monkeypatch.setattr(config, "CHROMIUM_BLOCK_URL_PATTERN", None)
+    calls = []
+
+    class _Route:
+        def __init__(self, kind, url="https://x.example/a"):
+            self.request = type("Req", (), {"resource_type": kind, "url": url})()
+
+        async def abort(self):
+            calls.append(("abort", self.request.resource_type))
+
+        async def continue_(self):
+            calls.append(("continue", self.request.resource_type))
+
+    class _Context:
+        async def route(self, pattern, handler):
+            self.handler = handler
+
+    async def run():
+        ctx = _Context()
+        await crawler.block_resources(ctx)
+        await ctx.handler(_Route("image"))
+        await ctx.handler(_Route("xhr"))
+        return ctx
+
+    asyncio.run(run())
+    assert calls == [("abort", "image"), ("continue", "xhr")]
+
+    monkeypatch.setattr(config, "CHROMIUM_BLOCK_RESOURCE_TYPES", frozenset())
+    monkeypatch.setattr(config, "CHROMIUM_BLOCK_URL_PATTERN", r"hm\.baidu\.com")
+    calls.clear()
+
+    async def run_urls():
+        ctx = _Context()
+        await crawler.block_resources(ctx)
+        await ctx.handler(_Route("script", "https://hm.baidu.com/hm.js?x"))
+        await ctx.handler(_Route("script", "https://x.example/app.js"))
+
+    asyncio.run(run_urls())
+    assert calls == [("abort", "script"), ("continue", "script")]
+    monkeypatch.setattr(config, "CHROMIUM_BLOCK_URL_PATTERN", None)
+
+    monkeypatch.setattr(config, "CHROMIUM_BLOCK_RESOURCE_TYPES", frozenset())
+    ctx = _Context()
+    asyncio.run(crawler.block_resources(ctx))
+    assert not hasattr(ctx, "handler")
+
+
+def test_block_link_page_resources_falls_back_to_context(monkeypatch):
+    monkeypatch.setattr(config, "LINK_BLOCK_RESOURCE_TYPES", frozenset({"stylesheet"}))
+    monkeypatch.setattr(config, "BROWSER_PROFILE_DIR", "")
+    calls = []
+
+    class _Route:
+        def __init__(self, kind):
+            self.request = type("Req", (), {"resource_type": kind, "url": "https://x.example/a"})()
+
+        async def abort(self):
+            calls.append(("abort", self.request.resource_type))
+
+        async def fallback(self):
+            calls.append(("fallback", self.request.resource_type))
+
+    class _Page:
+        async def route(self, pattern, handler):
+            self.handler = handler
+
+    async def run():
+        page = _Page()
+        await crawler.block_link_page_resources(page)
+        await page.handler(_Route("stylesheet"))
+        await page.handler(_Route("document"))
+
+    asyncio.run(run())
+    assert calls == [("abort", "stylesheet"), ("fallback", "document")]
+    monkeypatch.setattr(config, "BROWSER_PROFILE_DIR", "/tmp/profile")
+    page = _Page()
+    asyncio.run(crawler.block_link_page_resources(page))
+    assert not hasattr(page, "handler")
+
+
+def test_launch_options_include_args(tmp_path, monkeypatch):
+    exe = tmp_path / "chrome"
+    exe.write_text("")
+    exe.chmod(0o755)
+    monkeypatch.setenv("WATER_CRAWLER_CHROMIUM_PATH", str(exe))
+    opts = crawler.launch_options()
+    assert opts["args"] == list(config.CHROMIUM_LAUNCH_ARGS)
+    assert "--no-sandbox" not in opts["args"]
+    assert opts["executable_path"] == str(exe)
+
+
+def test_extract_tables_from_page_passes_thresholds(monkeypatch):
+    monkeypatch.setattr(config, "MIN_TABLE_ROWS", 3)
+    monkeypatch.setattr(config, "MIN_TABLE_COLS", 4)
+    seen = {}
+
+    class _Page:
+        async def evaluate(self, js, arg=None):
+            seen["js"], seen["arg"] = js, arg
+            return [None, [["a", "b", "c", "d"]] * 3]
+
+    tables = asyncio.run(crawler._extract_tables_from_page(_Page()))
+    assert seen["js"] is crawler._PAGE_TABLES_JS
+    assert seen["arg"] == [3, 4]
+    assert [bool(t and crawler._is_data_table(t)) for t in tables] == [False, True]
+
+
+def test_emit_province_hands_off_to_callback():
+    got = []
+    item = {"province": "北京", "rows": [["a"]]}
+    assert asyncio.run(crawler._emit_province(item, got.append)) is None
+    assert got == [item]
+    assert asyncio.run(crawler._emit_province(item, None)) is item
+    assert asyncio.run(crawler._emit_province(None, got.append)) is None
+    assert len(got) == 1
+
+
+def test_get_data_frame_single_selector(monkeypatch):
+    monkeypatch.setattr(config, "IFRAME_WAIT_MAX_MS", 0)
+    queries = []
+
+    class _Frame:
+        async def wait_for_selector(self, selector, timeout=None):
+            pass
+
+    frame = _Frame()
+
+    class _El:
+        async def content_frame(self):
+            return frame
+
+    class _Page:
+        def __init__(self, el):
+            self.el = el
+
+        async def wait_for_selector(self, selector, state=None, timeout=None):
+            queries.append(("wait", selector, state))
+
+        async def query_selector(self, selector):
+            queries.append(selector)
+            return self.el
+
+    async def no_sleep(sec):
+        raise AssertionError("不应固定等待")
+
+    monkeypatch.setattr(config, "WAIT_STRATEGY", "event")
+    monkeypatch.setattr(crawler.asyncio, "sleep", no_sleep)
+    assert asyncio.run(crawler._get_data_frame(_Page(_El()))) is frame
+    assert asyncio.run(crawler._get_data_frame(_Page(None))) is None
+    assert queries == [("wait", config.FRAME_LOCATOR, "attached"), config.FRAME_LOCATOR] * 2
+    assert config.FRAME_LOCATOR == 'iframe#MF, iframe[src*="RealDatas"]'
+
+
+def test_shard_slices_regions(monkeypatch):
+    regions = ["北京", "天津", "河北", "山西", "内蒙古"]
+    assert crawler._shard(regions) == regions
+    monkeypatch.setattr(config, "REGION_SHARD_COUNT", 2)
+    monkeypatch.setattr(config, "REGION_SHARD_INDEX", 1)
+    assert crawler._shard(regions) == ["天津", "山西"]
+
+
+def test_crawl_links_visits_each_same_origin_url_once(monkeypatch):
+    monkeypatch.setattr(config, "BASE_URL", "https://example.com/Main.html")
+    monkeypatch.setattr(config, "LINK_CONCURRENCY", 2)
+    monkeypatch.setattr(config, "CLICK_WAIT_MAX_MS", 0)
+    site = {
+        "https://example.com/a": [{"href": "/b", "text": "B"}, {"href": "https://other.com/x", "text": "X"}],
+        "https://example.com/b": [{"href": "/a", "text": "A"}, {"href": "/c", "text": "C"}],
+        "https://example.com/c": [],
+    }
+    visits = []
+    stats = {"open": 0, "peak": 0, "pages": 0}
+
+    class _Page:
+        def set_default_navigation_timeout(self, ms):
+            pass
+
+        def set_default_timeout(self, ms):
+            pass
+
+        async def wait_for_load_state(self, state, timeout=None):
+            pass
+
+        async def goto(self, url, **kwargs):
+            self.url = url
+            visits.append(url)
+            await asyncio.sleep(0.01)
+
+        async def evaluate(self, js, arg=None):
+            if js is crawler._LINKS_JS:
+                return site[self.url]
+            if js is crawler._PAGE_TABLES_JS:
+                return [[["h1", "h2"], [self.url, "v"]]]
+            return ""
+
+        async def close(self):
+            stats["open"] -= 1
+
+        async def route(self, pattern, handler):
+            stats["routes"] = stats.get("routes", 0) + 1
+
+    class _Context:
+        async def new_page(self):
+            stats["pages"] += 1
+            stats["open"] += 1
+            stats["peak"] = max(stats["peak"], stats["open"])
+            return _Page()
+
+    sheets = []
+    seen = {"https://example.com/Main.html"}
+    asyncio.run(crawler._crawl_links(_Context(), config.BASE_URL, [{"href": "a", "text": "A!"}, {"href": "c", "text": "C"}], seen, sheets))
+    assert sorted(visits) == sorted(site)
+    # 每个 worker 只开一个页面并复用，结束时全部关闭
+    assert stats["open"] == 0 and stats["peak"] == 2 and stats["pages"] == stats["routes"] == 2
+    assert sorted(s["sheet_name"] for s in sheets) == ["A_表格1", "B_表格1", "C_表格1"]
+
+
+@pytest.mark.parametrize("parser", ["stdlib", "lexbor"])
+def test_parse_static_html_matches_dom_semantics(parser, monkeypatch):
+    if parser == "stdlib":
+        monkeypatch.setattr(crawler, "LexborHTMLParser", None)
+    else:
+        pytest.importorskip("selectolax")
+    html = (
+        '<a href="/x">X <b>链接</b></a>'
+        "<table><tr><td>a<td>b</tr><tr><td>1</td><td><table><tr><td>n1</td><td>n2</td></tr></table></td></tr></table>"
+        "<table><tr><td>only</td></tr></table>"
+    )
+    tables, links = crawler._parse_static_html(html)
+    # 外层表包含嵌套表的行与单元格（与 querySelectorAll 一致），不合格的表为 None
+    assert tables == [[["a", "b"], ["1", "n1n2", "n1", "n2"], ["n1", "n2"]], None, None]
+    assert links == [{"text": "X 链接", "href": "/x"}]
+
+
+def test_decode_html_charset():
+    body = '<meta charset="gbk"><td>北京</td>'.encode("gbk")
+    assert "北京" in crawler._decode_html(body)
+    assert crawler._decode_html("北京".encode("gb2312"), "text/html; charset=GB2312") == "北京"
+    assert crawler._decode_html("北京".encode("utf-8")) == "北京"
+
+
+def test_collect_static_falls_back_without_tables():
+    class _Resp:
+        ok = True
+        headers = {"content-type": "text/html; charset=utf-8"}
+
+        def __init__(self, html):
+            self.html = html
+
+        async def body(self):
+            return self.html.encode("utf-8")
+
+    class _Request:
+        def __init__(self, html):
+            self.html = html
+
+        async def get(self, url, timeout=None):
+            return _Resp(self.html)
+
+    class _Context:
+        def __init__(self, html):
+            self.request = _Request(html)
+
+    sheets = []
+    html = '<table><tr><th>h1</th><th>h2</th></tr><tr><td>1</td><td>2</td></tr></table><a href="/n">N</a>'
+    links = asyncio.run(crawler._collect_static(_Context(html), "https://x.example/p", "页", sheets))
+    assert links == [{"text": "N", "href": "/n"}]
+    assert sheets == [{"sheet_name": "页_表格1", "rows": [["h1", "h2"], ["1", "2"]]}]
+    assert asyncio.run(crawler._collect_static(_Context("<div id=app></div>"), "u", "页", sheets)) is None
+
+
+def test_enqueue_links_canonical_dedupe(monkeypatch):
+    monkeypatch.setattr(config, "BASE_URL", "https://Example.com/Main.html")
+    queue = asyncio.Queue()
+    seen = {crawler._canonical_url(config.BASE_URL)}
+    links = [
+        {"href": "/a/", "text": "A"},
+        {"href": "HTTPS://EXAMPLE.COM/a#top", "text": "A2"},
+        {"href": "/Main.html#x", "text": "主页"},
+        {"href": "https://other.com/a", "text": "外站"},
+        {"href": "javascript:void(0)", "text": "js"},
+        {"href": "/A", "text": "大写路径"},
+    ]
+    crawler._enqueue_links(queue, links, "https://example.com/Main.html", seen, "页面")
+    got = [queue.get_nowait() for _ in range(queue.qsize())]
+    assert got == [("https://example.com/a/", "A"), ("https://example.com/A", "大写路径")]
+
+
+def test_async_rate_limiter_spaces_acquires():
+    async def run():
+        limiter = crawler._AsyncRateLimiter(50)  # 20ms 间隔
+        loop = asyncio.get_running_loop()
+        t0 = loop.time()
+        await asyncio.gather(*[limiter.acquire() for _ in range(4)])
+        return loop.time() - t0
+
+    assert asyncio.run(run()) >= 0.055
+
+
+class _WaitTarget:
+    def __init__(self, fail=False):
+        self.calls = []
+        self.fail = fail
+
+    async def wait_for_selector(self, selector, state=None, timeout=None):
+        self.calls.append(("selector", selector, state, timeout))
+        if self.fail:
+            raise TimeoutError
+
+    async def wait_for_load_state(self, state, timeout=None):
+        self.calls.append(("load", state, timeout))
+
+
+def test_smart_wait_event_strategy(monkeypatch):
+    monkeypatch.setattr(config, "WAIT_STRATEGY", "event")
+    t = _WaitTarget(fail=True)
+    asyncio.run(crawler.smart_wait(t, selector="table", max_ms=1234))
+    asyncio.run(crawler.smart_wait(t, max_ms=50))
+    assert t.calls == [("selector", "table", "visible", 1234), ("load", "networkidle", 50)]
+
+
+def test_smart_wait_fixed_strategy_sleeps(monkeypatch):
+    monkeypatch.setattr(config, "WAIT_STRATEGY", "fixed")
+    slept = []
+
+    async def fake_sleep(sec):
+        slept.append(sec)
+
+    monkeypatch.setattr(crawler.asyncio, "sleep", fake_sleep)
+    t = _WaitTarget()
+    asyncio.run(crawler.smart_wait(t, selector="table", max_ms=1500))
+    assert slept == [1.5] and t.calls == []
+
+
+def test_smart_wait_on_locator(monkeypatch):
+    monkeypatch.setattr(config, "WAIT_STRATEGY", "event")
+    calls = []
+
+    class _Locator:
+        async def wait_for(self, state=None, timeout=None):
+            calls.append((state, timeout))
+
+    asyncio.run(crawler.smart_wait(_Locator(), max_ms=400, state="hidden"))
+    assert calls == [("hidden", 400)]
+
+
+def test_wait_for_table_change(monkeypatch):
+    monkeypatch.setattr(config, "WAIT_STRATEGY", "event")
+    calls = []
+
+    class _Frame:
+        async def evaluate(self, js):
+            assert js is crawler._TABLE_SIG_JS
+            return "3|a|b"
+
+        async def wait_for_function(self, js, arg=None, timeout=None):
+            calls.append((js, arg, timeout))
+
+    frame = _Frame()
+    before = asyncio.run(crawler._table_signature(frame))
+    asyncio.run(crawler._wait_for_table_change(frame, before, 6000))
+    assert calls == [(crawler._TABLE_CHANGED_JS, "3|a|b", 6000)]
+
+    slept = []
+
+    async def fake_sleep(sec):
+        slept.append(sec)
+
+    monkeypatch.setattr(crawler.asyncio, "sleep", fake_sleep)
+    asyncio.run(crawler._wait_for_table_change(frame, None, 6000))
+    monkeypatch.setattr(config, "WAIT_STRATEGY", "fixed")
+    asyncio.run(crawler._wait_for_table_change(frame, before, 3000))
+    assert slept == [6.0, 3.0] and len(calls) == 1
+
+
+def test_scrape_frame_all_pages_uses_single_state_eval(monkeypatch):
+    monkeypatch.setattr(config, "RANDOM_WAIT_MAX_MS", 0)
+    monkeypatch.setattr(config, "TABLE_LOAD_WAIT_MAX_MS", 0)
+    header = ["省份", "断面名称", "水温"]
+    pages = [
+        {"tables": [[header, ["北京", "A", "1"]]], "hasNext": True, "loading": False, "rowCount": 2},
+        {"tables": [[header, ["天津", "B", "2"]]], "hasNext": False, "loading": False, "rowCount": 2},
+    ]
+    clicks = []
+
+    class _Frame:
+        def __init__(self):
+            self.evals = 0
+
+        async def evaluate(self, js, arg=None):
+            assert js is crawler._FRAME_STATE_JS
+            assert arg == [list(crawler._NEXT_PAGE_TEXTS), config.SELECTORS["load_prompt"]]
+            self.evals += 1
+            return pages[min(len(clicks), len(pages) - 1)]
+
+        async def wait_for_selector(self, selector, **kwargs):
+            pass
+
+    async def fake_click(frame):
+        clicks.append(frame)
+        return True
+
+    monkeypatch.setattr(crawler, "_click_next_page", fake_click)
+    frame = _Frame()
+    h, rows = asyncio.run(crawler._scrape_frame_all_pages(frame))
+    assert h == header
+    assert rows == [["北京", "A", "1"], ["天津", "B", "2"]]
+    # 第二页没有「下一页」：只点击一次，每页只 evaluate 一次
+    assert len(clicks) == 1 and frame.evals == 2
+
+    async def per_page():
+        clicks.clear()
+        return [page async for page in crawler._iter_frame_pages(_Frame())]
+
+    assert asyncio.run(per_page()) == [(header, [["北京", "A", "1"]]), (header, [["天津", "B", "2"]])]
+
+
+def test_json_to_rows_shapes():
+    assert crawler._json_to_rows([{"a": 1, "b": None}, {"a": 2, "c": "x"}]) == [
+        ["a", "b", "c"], ["1", "", ""], ["2", "", "x"]]
+    assert crawler._json_to_rows({"total": 1, "rows": [{"省份": "河南"}]}) == [["省份"], ["河南"]]
+    assert crawler._json_to_rows({"msg": "err"}) == []
+    assert crawler._json_to_rows([]) == []
+
+
+class _FakeResp:
+    def __init__(self, ok, payload):
+        self.ok = ok
+        self._payload = payload
+
+    async def json(self):
+        return self._payload
+
+
+class _FakeRequest:
+    def __init__(self, resp):
+        self.resp = resp
+        self.urls = []
+
+    async def get(self, url, timeout=None):
+        self.urls.append(url)
+        return self.resp
+
+
+def test_fetch_province_fast(monkeypatch):
+    monkeypatch.setattr(config, "DATA_API_URL_TEMPLATE", "https://x.example/api?area={area}")
+    limiter = crawler._AsyncRateLimiter(0)
+    req = _FakeRequest(_FakeResp(True, {"data": [{"断面名称": "甲"}]}))
+    item = asyncio.run(crawler._fetch_province_fast(req, "河南", limiter))
+    assert item["rows"] == [["断面名称"], ["甲"]] and item["province"] == "河南"
+    assert req.urls == ["https://x.example/api?area=%E6%B2%B3%E5%8D%97"]
+    bad = _FakeRequest(_FakeResp(False, None))
+    assert asyncio.run(crawler._fetch_province_fast(bad, "河南", limiter)) is None
+
+
+def test_fetch_province_fast_pages_concurrently(monkeypatch):
+    monkeypatch.setattr(config, "DATA_API_URL_TEMPLATE", "https://x.example/api?area={area}&page={page}")
+    monkeypatch.setattr(config, "DATA_API_PAGE_CONCURRENCY", 3)
+    pages = {1: [{"n": 1}, {"n": 2}], 2: [{"n": 3}, {"n": 4}], 3: [{"n": 5}], 4: [], 5: []}
+
+    class _PagedRequest:
+        def __init__(self):
+            self.pages = []
+
+        async def get(self, url, timeout=None):
+            n = int(url.rsplit("=", 1)[1])
+            self.pages.append(n)
+            return _FakeResp(True, {"rows": pages[n]})
+
+    req = _PagedRequest()
+    item = asyncio.run(crawler._fetch_province_fast(req, "河南", crawler._AsyncRateLimiter(0)))
+    assert item["rows"] == [["n"], ["1"], ["2"], ["3"], ["4"], ["5"]]
+    # 第 1 页单独请求，之后 2..4 一批并发；第 3 页不足一页即停止
+    assert req.pages == [1, 2, 3, 4]
+
+
+def test_fetch_api_pages_real_limiter_at_default_rate(monkeypatch):
+    import time
+
+    monkeypatch.setattr(config, "DATA_API_URL_TEMPLATE", "https://x.example/api?area={area}&page={page}")
+    monkeypatch.setattr(config, "DATA_API_PAGE_CONCURRENCY", 4)
+    pages = {1: [{"n": 1}], 2: [{"n": 2}], 3: [{"n": 3}], 4: [{"n": 4}], 5: [{"n": 5}], 6: [], 7: [], 8: [], 9: []}
+
+    class _PagedRequest:
+        async def get(self, url, timeout=None):
+            return _FakeResp(True, {"rows": pages[int(url.rsplit("=", 1)[1])]})
+
+    # 按默认配置的接口限速：9 次请求约 1.6 秒；若误用导航限速（PROD_PER_HOST_RPS=0.2）则需 40 秒
+    limiter = crawler._AsyncRateLimiter(config.DATA_API_RPS)
+    start = time.monotonic()
+    item = asyncio.run(crawler._fetch_province_fast(_PagedRequest(), "河南", limiter))
+    assert item["rows"] == [["n"], ["1"], ["2"], ["3"], ["4"], ["5"]]
+    assert time.monotonic() - start < 3.0
+
+
+def test_region_list_cache_ttl(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(config, "REGION_LIST_TTL_S", 60)
+    assert crawler._load_cached_regions() is None
+    crawler._save_cached_regions(["北京", "天津"])
+    assert crawler._load_cached_regions() == ["北京", "天津"]
+    monkeypatch.setattr(crawler.time, "time", lambda: 10**12)
+    assert crawler._load_cached_regions() is None  # 过期
+    monkeypatch.setattr(config, "REGION_LIST_TTL_S", 0)
+    assert crawler._load_cached_regions() is None
+
+
+def test_wait_for_table_loaded_single_predicate(monkeypatch):
+    monkeypatch.setattr(config, "TABLE_LOAD_WAIT_MAX_MS", 700)
+    calls = []
+
+    class _Frame:
+        def __init__(self, fail=False):
+            self.fail = fail
+
+        async def wait_for_function(self, js, arg=None, timeout=None, polling=None):
+            calls.append((js, arg, timeout, polling))
+            if self.fail:
+                raise TimeoutError
+
+    async def no_sleep(sec):
+        raise AssertionError("不应固定等待")
+
+    monkeypatch.setattr(crawler.asyncio, "sleep", no_sleep)
+    assert asyncio.run(crawler._wait_for_table_loaded(_Frame(), min_rows=5)) is True
+    assert asyncio.run(crawler._wait_for_table_loaded(_Frame(fail=True), min_rows=0, timeout_ms=300)) is False
+    prompt = config.SELECTORS["load_prompt"]
+    assert calls == [
+        (crawler._TABLE_LOADED_JS, [5, prompt], 700, 100),
+        (crawler._TABLE_LOADED_JS, [1, prompt], 300, 100),
+    ]
+
+
+def test_extract_text_passes_max_chars():
+    seen = []
+
+    class _Page:
+        async def evaluate(self, js, arg=None):
+            seen.append((js, arg))
+            return "x"
+
+    assert asyncio.run(crawler._extract_text_from_page(_Page(), max_chars=20)) == "x"
+    assert seen == [(crawler._BODY_TEXT_JS, 20)]
+
+
+def test_collect_all_data_tables_pads_in_one_pass():
+    head = ["省份", "断面名称"]
+    first = [head, ["北京", "A"]]
+    wider = [["天津", "B", "x"]] * 2
+    header, rows = crawler._collect_all_data_tables([first, wider, [["河北", "C"]]])
+    assert header == ["省份", "断面名称", ""]
+    assert rows == [["北京", "A", ""], ["天津", "B", "x"], ["天津", "B", "x"], ["河北", "C", ""]]
+    # 列数已对齐的行不复制
+    same = [head, ["北京", "A"]]
+    assert crawler._collect_all_data_tables([same])[1][0] is same[1]
+    assert crawler._pick_main_data_table([[["a", "b", "c"], ["1", "2"], ["3", "4", "5", "6"]]]) == (
+        ["a", "b", "c", ""], [["1", "2", "", ""], ["3", "4", "5", "6"]])
+    # 行数更多但只有 1 列的布局表不参与比较
+    layout = [["x"]] * 5
+    assert crawler._pick_main_data_table([[["h", "k"], ["1", "2"]], layout])[0] == ["h", "k"]
+
+
+def test_region_from_row_with_precomputed_columns():
+    header = ["断面名称", " 城市 ", "省份"]
+    columns = crawler._region_columns(header)
+    assert columns == (2, 1)
+    assert crawler._region_from_row(["A", "郑州", "河南"], header, "全国", "全国", columns) == ("河南", "郑州")
+    assert crawler._region_from_row(["A", "", ""], header, "全国", "全国", columns) == ("全国", "全国")
+    assert crawler._region_from_row(["A"], ["断面名称"], "全国", "-") == ("全国", "-")
+
+
+def test_random_wait_is_opt_in(monkeypatch):
+    slept = []
+
+    async def fake_sleep(sec):
+        slept.append(sec)
+
+    monkeypatch.setattr(crawler.asyncio, "sleep", fake_sleep)
+    monkeypatch.setattr(config, "ANTI_BOT_DELAY_ENABLED", False)
+    asyncio.run(crawler._random_wait())
+    assert slept == []
+    monkeypatch.setattr(config, "ANTI_BOT_DELAY_ENABLED", True)
+    monkeypatch.setattr(config, "next_wait_ms", lambda attempt=0: 99999)
+    asyncio.run(crawler._random_wait(max_ms=300))
+    assert slept == [0.3]
+
+
+def test_tables_to_rows_merges_header_tables():
+    head = [["省份", "断面名称", "水温"]]
+    body = [["北京", "A", "1"], ["天津", "B", "2"]]
+    assert crawler._tables_to_rows([[], head, body, [["河北", "C", "3"]]]) == (
+        ["省份", "断面名称", "水温"], [["北京", "A", "1"], ["天津", "B", "2"], ["河北", "C", "3"]])
+    # 后一个表明显更宽：不合并，单行表头不成表
+    wide = [["a", "b", "c", "d", "e", "f"]] * 2
+    assert crawler._tables_to_rows([[["x", "y"]], wide])[0] == ["a", "b", "c", "d", "e", "f"]
+    assert crawler._tables_to_rows(None) == (None, [])
+
+
+def test_region_options_after_open_single_wait(monkeypatch):
+    monkeypatch.setattr(config, "WAIT_STRATEGY", "event")
+    calls = []
+
+    class _Handle:
+        async def json_value(self):
+            return ["全国", "北京", "天津"]
+
+    class _Loc:
+        @property
+        def first(self):
+            return self
+
+        async def click(self, timeout=None):
+            calls.append("click")
+
+    class _Keyboard:
+        async def press(self, key):
+            calls.append(key)
+
+    class _Frame:
+        keyboard = _Keyboard()
+
+        def locator(self, selector):
+            return _Loc()
+
+        async def wait_for_function(self, js, arg=None, timeout=None):
+            calls.append((js, arg))
+            return _Handle()
+
+        async def wait_for_selector(self, selector, state=None, timeout=None):
+            calls.append(state)
+
+        async def evaluate(self, js, arg=None):
+            raise AssertionError("不应单独 evaluate")
+
+    assert asyncio.run(crawler._get_region_options_after_open(_Frame())) == ["全国", "北京", "天津"]
+    assert calls == ["click", (crawler._LEVEL1_TEXTS_READY_JS, config.SELECTORS["region_level1"]), "Escape", "hidden"]
+
+
+def test_click_next_page_single_probe(monkeypatch):
+    monkeypatch.setattr(config, "WAIT_STRATEGY", "event")
+    calls = []
+
+    class _Loc:
+        @property
+        def first(self):
+            return self
+
+        async def click(self, timeout=None):
+            calls.append("click")
+
+    class _Frame:
+        def __init__(self, found):
+            self.found = found
+
+        async def evaluate(self, js, arg=None):
+            if js is crawler._MARK_NEXT_PAGE_JS:
+                calls.append(("probe", arg))
+                return self.found
+            return "sig"
+
+        def locator(self, selector):
+            calls.append(selector)
+            return _Loc()
+
+        async def wait_for_function(self, js, arg=None, timeout=None):
+            calls.append(("changed", arg, timeout))
+
+    probe = ("probe", [list(crawler._NEXT_PAGE_TEXTS), crawler._NEXT_PAGE_MARK])
+    assert asyncio.run(crawler._click_next_page(_Frame(False))) is False
+    assert calls == [probe]
+    calls.clear()
+    assert asyncio.run(crawler._click_next_page(_Frame(True))) is True
+    assert calls == [probe, "[data-crawler-next]", "click", ("changed", "sig", 1500)]
+
+
+def test_save_endpoints_log_writes_only_endpoints(tmp_path, monkeypatch):
+    log = tmp_path / ".state" / "endpoints.json"
+    monkeypatch.setattr(config, "ENDPOINTS_LOG_PATH", str(log))
+    crawler._save_endpoints_log({})
+    assert not log.exists()
+    crawler._save_endpoints_log({"https://example.com/api?x=1": "GET"})
+    assert json.loads(log.read_text(encoding="utf-8")) == [{"method": "GET", "url": "https://example.com/api?x=1"}]
+    assert list(log.parent.iterdir()) == [log]
+
+
+def test_province_worker_passes_consecutive_failures_to_random_wait(monkeypatch):
+    monkeypatch.setattr(config, "PROD_INTERVAL_MS", 0)
+    monkeypatch.setattr(config, "REUSE_FRAME_BETWEEN_PROVINCES", False)
+    frames = {"甲": None, "乙": None, "丙": "frame", "丁": None, "戊": "frame"}
+    attempts = []
+
+    async def fake_open(page, base_url, limiter):
+        return frames[current[-1]]
+
+    async def fake_scrape(frame, province, strict=False):
+        return {"province": province}
+
+    async def fake_wait(max_ms=5000, attempt=0):
+        attempts.append(attempt)
+
+    current = []
+    queue = asyncio.Queue()
+    for p in frames:
+        queue.put_nowait(p)
+    real_get = queue.get_nowait
+
+    def get_nowait():
+        current.append(real_get())
+        return current[-1]
+
+    queue.get_nowait = get_nowait
+    monkeypatch.setattr(crawler, "_open_data_frame", fake_open)
+    monkeypatch.setattr(crawler, "_scrape_region", fake_scrape)
+    monkeypatch.setattr(crawler, "_random_wait", fake_wait)
+    done = []
+
+    async def on_done(province, item):
+        done.append((province, item is not None))
+
+    asyncio.run(crawler._province_worker(_FakeBrowser(), "https://x.example/", queue, crawler._AsyncRateLimiter(0), on_done))
+    assert done == [("甲", False), ("乙", False), ("丙", True), ("丁", False), ("戊", True)]
+    # 每个省份之后（最后一个除外）等待一次；连续失败次数递增，成功后归零
+    assert attempts == [1, 2, 0, 1]
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+from datetime import date, datetime
+
+import pytest
+
+openpyxl = pytest.importorskip("openpyxl")
+pytest.importorskip("xlsxwriter")
+
+import export_excel
+from export_excel import to_excel
+
+
+def _read_back(path):
+    wb = openpyxl.load_workbook(path)
+    return {ws.title: [list(r) for r in ws.iter_rows(values_only=True)] for ws in wb.worksheets}
+
+
+def test_ragged_rows_round_trip(tmp_path):
+    out = to_excel([{"sheet_name": "数据", "rows": [["a", "b", "c"], ["1", "2"], ["x"]]}], tmp_path / "t.xlsx")
+    assert _read_back(out)["数据"] == [["a", "b", "c"], ["1", "2", None], ["x", None, None]]
+
+
+def test_empty_sheet_and_unique_names(tmp_path):
+    out = to_excel(
+        [{"sheet_name": "a:b", "rows": [["h"], ["v"]]}, {"sheet_name": "a:b", "rows": []}],
+        tmp_path / "t.xlsx",
+    )
+    sheets = _read_back(out)
+    assert list(sheets) == ["a-b", "a-b_1"]
+    assert sheets["a-b_1"] == [["(无数据)"]]
+
+
+def test_dates_written_as_iso_strings(tmp_path):
+    rows = [["a", "b"], ["x", date(2020, 1, 1)]]
+    out = to_excel([{"sheet_name": "s", "rows": rows}], tmp_path / "t.xlsx")
+    assert _read_back(out)["s"][1] == ["x", "2020-01-01"]
+
+
+def test_date_column_whose_first_data_row_is_empty(tmp_path):
+    rows = [["a", "b", "c"], ["x", None, 1], ["y", datetime(2024, 1, 2, 3, 4), 2]]
+    out = to_excel([{"sheet_name": "s", "rows": rows}], tmp_path / "t.xlsx")
+    assert _read_back(out)["s"][2] == ["y", "2024-01-02T03:04:00", 2]
+
+
+def test_sheet_name_illegal_chars_replaced(tmp_path):
+    out = to_excel([{"sheet_name": "[a]*b:c?d/e\\f", "rows": [["h"]]}], tmp_path / "t.xlsx")
+    assert list(_read_back(out)) == ["(a)-b-c-d-e-f"]
+
+
+def test_column_names_match_read_excel():
+    assert export_excel._column_names(["a", "", "a", None, "a"], 6) == [
+        "a", "Unnamed: 1", "a.1", "Unnamed: 3", "a.2", "Unnamed: 5",
+    ]
+
+
+def test_to_parquet_builds_one_frame(tmp_path, monkeypatch):
+    pd = pytest.importorskip("pandas")
+    captured = {}
+
+    def fake_to_parquet(self, path, index=True, compression=None):
+        captured.update(df=self.copy(), path=path, index=index, compression=compression)
+
+    monkeypatch.setattr(pd.DataFrame, "to_parquet", fake_to_parquet)
+    out = export_excel.to_parquet(
+        [
+            {"sheet_name": "s1", "rows": [["省份", "断面"], ["北京", "A"], ["天津"]]},
+            {"sheet_name": "s2", "rows": []},
+        ],
+        tmp_path / "t.parquet",
+    )
+    df = captured["df"]
+    assert out == str(tmp_path / "t.parquet")
+    assert captured["compression"] == "zstd" and captured["index"] is False
+    assert list(df.columns) == ["sheet_name", "省份", "断面"]
+    assert df.iloc[:, :2].values.tolist() == [["s1", "北京"], ["s1", "天津"]]
+    assert df["断面"].iloc[0] == "A" and pd.isna(df["断面"].iloc[1])
@@ -0,0 +1,288 @@
+# -*- coding: utf-8 -*-
+import json
+
+import pytest
+
+import geo_search
+
+
+def test_import_does_not_create_http_session():
+    assert geo_search._AMAP_HTTP is None
+
+
+def test_amap_session_created_lazily_once(tmp_path, monkeypatch):
+    pytest.importorskip("requests")
+    monkeypatch.setattr(geo_search, "_AMAP_HTTP", None)
+    monkeypatch.setattr(geo_search, "AMAP_HTTP_CACHE", tmp_path / "amap_http_cache.sqlite")
+    s1 = geo_search._amap_session()
+    assert s1 is not None
+    assert geo_search._amap_session() is s1
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(geo_search, "OUTPUT_DIR", tmp_path)
+    monkeypatch.setattr(geo_search, "GEO_CACHE_JSON", tmp_path / "geo_cache.json")
+    return tmp_path
+
+
+def test_build_cache_geocodes_only_missing_addresses(cache_dir, monkeypatch):
+    (cache_dir / "geo_cache.json").write_text(json.dumps({"北京A": [1.0, 2.0]}), encoding="utf-8")
+    records = [{"_address": a} for a in ["北京A", "天津B", "无解C", "天津B", ""]]
+    monkeypatch.setattr(geo_search, "load_all_records", lambda: records)
+    calls = []
+
+    def fake_geocode(scheme, address, cache=None):
+        calls.append(address)
+        return None if address == "无解C" else (3.0, 4.0)
+
+    monkeypatch.setattr(geo_search, "geocode", fake_geocode)
+    geo_search.build_cache(scheme="amap")
+    assert sorted(calls) == ["天津B", "无解C"]
+    saved = json.loads((cache_dir / "geo_cache.json").read_text(encoding="utf-8"))
+    assert saved == {"北京A": [1.0, 2.0], "天津B": [3.0, 4.0]}
+
+
+def test_limiter_spaces_calls(monkeypatch):
+    clock = [100.0]
+    sleeps = []
+    monkeypatch.setattr(geo_search.time, "monotonic", lambda: clock[0])
+    monkeypatch.setattr(geo_search.time, "sleep", sleeps.append)
+    limiter = geo_search._Limiter(4)
+    for _ in range(3):
+        limiter()
+    assert sleeps == [0.25, 0.5]
+
+
+def test_geocode_amap_retries_on_qps_errors(monkeypatch):
+    replies = iter([
+        (429, {}),
+        (200, {"status": "0", "infocode": "10021"}),
+        (200, {"status": "1", "geocodes": [{"location": "113.6,34.7"}]}),
+    ])
+    sleeps = []
+    monkeypatch.setattr(geo_search, "_amap_request", lambda address: next(replies))
+    monkeypatch.setattr(geo_search.time, "sleep", sleeps.append)
+    assert geo_search.geocode_amap("郑州") == (34.7, 113.6)
+    assert sleeps == [1, 2]
+
+
+def test_geocode_amap_gives_up_without_retry_on_bad_address(monkeypatch):
+    calls = []
+
+    def fake_request(address):
+        calls.append(address)
+        return 200, {"status": "0", "infocode": "20000"}
+
+    monkeypatch.setattr(geo_search, "_amap_request", fake_request)
+    assert geo_search.geocode_amap("???") is None
+    assert calls == ["???"]
+
+
+def test_haversine_km_many_matches_scalar():
+    np = pytest.importorskip("numpy")
+    lats = np.array([39.9, 34.7, 31.2])
+    lons = np.array([116.4, 113.6, 121.5])
+    got = geo_search.haversine_km_many(30.0, 114.0, lats, lons)
+    want = [geo_search.haversine_km(30.0, 114.0, a, b) for a, b in zip(lats, lons)]
+    assert got == pytest.approx(want)
+
+
+def test_search_nearest_returns_sorted_top(monkeypatch):
+    coords = {"Q": (30.0, 114.0), "A": (39.9, 116.4), "B": (34.7, 113.6), "C": (30.5, 114.3), "D": (31.2, 121.5)}
+    records = [{"_address": a} for a in "ABCD"] + [{"_address": "未知"}, {"_address": ""}]
+    monkeypatch.setattr(geo_search, "geocode", lambda scheme, a, cache=None: coords.get(a))
+    res = geo_search.search_nearest("Q", top=2, records=records, cache={})
+    assert [r["_address"] for r, _ in res] == ["C", "B"]
+    assert res[0][1] == pytest.approx(geo_search.haversine_km(30.0, 114.0, 30.5, 114.3))
+    assert len(geo_search.search_nearest("Q", top=10, records=records, cache={})) == 4
+
+
+def test_load_all_records_builds_address_and_keeps_values(cache_dir):
+    pd = pytest.importorskip("pandas")
+    pytest.importorskip("openpyxl")
+    pd.DataFrame({
+        "省份": ["河南", None, "北京"],
+        "断面名称": [" 花园口 ", "某站", None],
+        "pH": [7.5, None, 8],
+    }).to_excel(cache_dir / "water_info_test.xlsx", index=False)
+    recs = geo_search.load_all_records()
+    assert [r["_address"] for r in recs] == ["河南花园口", "某站", "北京"]
+    assert {r["_source_file"] for r in recs} == {"water_info_test.xlsx"}
+    assert recs[0]["pH"] == 7.5
+
+
+def test_load_offline_cache_skips_bad_coordinates(cache_dir, monkeypatch):
+    pytest.importorskip("pandas")
+    csv = cache_dir / "geo_cache.csv"
+    csv.write_text("address,lat,lon\n 郑州 ,34.7,113.6\n坏行,abc,1\n缺失,,\n", encoding="utf-8")
+    monkeypatch.setattr(geo_search, "GEO_CACHE_CSV", csv)
+    assert geo_search.load_offline_cache() == {"郑州": (34.7, 113.6)}
+
+
+def test_offline_and_json_cache_reload_only_when_file_changes(cache_dir, monkeypatch):
+    pytest.importorskip("pandas")
+    import os
+
+    csv = cache_dir / "geo_cache.csv"
+    csv.write_text("address,lat,lon\n郑州,34.7,113.6\n", encoding="utf-8")
+    monkeypatch.setattr(geo_search, "GEO_CACHE_CSV", csv)
+    first = geo_search.load_offline_cache()
+    assert geo_search.load_offline_cache() is first
+    csv.write_text("address,lat,lon\n郑州,34.7,113.6\n北京,39.9,116.4\n", encoding="utf-8")
+    os.utime(csv, ns=(1, 1))
+    assert set(geo_search.load_offline_cache()) == {"郑州", "北京"}
+
+    (cache_dir / "geo_cache.json").write_text(json.dumps({"A": [1.0, 2.0]}), encoding="utf-8")
+    c1 = geo_search.load_json_cache()
+    c1["B"] = (3.0, 4.0)
+    assert geo_search.load_json_cache() == {"A": (1.0, 2.0)}
+
+
+def test_load_all_records_reads_multiple_files_in_order(cache_dir):
+    pd = pytest.importorskip("pandas")
+    pytest.importorskip("openpyxl")
+    pd.DataFrame({"省份": ["河南"], "断面名称": ["甲"]}).to_excel(cache_dir / "water_info_b.xlsx", index=False)
+    pd.DataFrame({"省份": ["北京"], "断面名称": ["乙"]}).to_excel(cache_dir / "water_info_a.xlsx", index=False)
+    (cache_dir / "water_info_c.xlsx").write_bytes(b"not an excel file")
+    recs = geo_search.load_all_records()
+    assert [(r["_source_file"], r["_address"]) for r in recs] == [
+        ("water_info_a.xlsx", "北京乙"), ("water_info_b.xlsx", "河南甲")]
+
+
+def test_read_table_prefers_fresh_parquet_sidecar(cache_dir, monkeypatch):
+    pd = pytest.importorskip("pandas")
+    pytest.importorskip("openpyxl")
+    import os
+    import pickle
+
+    xlsx = cache_dir / "water_info_x.xlsx"
+    pd.DataFrame({"省份": ["河南"]}).to_excel(xlsx, index=False)
+    monkeypatch.setattr(pd.DataFrame, "to_parquet", lambda self, p, index=False: pickle.dump(self, open(p, "wb")))
+    monkeypatch.setattr(pd, "read_parquet", lambda p: pickle.load(open(p, "rb")))
+    assert geo_search._read_table(xlsx)["省份"].tolist() == ["河南"]
+    sidecar = cache_dir / "water_info_x.parquet"
+    assert sidecar.exists()
+
+    pickle.dump(pd.DataFrame({"省份": ["来自旁路"]}), open(sidecar, "wb"))
+    assert geo_search._read_table(xlsx)["省份"].tolist() == ["来自旁路"]
+
+    os.utime(sidecar, (0, 0))  # 旁路文件比 xlsx 旧 -> 重新读 xlsx
+    assert geo_search._read_table(xlsx)["省份"].tolist() == ["河南"]
+
+
+@pytest.fixture
+def client(monkeypatch):
+    pytest.importorskip("flask")
+    pytest.importorskip("pandas")
+    results = [({"断面名称": "甲", "pH": float("nan"), "_address": "x"}, 1.23456), ({"断面名称": "乙"}, 2.0)]
+    monkeypatch.setattr(geo_search, "search_nearest", lambda place, top=10, scheme="amap": results[:top])
+    return geo_search.create_app().test_client()
+
+
+def test_api_nearest_json(client):
+    body = client.get("/nearest?place=郑州&top=5").get_json()
+    assert body["count"] == 2
+    assert body["results"][0] == {"断面名称": "甲", "pH": None, "_distance_km": 1.2346}
+    assert client.get("/nearest").status_code == 400
+
+
+def test_api_nearest_ndjson(client):
+    resp = client.get("/nearest?place=郑州&format=ndjson")
+    assert resp.mimetype == "application/x-ndjson"
+    lines = [json.loads(x) for x in resp.get_data(as_text=True).splitlines()]
+    assert lines[0] == {"place": "郑州", "count": 2}
+    assert [x["断面名称"] for x in lines[1:]] == ["甲", "乙"]
+
+
+def test_search_nearest_reuses_state_until_data_changes(cache_dir, monkeypatch):
+    import os
+
+    data = cache_dir / "water_info_a.xlsx"
+    data.write_bytes(b"v1")
+    loads = []
+
+    def fake_load():
+        loads.append(1)
+        return [{"_address": "A"}, {"_address": "B"}]
+
+    coords = {"Q": (30.0, 114.0), "A": (39.9, 116.4), "B": (30.5, 114.3)}
+    monkeypatch.setattr(geo_search, "_STATES", {})
+    monkeypatch.setattr(geo_search, "load_all_records", fake_load)
+    monkeypatch.setattr(geo_search, "geocode", lambda scheme, a, cache=None: coords.get(a))
+    first = geo_search.search_nearest("Q", top=1)
+    assert [r["_address"] for r, _ in first] == ["B"]
+    geo_search.search_nearest("Q", top=2)
+    assert len(loads) == 1
+    data.write_bytes(b"v2-changed")
+    os.utime(data, ns=(1, 1))
+    geo_search.search_nearest("Q", top=2)
+    assert len(loads) == 2
+
+
+@pytest.mark.parametrize("use_orjson", [True, False])
+def test_save_json_cache_round_trip(cache_dir, monkeypatch, use_orjson):
+    if use_orjson:
+        pytest.importorskip("orjson")
+    else:
+        monkeypatch.setattr(geo_search, "orjson", None)
+    geo_search.save_json_cache({"郑州": (34.7, 113.6)})
+    text = (cache_dir / "geo_cache.json").read_text(encoding="utf-8")
+    assert "郑州" in text
+    assert json.loads(text) == {"郑州": [34.7, 113.6]}
+
+
+def test_api_nearest_serializes_timestamps(monkeypatch):
+    pytest.importorskip("flask")
+    pd = pytest.importorskip("pandas")
+    results = [({"监测时间": pd.Timestamp("2024-01-02 08:00"), "断面名称": "甲"}, 1.0)]
+    monkeypatch.setattr(geo_search, "search_nearest", lambda place, top=10, scheme="amap": results)
+    body = geo_search.create_app().test_client().get("/nearest?place=x").get_json()
+    assert body["results"][0]["监测时间"] == "Tue, 02 Jan 2024 08:00:00 GMT"
+
+
+def test_nearest_bbox_prefilter_falls_back_when_box_is_sparse(monkeypatch):
+    pytest.importorskip("numpy")
+    coords = [(30.5, 114.3), (31.0, 114.0), (39.9, 116.4), (22.5, 114.1)]
+    state = geo_search._SearchState([{"i": i} for i in range(4)], coords)
+    state.tree = None  # 只测无 scipy 时的包围盒路径
+    monkeypatch.setattr(geo_search, "SEARCH_RADIUS_KM", 200.0)
+    near = geo_search._nearest(state, 30.0, 114.0, 2)
+    assert [r["i"] for r, _ in near] == [0, 1]
+    # 盒内只有 2 条，top=3 需退回全量
+    far = geo_search._nearest(state, 30.0, 114.0, 3)
+    assert [r["i"] for r, _ in far] == [0, 1, 3]
+    assert far[2][1] == pytest.approx(geo_search.haversine_km(30.0, 114.0, 22.5, 114.1))
+
+
+def test_nearest_kdtree_matches_brute_force():
+    np = pytest.importorskip("numpy")
+    pytest.importorskip("scipy")
+    rng = np.random.default_rng(0)
+    coords = list(zip(rng.uniform(18, 53, 500).tolist(), rng.uniform(73, 135, 500).tolist()))
+    state = geo_search._SearchState([{"i": i} for i in range(500)], coords)
+    assert state.tree is not None
+    got = geo_search._nearest(state, 34.7, 113.6, 8)
+    brute = sorted(range(500), key=lambda i: geo_search.haversine_km(34.7, 113.6, *coords[i]))[:8]
+    assert [r["i"] for r, _ in got] == brute
+    assert len(geo_search._nearest(state, 34.7, 113.6, 1000)) == 500
+
+
+def test_read_excel_prefers_calamine_and_falls_back(monkeypatch):
+    pytest.importorskip("pandas")
+    engines = []
+
+    def fake_read_excel(path, sheet_name=0, engine=None):
+        engines.append(engine)
+        if engine == "calamine":
+            raise ValueError("Unknown engine: calamine")
+        return "df"
+
+    monkeypatch.setattr(geo_search.pd, "read_excel", fake_read_excel)
+    monkeypatch.setattr(geo_search, "python_calamine", object())
+    assert geo_search._read_excel("x.xlsx") == "df"
+    assert engines == ["calamine", None]
+    engines.clear()
+    monkeypatch.setattr(geo_search, "python_calamine", None)
+    geo_search._read_excel("x.xlsx")
+    assert engines == [None]
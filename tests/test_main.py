@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+pytest.importorskip("xlsxwriter")
+pytest.importorskip("playwright")
+
+import config
+import main
+
+
+def test_prod_items_written_one_file_per_province(tmp_path, monkeypatch):
+    sheets = [
+        {"sheet_name": "水质实时数据", "rows": [["省份", "断面名称"], ["北京", "A"]], "province": "北京"},
+        {"sheet_name": "水质实时数据", "rows": [["省份", "断面名称"], ["天津", "B"]], "province": "天津"},
+        {"sheet_name": "水质实时数据", "rows": [], "province": "a/b"},
+    ]
+    monkeypatch.setattr(config, "OUTPUT_DIR", tmp_path)
+    monkeypatch.setattr(main, "run_crawl", lambda on_province=None: sheets)
+    assert main.main() == 0
+    assert sorted(p.name for p in tmp_path.glob("water_info_*.xlsx")) == [
+        "water_info_a_b.xlsx", "water_info_北京.xlsx", "water_info_天津.xlsx",
+    ]
+
+
+def test_no_data_returns_error(monkeypatch):
+    monkeypatch.setattr(main, "run_crawl", lambda on_province=None: [])
+    assert main.main() == 1
+
+
+def test_streaming_write_saves_during_crawl(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "OUTPUT_DIR", tmp_path)
+    monkeypatch.setattr(config, "RUN_MODE", "prod")
+    monkeypatch.setattr(config, "STREAMING_WRITE", True)
+
+    def fake_crawl(on_province=None):
+        assert on_province is not None
+        on_province({"sheet_name": "水质实时数据", "rows": [["省份"], ["北京"]], "province": "北京"})
+        return []
+
+    monkeypatch.setattr(main, "run_crawl", fake_crawl)
+    assert main.main() == 0
+    assert [p.name for p in tmp_path.glob("water_info_*.xlsx")] == ["water_info_北京.xlsx"]
+
+
+def test_output_format_both_dispatches(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "OUTPUT_DIR", tmp_path)
+    monkeypatch.setattr(config, "OUTPUT_FORMAT", "both")
+    written = []
+
+    def fake_parquet(sheets, output_path):
+        written.append(output_path.name)
+        return str(output_path)
+
+    monkeypatch.setattr(main, "to_parquet", fake_parquet)
+    saved = main._write_province({"rows": [["省份"], ["北京"]], "province": "北京"})
+    assert written == ["water_info_北京.parquet"]
+    assert (tmp_path / "water_info_北京.xlsx").exists()
+    assert saved.endswith("water_info_北京.parquet")
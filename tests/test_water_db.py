@@ -0,0 +1,349 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+
+import pytest
+
+import water_db
+
+
+def test_insert_records_batches_into_one_transaction(tmp_path):
+    conn = water_db.get_connection(tmp_path / "w.db")
+    records = [
+        {"省份": "河南", "断面名称": "A", "address": "河南A", "lat": 34.7, "lon": 113.6, "水温": 12.5},
+        {"province": "北京", "site_name": "B", "address": "北京B", "lat": None, "lon": None},
+    ]
+    statements = []
+    conn.set_trace_callback(statements.append)
+    assert water_db.insert_records(conn, records) == 2
+    conn.set_trace_callback(None)
+    assert sum(s.startswith("BEGIN") for s in statements) == 1
+    rows = conn.execute("SELECT province, site_name, address, lat, data_json FROM %s ORDER BY id" % water_db.TABLE_STAGING).fetchall()
+    assert [tuple(r)[:4] for r in rows] == [("河南", "A", "河南A", 34.7), ("北京", "B", "北京B", None)]
+    assert json.loads(rows[0]["data_json"])["水温"] == 12.5
+    conn.close()
+
+
+def test_get_connection_enables_wal_once(tmp_path, monkeypatch):
+    monkeypatch.setattr(water_db, "_WAL_DB_FILES", set())
+    path = tmp_path / "w.db"
+    conn = water_db.get_connection(path)
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1  # NORMAL
+    conn.close()
+    water_db.get_connection(path).close()
+    assert water_db._WAL_DB_FILES == {str(path.resolve())}
+
+
+def test_query_nearest_fallback_vectorized(tmp_path, monkeypatch):
+    import geo_search
+
+    path = tmp_path / "w.db"
+    conn = water_db.get_connection(path)
+    records = [
+        {"断面名称": name, "address": name, "lat": lat, "lon": lon}
+        for name, lat, lon in [("远", 40.0, 116.0), ("近", 34.8, 113.7), ("中", 35.5, 114.0), ("无坐标", None, None)]
+    ]
+    water_db.insert_records(conn, records, table_name=water_db.TABLE_CURRENT)
+    conn.close()
+    monkeypatch.setattr(geo_search, "load_json_cache", lambda: {})
+    monkeypatch.setattr(geo_search, "geocode", lambda scheme, place, cache=None: (34.75, 113.65))
+    got = water_db._query_nearest_fallback("郑州", k=2, db_path=path)
+    assert [rec["断面名称"] for rec, _ in got] == ["近", "中"]
+    assert got[0][1] == got[0][0]["_distance_km"] == round(geo_search.haversine_km(34.75, 113.65, 34.8, 113.7), 4)
+    monkeypatch.setattr(geo_search, "np", None)
+    assert water_db._query_nearest_fallback("郑州", k=2, db_path=path) == got
+
+
+def test_nearest_index_cached_until_db_changes(tmp_path, monkeypatch):
+    import pytest
+
+    cKDTree = pytest.importorskip("scipy.spatial").cKDTree
+    monkeypatch.setattr(water_db, "_TREE_CACHE", {})
+    path = tmp_path / "w.db"
+    conn = water_db.get_connection(path)
+    water_db.insert_records(conn, [{"address": "A", "lat": 34.0, "lon": 113.0}], table_name=water_db.TABLE_CURRENT)
+    conn.close()
+    builds = []
+
+    def counting_tree(points, **kwargs):
+        builds.append(len(points))
+        return cKDTree(points, **kwargs)
+
+    ids, _, tree = water_db._nearest_index(path, counting_tree)
+    assert water_db._nearest_index(path, counting_tree)[2] is tree
+    assert builds == [1]
+    conn = water_db.get_connection(path)
+    water_db.insert_records(conn, [{"address": "B", "lat": 35.0, "lon": 114.0}], table_name=water_db.TABLE_CURRENT)
+    conn.close()
+    ids, _, _ = water_db._nearest_index(path, counting_tree)
+    assert builds == [1, 2] and len(ids) == 2
+    # 全量更新：写 staging 后切换表
+    conn = water_db.get_connection(path)
+    water_db.insert_records(conn, [{"address": "C", "lat": 36.0, "lon": 115.0}])
+    water_db.swap_tables(conn)
+    conn.close()
+    ids, points, _ = water_db._nearest_index(path, counting_tree)
+    assert builds == [1, 2, 1] and points.tolist() == [[36.0, 115.0]]
+
+
+def test_swap_tables_writes_coords_sidecar(tmp_path, monkeypatch):
+    import pytest
+
+    np = pytest.importorskip("numpy")
+    monkeypatch.setattr(water_db, "_TREE_CACHE", {})
+    path = tmp_path / "w.db"
+    conn = water_db.get_connection(path)
+    water_db.insert_records(conn, [{"address": "A", "lat": 34.0, "lon": 113.0}, {"address": "无坐标"},
+                                   {"address": "B", "lat": 35.0, "lon": 114.0}])
+    water_db.swap_tables(conn)
+    conn.close()
+    sidecar = tmp_path / "w.coords.npy"
+    assert np.load(sidecar).tolist() == [[1.0, 34.0, 113.0], [3.0, 35.0, 114.0]]
+    conn = water_db.get_connection(path)
+    assert water_db._load_coords_sidecar(conn, path) is not None
+    # 切换后直接往当前表追加：旁路文件与表不一致，不再使用
+    water_db.insert_records(conn, [{"address": "C", "lat": 36.0, "lon": 115.0}], table_name=water_db.TABLE_CURRENT)
+    assert water_db._load_coords_sidecar(conn, path) is None
+    conn.close()
+    ids, points, _ = water_db._nearest_index(path, lambda pts, **kw: object())
+    assert ids.tolist() == [1, 3, 4] and points[-1].tolist() == [36.0, 115.0]
+
+
+def test_query_nearest_batch_single_tree_query(tmp_path, monkeypatch):
+    import pytest
+    import geo_search
+
+    pytest.importorskip("scipy")
+    monkeypatch.setattr(water_db, "_TREE_CACHE", {})
+    path = tmp_path / "w.db"
+    conn = water_db.get_connection(path)
+    records = [{"断面名称": n, "address": n, "lat": lat, "lon": lon}
+               for n, lat, lon in [("郑州站", 34.8, 113.7), ("北京站", 39.9, 116.4), ("上海站", 31.2, 121.5)]]
+    water_db.insert_records(conn, records, table_name=water_db.TABLE_CURRENT)
+    conn.close()
+    places = {"郑州": (34.75, 113.65), "北京": (39.95, 116.35)}
+    monkeypatch.setattr(geo_search, "load_json_cache", lambda: {})
+    monkeypatch.setattr(geo_search, "geocode", lambda scheme, place, cache=None: places.get(place))
+    got = water_db.query_nearest_batch(["郑州", "无解", "北京"], k=2, db_path=path)
+    assert [[rec["断面名称"] for rec, _ in r] for r in got] == [["郑州站", "北京站"], [], ["北京站", "郑州站"]]
+    assert water_db.query_nearest("北京", k=1, db_path=path) == got[2][:1]
+
+
+def test_load_records_from_excel_columnar(tmp_path, monkeypatch):
+    import pytest
+
+    pd = pytest.importorskip("pandas")
+    pytest.importorskip("openpyxl")
+    pd.DataFrame({"省份": ["河南", None, " 北京 "], "断面名称": ["A站", "B站", None], "水温": [1.5, 2.0, None]}).to_excel(
+        tmp_path / "water_info_x.xlsx", index=False)
+    (tmp_path / "water_info_bad.xlsx").write_text("not excel")
+    monkeypatch.setattr(water_db, "OUTPUT_DIR", tmp_path)
+    records = water_db.load_records_from_excel()
+    assert [r["address"] for r in records] == ["河南A站", "B站", "北京"]
+    assert {r["_source_file"] for r in records} == {"water_info_x.xlsx"}
+    assert records[0]["水温"] == 1.5
+
+
+def test_full_update_streams_files_into_staging(tmp_path, monkeypatch):
+    import geo_search
+
+    path = tmp_path / "w.db"
+    monkeypatch.setattr(water_db, "DB_PATH", path)
+    conn = water_db.get_connection(path)
+    water_db.insert_records(conn, [{"address": "上次中断"}])  # 遗留的 staging 表
+    conn.close()
+    batches = [[{"省份": "河南", "address": "河南A"}], [], [{"省份": "北京", "address": "北京B"}]]
+    seen = []
+
+    def fake_iter():
+        for b in batches:
+            seen.append(len(b))
+            yield b
+
+    def fake_geocode(records, scheme="amap", cache=None):
+        for r in records:
+            r["lat"], r["lon"] = 1.0, 2.0
+        return records
+
+    monkeypatch.setattr(water_db, "iter_records_from_excel", fake_iter)
+    monkeypatch.setattr(water_db, "geocode_records", fake_geocode)
+    monkeypatch.setattr(geo_search, "load_json_cache", lambda: {})
+    water_db.full_update(skip_crawl=True)
+    conn = water_db.get_connection(path)
+    rows = conn.execute("SELECT address FROM %s ORDER BY id" % water_db.TABLE_CURRENT).fetchall()
+    assert [r[0] for r in rows] == ["河南A", "北京B"]
+    assert conn.execute("SELECT name FROM sqlite_master WHERE name=?", (water_db.TABLE_STAGING,)).fetchone() is None
+    conn.close()
+    assert seen == [1, 0, 1]
+
+
+def test_geocode_records_requests_each_unique_address_once(monkeypatch):
+    import geo_search
+
+    calls = []
+
+    def fake_geocode(scheme, address, cache=None):
+        calls.append(address)
+        return None if address == "未知" else (float(len(address)), 1.0)
+
+    saved = []
+    monkeypatch.setattr(geo_search, "geocode", fake_geocode)
+    monkeypatch.setattr(geo_search, "save_json_cache", lambda c: saved.append(dict(c)))
+    cache = {"已缓存": (9.0, 9.0)}
+    records = [{"address": "河南A"}, {"address": " 河南A "}, {"address": "已缓存"}, {"address": "未知"}, {"address": ""}]
+    water_db.geocode_records(records, scheme="amap", cache=cache)
+    assert sorted(calls) == ["未知", "河南A"]
+    assert [(r["lat"], r["lon"]) for r in records] == [
+        (3.0, 1.0), (3.0, 1.0), (9.0, 9.0), (None, None), (None, None)]
+    assert len(saved) == 1 and "河南A" in saved[0] and "未知" not in saved[0]
+
+
+def test_bbox_rows_prefilters_and_expands(tmp_path):
+    path = tmp_path / "w.db"
+    conn = water_db.get_connection(path)
+    records = [{"address": n, "lat": lat, "lon": lon}
+               for n, lat, lon in [("近", 34.8, 113.7), ("中", 36.0, 115.5), ("远", 45.0, 126.0), ("无坐标", None, None)]]
+    water_db.insert_records(conn, records, table_name=water_db.TABLE_CURRENT)
+    names = lambda rows: sorted(json.loads(r[3])["address"] for r in rows)
+    assert names(water_db._bbox_rows(conn, 34.75, 113.65, 1)) == ["近"]
+    # 1° 框内不足 2 条，扩大后包含「中」
+    assert names(water_db._bbox_rows(conn, 34.75, 113.65, 2)) == ["中", "近"]
+    # 框内条数够但第 k 近可能在框外时继续扩大，最终退回全表
+    assert names(water_db._bbox_rows(conn, 34.75, 113.65, 3)) == ["中", "近", "远"]
+    conn.close()
+
+
+@pytest.mark.parametrize("use_orjson", [True, False])
+def test_row_to_json_single_pass(use_orjson, monkeypatch):
+    if not use_orjson:
+        monkeypatch.setattr(water_db, "orjson", None)
+    elif water_db.orjson is None:
+        pytest.skip("orjson 未安装")
+    import datetime
+
+    pd = pytest.importorskip("pandas")
+    row = {"省份": "河南", "水温": float("nan"), "时间": pd.NaT, "日期": datetime.date(2024, 1, 2),
+           "采样": pd.Timestamp("2024-01-02 08:00"), "pH": 7.5, "_source_file": "x.xlsx"}
+    s = water_db._row_to_json(row)
+    assert s == '{"省份":"河南","水温":null,"时间":null,"日期":"2024-01-02","采样":"2024-01-02 08:00:00","pH":7.5}'
+    assert water_db._json_to_record(s)["省份"] == "河南"
+    assert water_db._json_to_record("not json") == {}
+
+
+def test_reading_reuses_shared_connection_until_file_replaced(tmp_path):
+    path = tmp_path / "w.db"
+    with water_db._reading(path) as conn:
+        water_db.create_table(conn, water_db.TABLE_CURRENT)
+    with water_db._reading(path) as again:
+        assert again is conn
+    # 整个库文件被替换（新 inode）时重新打开
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    other = tmp_path / "other.db"
+    water_db.get_connection(other).close()
+    os.replace(other, path)
+    with water_db._reading(path) as fresh:
+        assert fresh is not conn
+        assert fresh.execute("SELECT name FROM sqlite_master WHERE name=?", (water_db.TABLE_CURRENT,)).fetchone() is None
+
+
+def test_query_nearest_batch_geocodes_each_place_once(tmp_path, monkeypatch):
+    import geo_search
+
+    calls = []
+    monkeypatch.setattr(geo_search, "load_json_cache", lambda: {})
+    monkeypatch.setattr(geo_search, "geocode", lambda scheme, place, cache=None: calls.append(place))
+    got = water_db.query_nearest_batch(["无解", " 无解 ", "别处", "无解"], db_path=tmp_path / "w.db")
+    assert got == [[], [], [], []]
+    assert calls == ["无解", "别处"]
+
+
+def test_fetch_coords_contiguous_array(tmp_path):
+    np = pytest.importorskip("numpy")
+    conn = water_db.get_connection(tmp_path / "w.db")
+    water_db.create_table(conn, water_db.TABLE_CURRENT)
+    assert water_db._fetch_coords(conn).shape == (0, 3)
+    water_db.insert_records(conn, [{"lat": 34.0, "lon": 113.0}, {"lat": None}, {"lat": 35.5, "lon": 114.5}],
+                            table_name=water_db.TABLE_CURRENT)
+    arr = water_db._fetch_coords(conn)
+    assert arr.dtype == np.float64 and arr.flags.c_contiguous
+    assert arr.tolist() == [[1.0, 34.0, 113.0], [3.0, 35.5, 114.5]]
+    conn.close()
+
+
+def test_query_nearest_batch_uses_great_circle_neighbours(tmp_path, monkeypatch):
+    import geo_search
+
+    pytest.importorskip("scipy")
+    monkeypatch.setattr(water_db, "_TREE_CACHE", {})
+    path = tmp_path / "w.db"
+    conn = water_db.get_connection(path)
+    # 60°N 处经度 10° 约 556 km，纬度 5.5° 约 612 km：按度数欧氏距离会选错
+    records = [{"断面名称": n, "lat": lat, "lon": lon} for n, lat, lon in [("东", 60.0, 10.0), ("北", 65.5, 0.0)]]
+    water_db.insert_records(conn, records, table_name=water_db.TABLE_CURRENT)
+    conn.close()
+    monkeypatch.setattr(geo_search, "load_json_cache", lambda: {})
+    monkeypatch.setattr(geo_search, "geocode", lambda scheme, place, cache=None: (60.0, 0.0))
+    got = water_db.query_nearest("q", k=2, db_path=path)
+    assert [rec["断面名称"] for rec, _ in got] == ["东", "北"]
+    assert got[0][1] == pytest.approx(geo_search.haversine_km(60.0, 0.0, 60.0, 10.0), abs=1e-3)
+
+
+def test_swap_tables_single_transaction_and_rollback(tmp_path):
+    import sqlite3
+
+    conn = water_db.get_connection(tmp_path / "w.db")
+    water_db.insert_records(conn, [{"address": "旧"}], table_name=water_db.TABLE_CURRENT)
+    # staging 表不存在：改名失败，DROP 一并回滚，旧表仍在
+    with pytest.raises(sqlite3.OperationalError):
+        water_db.swap_tables(conn)
+    assert conn.execute("SELECT address FROM %s" % water_db.TABLE_CURRENT).fetchone()[0] == "旧"
+    water_db.insert_records(conn, [{"address": "新"}])
+    statements = []
+    conn.set_trace_callback(statements.append)
+    water_db.swap_tables(conn)
+    conn.set_trace_callback(None)
+    assert statements[:4] == ["BEGIN IMMEDIATE", "DROP TABLE IF EXISTS %s" % water_db.TABLE_CURRENT,
+                              "ALTER TABLE %s RENAME TO %s" % (water_db.TABLE_STAGING, water_db.TABLE_CURRENT), "COMMIT"]
+    assert conn.execute("SELECT address FROM %s" % water_db.TABLE_CURRENT).fetchone()[0] == "新"
+    conn.close()
+
+
+def test_iter_records_from_excel_parallel_keeps_file_order(tmp_path, monkeypatch):
+    pd = pytest.importorskip("pandas")
+    pytest.importorskip("openpyxl")
+    for name in ("c", "a", "b"):
+        pd.DataFrame({"省份": [name], "断面名称": ["站"]}).to_excel(tmp_path / f"water_info_{name}.xlsx", index=False)
+    (tmp_path / "water_info_bad.xlsx").write_text("not excel")
+    monkeypatch.setattr(water_db, "OUTPUT_DIR", tmp_path)
+    batches = list(water_db.iter_records_from_excel())
+    assert [[r["address"] for r in b] for b in batches] == [["a站"], ["b站"], ["c站"]]
+
+
+def test_query_nearest_batch_reads_one_snapshot_across_swap(tmp_path, monkeypatch):
+    import geo_search
+
+    pytest.importorskip("scipy")
+    monkeypatch.setattr(water_db, "_TREE_CACHE", {})
+    path = tmp_path / "w.db"
+    conn = water_db.get_connection(path)
+    water_db.insert_records(conn, [{"断面名称": "旧站", "lat": 34.8, "lon": 113.7}], table_name=water_db.TABLE_CURRENT)
+    conn.close()
+    monkeypatch.setattr(geo_search, "load_json_cache", lambda: {})
+    monkeypatch.setattr(geo_search, "geocode", lambda scheme, place, cache=None: (34.75, 113.65))
+    index_for = water_db._index_for
+
+    def swap_after_index(conn, p, kdtree_cls):
+        got = index_for(conn, p, kdtree_cls)
+        # 建树之后、取 data_json 之前另一连接完成全量更新：新表 id 同样从 1 开始
+        writer = water_db.get_connection(p)
+        water_db.insert_records(writer, [{"断面名称": "新站", "lat": 40.0, "lon": 116.0}])
+        water_db.swap_tables(writer)
+        writer.close()
+        return got
+
+    monkeypatch.setattr(water_db, "_index_for", swap_after_index)
+    got = water_db.query_nearest("郑州", k=1, db_path=path)
+    assert [rec["断面名称"] for rec, _ in got] == ["旧站"]
+    monkeypatch.setattr(water_db, "_index_for", index_for)
+    assert [rec["断面名称"] for rec, _ in water_db.query_nearest("郑州", k=1, db_path=path)] == ["新站"]